@@ -0,0 +1,293 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# OpenAI互換のChat Completions APIのモック（ベンチマーク用）
+# 応答までの遅延・同時実行数や1分あたりのリクエスト数の上限（超えたら429）を設定できる
+
+class MockSettings:
+    def __init__(self, latency: float = 0.3, jitter: float = 0.05, token_latency: float = 0.0,
+                 response_tokens: int = 50, max_concurrency: int = 0, rpm: int = 0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.token_latency = token_latency
+        self.response_tokens = response_tokens
+        self.max_concurrency = max_concurrency
+        self.rpm = rpm
+        self.seed = seed
+
+class MockState:
+    def __init__(self, settings: MockSettings):
+        self.settings = settings
+        self.random = random.Random(settings.seed)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+        self.requests = 0
+        self.rate_limited = 0
+        self.model_requests = 0
+        self.window = []
+
+    def admit(self):
+        # 受け付けられる場合はNone、制限に当たった場合は再試行までの秒数を返す
+        now = time.monotonic()
+        with self.lock:
+            self.requests += 1
+            self.window = [started for started in self.window if now - started < 60]
+            if self.settings.max_concurrency and self.active >= self.settings.max_concurrency:
+                self.rate_limited += 1
+                return 0.1
+            if self.settings.rpm and len(self.window) >= self.settings.rpm:
+                self.rate_limited += 1
+                return 60 - (now - self.window[0])
+            self.window.append(now)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            return None
+
+    def finish(self):
+        with self.lock:
+            self.active -= 1
+
+    def delay(self) -> float:
+        with self.lock:
+            jitter = self.random.uniform(-self.settings.jitter, self.settings.jitter)
+        return max(0.0, self.settings.latency + jitter)
+
+    def headers(self) -> dict:
+        with self.lock:
+            remaining = self.settings.rpm - len(self.window) if self.settings.rpm else 10000
+        return {
+            'x-ratelimit-limit-requests': str(self.settings.rpm or 10000),
+            'x-ratelimit-remaining-requests': str(max(0, remaining)),
+            'x-ratelimit-reset-requests': '1s'
+        }
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'rate_limited': self.rate_limited,
+                'peak_concurrency': self.peak,
+                'active': self.active,
+                'model_requests': self.model_requests
+            }
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.rate_limited = 0
+            self.model_requests = 0
+            self.peak = self.active
+            self.window = []
+
+def _prompt_text(messages: list) -> str:
+    content = messages[-1]['content']
+    if isinstance(content, str):
+        return content
+    return ''.join(part.get('text', '') for part in content)
+
+def _image_count(messages: list) -> int:
+    content = messages[-1]['content']
+    if isinstance(content, str):
+        return 0
+    return sum(1 for part in content if part.get('type') == 'image_url')
+
+def mock_content(body: dict, settings: MockSettings) -> str:
+    # アプリが期待する形式（JSONでの一括応答など）に合わせたダミーの応答
+    messages = body['messages']
+    prompt = _prompt_text(messages)
+    text = ' '.join(['mock'] * settings.response_tokens)
+    if '"results"' in prompt:
+        return json.dumps({'results': [f'{text} {index}' for index in range(_image_count(messages))]})
+    if '"segments"' in prompt:
+        segments = json.loads(prompt[prompt.rindex('{"segments"'):])['segments']
+        return json.dumps({'translations': [f'mock:{segment}' for segment in segments]}, ensure_ascii=False)
+    if (body.get('response_format') or {}).get('type') == 'json_object':
+        return json.dumps({'ocr': text, 'summary': text, 'translation': text})
+    return text
+
+def create_handler(state: MockState):
+    class MockHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            if self.path.startswith('/stats'):
+                self._send_json(200, state.stats())
+            elif self.path.endswith('/models'):
+                # 常駐モードの接続維持（トークンを消費しない一覧の取得）
+                with state.lock:
+                    state.model_requests += 1
+                self._send_json(200, {
+                    'object': 'list',
+                    'data': [{'id': 'mock', 'object': 'model', 'created': 0, 'owned_by': 'mock'}]
+                })
+            else:
+                self._send_json(404, {'error': {'message': 'not found'}})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if self.path.startswith('/reset'):
+                state.reset()
+                self._send_json(200, state.stats())
+                return
+            if not self.path.endswith('/chat/completions'):
+                self._send_json(404, {'error': {'message': 'not found'}})
+                return
+
+            retry_after = state.admit()
+            if retry_after is not None:
+                self._send_json(429, {
+                    'error': {'message': 'Rate limit reached', 'type': 'requests', 'code': 'rate_limit_exceeded'}
+                }, {'retry-after-ms': str(int(retry_after * 1000)), **state.headers()})
+                return
+
+            try:
+                content = mock_content(body, state.settings)
+                time.sleep(state.delay())
+                if body.get('stream'):
+                    self._stream(body, content)
+                else:
+                    self._send_json(200, {
+                        'id': 'chatcmpl-mock',
+                        'object': 'chat.completion',
+                        'created': int(time.time()),
+                        'model': body.get('model', 'mock'),
+                        'choices': [{
+                            'index': 0,
+                            'message': {'role': 'assistant', 'content': content},
+                            'finish_reason': 'stop'
+                        }],
+                        'usage': self._usage(body, content)
+                    }, state.headers())
+            finally:
+                state.finish()
+
+        def _usage(self, body: dict, content: str) -> dict:
+            prompt_tokens = len(_prompt_text(body['messages'])) // 4 + 765 * _image_count(body['messages'])
+            completion_tokens = max(1, len(content) // 4)
+            return {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens
+            }
+
+        def _stream(self, body: dict, content: str):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            for name, value in state.headers().items():
+                self.send_header(name, value)
+            self.end_headers()
+            words = content.split(' ')
+            for index, word in enumerate(words):
+                delta = word if index == 0 else ' ' + word
+                self._write_event({
+                    'id': 'chatcmpl-mock',
+                    'object': 'chat.completion.chunk',
+                    'created': int(time.time()),
+                    'model': body.get('model', 'mock'),
+                    'choices': [{'index': 0, 'delta': {'content': delta}, 'finish_reason': None}]
+                })
+                if state.settings.token_latency:
+                    time.sleep(state.settings.token_latency)
+            if (body.get('stream_options') or {}).get('include_usage'):
+                self._write_event({
+                    'id': 'chatcmpl-mock',
+                    'object': 'chat.completion.chunk',
+                    'created': int(time.time()),
+                    'model': body.get('model', 'mock'),
+                    'choices': [],
+                    'usage': self._usage(body, content)
+                })
+            self._write_chunk(b'data: [DONE]\n\n')
+            self._write_chunk(b'')
+
+        def _write_event(self, data: dict):
+            self._write_chunk(f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8'))
+
+        def _write_chunk(self, data: bytes):
+            self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b'\r\n')
+            self.wfile.flush()
+
+        def _send_json(self, status: int, data: dict, headers: dict = None):
+            payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return MockHandler
+
+class MockServer:
+    # ベンチマークから同じプロセス内で起動・停止できるようにする
+    def __init__(self, settings: MockSettings = None, host: str = '127.0.0.1', port: int = 0):
+        self.state = MockState(settings or MockSettings())
+        self.server = ThreadingHTTPServer((host, port), create_handler(self.state))
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> 'MockServer':
+        self._thread = threading.Thread(target=self.server.serve_forever, name='mock-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="OpenAI互換APIのモックサーバー（ベンチマーク用）")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.3, help="応答までの遅延（秒）")
+    parser.add_argument('--jitter', type=float, default=0.05, help="遅延のばらつき（±秒）")
+    parser.add_argument('--token-latency', type=float, default=0.0, help="ストリーミング時の1トークンごとの遅延（秒）")
+    parser.add_argument('--response-tokens', type=int, default=50, help="応答の単語数")
+    parser.add_argument('--max-concurrency', type=int, default=0, help="同時に処理するリクエスト数の上限（超えたら429、0で無制限）")
+    parser.add_argument('--rpm', type=int, default=0, help="1分あたりのリクエスト数の上限（超えたら429、0で無制限）")
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    settings = MockSettings(
+        latency=args.latency,
+        jitter=args.jitter,
+        token_latency=args.token_latency,
+        response_tokens=args.response_tokens,
+        max_concurrency=args.max_concurrency,
+        rpm=args.rpm,
+        seed=args.seed
+    )
+    server = MockServer(settings, args.host, args.port)
+    print(f"Mock server listening on {server.base_url}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+import argparse
+import asyncio
+import importlib.metadata
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをPythonパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+sys.path.append(str(Path(__file__).parent))
+
+from PIL import Image, ImageDraw
+from mock_server import MockServer, MockSettings
+from src.utils.image_encoding import EncodingProfile, encode_image, estimate_image_tokens
+from src.utils.tracing import tracer
+
+SUITES = ('capture', 'encode', 'services')
+RESOLUTIONS = ((1280, 720), (1920, 1080), (2560, 1440), (3840, 2160))
+FORMATS = ('PNG', 'JPEG', 'WEBP', 'AUTO')
+SERVICE_TASKS = ('ocr', 'vision', 'translate', 'pipeline')
+PACKAGES = ('pillow', 'numpy', 'openai', 'httpx', 'mss')
+
+# ベンチマーク中はキャッシュなどで結果が変わらないよう、環境変数で設定を上書きする
+SERVICE_ENV = {
+    'CACHE_ENABLED': 'false',
+    'TRANSLATION_MEMORY_ENABLED': 'false',
+    'OCR_ENGINE': 'remote',
+    'HTTP2': 'false',
+    'TRACING_ENABLED': 'true',
+    'TRACE_LOG': '',
+    'METRICS_PORT': '0'
+}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="キャプチャ・画像エンコード・API呼び出しのベンチマークを実行し、結果をJSONで出力します")
+    parser.add_argument('--suite', action='append', choices=SUITES, help="実行するベンチマーク（複数指定可、既定: すべて）")
+    parser.add_argument('--output', help="出力先のJSONファイル（既定: benchmarks/results/<日時>.json）")
+    parser.add_argument('--baseline', help="比較対象の結果JSON（指標ごとの変化率を表示）")
+    parser.add_argument('--seed', type=int, default=0, help="合成画像・遅延のばらつきの乱数シード")
+    parser.add_argument('--repeat', type=int, default=5, help="キャプチャ・エンコードの計測回数")
+    parser.add_argument('--capture-backend', action='append', choices=('mss', 'pil'), help="計測するキャプチャ方式（既定: mss, pil）")
+    parser.add_argument('--task', action='append', choices=SERVICE_TASKS, help="計測するサービス（既定: すべて）")
+    parser.add_argument('--requests', type=int, default=32, help="サービスごとのリクエスト数")
+    parser.add_argument('--concurrency', default='1,4,16', help="同時実行数（カンマ区切り）")
+    parser.add_argument('--latency', type=float, default=0.2, help="モックサーバーの応答遅延（秒）")
+    parser.add_argument('--jitter', type=float, default=0.02, help="モックサーバーの遅延のばらつき（±秒）")
+    parser.add_argument('--token-latency', type=float, default=0.0, help="ストリーミング時の1トークンごとの遅延（秒）")
+    parser.add_argument('--response-tokens', type=int, default=50, help="モックサーバーの応答の単語数")
+    parser.add_argument('--mock-max-concurrency', type=int, default=0, help="モックサーバーの同時実行数の上限（超えたら429、0で無制限）")
+    parser.add_argument('--mock-rpm', type=int, default=0, help="モックサーバーの1分あたりのリクエスト数の上限（0で無制限）")
+    parser.add_argument('--stream', action='store_true', help="ストリーミングで呼び出し、最初のトークンまでの時間も計測する")
+    return parser.parse_args(argv)
+
+# 合成画像（シード固定で毎回同じものを生成する）
+def screen_image(width: int, height: int, seed: int) -> Image.Image:
+    # 白地に文字が並ぶ画面を模した画像
+    rng = random.Random(seed)
+    image = Image.new('RGB', (width, height), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, width, 32), fill=(240, 240, 240))
+    words = ['Vision', 'Assist', 'capture', 'text', 'summary', 'translate', 'window', 'screen', 'benchmark']
+    for y in range(48, height - 16, 18):
+        x = 16 + rng.randrange(0, 48)
+        line = ' '.join(rng.choice(words) for _ in range(rng.randrange(4, 14)))
+        draw.text((x, y), line, fill=(rng.randrange(0, 64),) * 3)
+    return image
+
+def photo_image(width: int, height: int, seed: int) -> Image.Image:
+    # 色が滑らかに変化し、ノイズを含む写真を模した画像
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    channels = []
+    for _ in range(3):
+        fx, fy, phase = rng.uniform(1, 6, 3)
+        channel = 127 + 100 * np.sin(x / width * fx * np.pi + phase) * np.cos(y / height * fy * np.pi)
+        channels.append(channel + rng.normal(0, 12, (height, width)))
+    pixels = np.clip(np.stack(channels, axis=-1), 0, 255).astype(np.uint8)
+    return Image.fromarray(pixels, 'RGB')
+
+IMAGE_KINDS = {'screen': screen_image, 'photo': photo_image}
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(fraction * (len(values) - 1)))))
+    return values[index]
+
+def timing_metrics(seconds: list) -> dict:
+    milliseconds = [value * 1000 for value in seconds]
+    return {
+        'mean_ms': round(statistics.mean(milliseconds), 3),
+        'p50_ms': round(percentile(milliseconds, 0.5), 3),
+        'p95_ms': round(percentile(milliseconds, 0.95), 3),
+        'max_ms': round(max(milliseconds), 3)
+    }
+
+def bench_capture(args) -> list:
+    from src.services.capture_service import CaptureService
+    results = []
+    for backend in args.capture_backend or ['mss', 'pil']:
+        service = CaptureService(backend)
+        try:
+            monitors = service.get_monitors()
+            monitor = monitors[0]
+            full = (monitor.x, monitor.y, monitor.x + monitor.width, monitor.y + monitor.height)
+        except Exception as e:
+            results.append({'id': f'capture/{backend}', 'error': f"モニター情報を取得できません: {e}"})
+            continue
+        regions = {'full': full, 'region_800x600': (full[0], full[1], full[0] + min(800, monitor.width), full[1] + min(600, monitor.height))}
+        for name, bbox in regions.items():
+            result = {'id': f'capture/{backend}/{name}', 'backend': backend, 'bbox': list(bbox)}
+            try:
+                service.grab(bbox)
+                seconds = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    service.grab(bbox)
+                    seconds.append(time.perf_counter() - started)
+                metrics = timing_metrics(seconds)
+                metrics['fps'] = round(len(seconds) / sum(seconds), 2)
+                # 実際に使われた方式（mssが使えない環境ではPILに切り替わる）
+                result['actual_backend'] = service.backend.name
+                result['metrics'] = metrics
+            except Exception as e:
+                result['error'] = str(e)
+            results.append(result)
+        service.close()
+    return results
+
+def bench_encode(args) -> list:
+    results = []
+    for kind, factory in IMAGE_KINDS.items():
+        for width, height in RESOLUTIONS:
+            source = factory(width, height, args.seed)
+            for image_format in FORMATS:
+                profile = EncodingProfile(image_format, max_dimension=2048, quality=85)
+                seconds = []
+                for _ in range(args.repeat):
+                    # 同じ画像はエンコード結果がキャッシュされるため毎回コピーを渡す
+                    image = source.copy()
+                    started = time.perf_counter()
+                    encoded = encode_image(image, profile)
+                    seconds.append(time.perf_counter() - started)
+                metrics = timing_metrics(seconds)
+                metrics.update({
+                    'bytes': len(encoded.data),
+                    'data_url_bytes': len(encoded.data_url),
+                    'image_tokens': estimate_image_tokens(encoded.width, encoded.height)
+                })
+                results.append({
+                    'id': f'encode/{kind}/{width}x{height}/{image_format}',
+                    'kind': kind,
+                    'source_size': [width, height],
+                    'format': encoded.format,
+                    'encoded_size': [encoded.width, encoded.height],
+                    'metrics': metrics
+                })
+    return results
+
+def service_input(task: str, index: int, args):
+    # リクエストの同一性による合流・キャッシュが効かないよう、毎回異なる入力を使う
+    if task == 'vision':
+        return photo_image(640, 480, args.seed + index)
+    if task == 'translate':
+        return f"Benchmark request {index}. The quick brown fox jumps over the lazy dog."
+    return screen_image(1280, 720, args.seed + index)
+
+def service_call(services, task: str, item, on_delta=None):
+    if task == 'ocr':
+        return services.ocr.aperform_ocr(item, 'ja', on_delta=on_delta)
+    if task == 'vision':
+        return services.vision.aanalyze_image(item, on_delta=on_delta)
+    if task == 'translate':
+        return services.translation.atranslate_text(item, 'ja', on_delta=on_delta)
+    return services.pipeline.aanalyze_all(item, 'ja')
+
+async def run_service_scenario(services, task: str, concurrency: int, args) -> dict:
+    # 入力の生成時間を含めないよう、先にすべて作っておく
+    items = [service_input(task, index, args) for index in range(args.requests)]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    first_tokens = []
+    errors = []
+
+    async def one(item):
+        async with semaphore:
+            started = time.perf_counter()
+            first_token = []
+
+            def on_delta(_):
+                if not first_token:
+                    first_token.append(time.perf_counter() - started)
+
+            try:
+                await service_call(services, task, item, on_delta if args.stream else None)
+            except Exception as e:
+                errors.append(str(e))
+                return
+            latencies.append(time.perf_counter() - started)
+            first_tokens.extend(first_token)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(item) for item in items))
+    elapsed = time.perf_counter() - started
+    metrics = timing_metrics(latencies) if latencies else {}
+    metrics.update({
+        'throughput_rps': round(len(latencies) / elapsed, 3),
+        'elapsed_s': round(elapsed, 3),
+        'ok': len(latencies),
+        'errors': len(errors)
+    })
+    if first_tokens:
+        metrics['ttft_p50_ms'] = round(percentile(first_tokens, 0.5) * 1000, 3)
+    return {'metrics': metrics, 'error_samples': errors[:3]}
+
+def bench_services(args) -> list:
+    settings = MockSettings(
+        latency=args.latency,
+        jitter=args.jitter,
+        token_latency=args.token_latency,
+        response_tokens=args.response_tokens,
+        max_concurrency=args.mock_max_concurrency,
+        rpm=args.mock_rpm,
+        seed=args.seed
+    )
+    results = []
+    with MockServer(settings) as server, tempfile.TemporaryDirectory() as save_directory:
+        os.environ.update(SERVICE_ENV)
+        os.environ['OPENAI_BASE_URL'] = server.base_url
+        os.environ['SAVE_DIRECTORY'] = save_directory
+        os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+        from src.services.factory import ServiceContainer
+        from src.services.rate_limit import governor_for
+        from src.utils.config import load_config
+
+        for task in args.task or SERVICE_TASKS:
+            for concurrency in [int(value) for value in args.concurrency.split(',')]:
+                # 流量制御の学習状態を持ち越さないよう、組み合わせごとにクライアントを作り直す
+                config = load_config()
+                tracer.configure(config)
+                tracer.stats = {}
+                server.state.reset()
+                services = ServiceContainer(config)
+
+                async def scenario():
+                    try:
+                        return await run_service_scenario(services, task, concurrency, args)
+                    finally:
+                        await services.aclose()
+
+                result = asyncio.run(scenario())
+                services.close()
+                governor = governor_for(services.async_client)
+                result.update({
+                    'id': f'services/{task}/c{concurrency}',
+                    'task': task,
+                    'concurrency': concurrency,
+                    'server': server.state.stats(),
+                    'governor': governor.stats() if governor is not None else None,
+                    'stages': tracer.summary()
+                })
+                results.append(result)
+                print(f"{result['id']}: {result['metrics']}")
+    return results
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=project_root, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment() -> dict:
+    packages = {}
+    for name in PACKAGES:
+        try:
+            packages[name] = importlib.metadata.version(name)
+        except importlib.metadata.PackageNotFoundError:
+            packages[name] = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'git_commit': git_commit(),
+        'packages': packages
+    }
+
+def compare(report: dict, baseline: dict):
+    # 同じidの結果どうしで数値の指標を比較する（ms・bytesは小さいほど、rps・fpsは大きいほど良い）
+    previous = {
+        result['id']: result.get('metrics', {})
+        for results in baseline.get('results', {}).values()
+        for result in results
+    }
+    for results in report['results'].values():
+        for result in results:
+            old = previous.get(result['id'])
+            if not old:
+                continue
+            changes = []
+            for name, value in result.get('metrics', {}).items():
+                before = old.get(name)
+                if isinstance(value, (int, float)) and isinstance(before, (int, float)) and before:
+                    changes.append(f"{name} {(value - before) / before * 100:+.1f}%")
+            if changes:
+                print(f"{result['id']}: {', '.join(changes)}")
+
+def main(argv=None):
+    args = parse_args(argv)
+    random.seed(args.seed)
+    suites = {
+        'capture': bench_capture,
+        'encode': bench_encode,
+        'services': bench_services
+    }
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': environment(),
+        'settings': vars(args),
+        'results': {}
+    }
+    for name in args.suite or SUITES:
+        print(f"Running {name} benchmark...")
+        try:
+            report['results'][name] = suites[name](args)
+        except Exception as e:
+            print(f"Error in {name} benchmark: {e}")
+            report['results'][name] = [{'id': name, 'error': str(e)}]
+    tracer.close()
+
+    output = args.output or str(Path(__file__).parent / 'results' / f"{datetime.now():%Y%m%d_%H%M%S}.json")
+    directory = os.path.dirname(output)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Saved benchmark report to {output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+if __name__ == "__main__":
+    main()
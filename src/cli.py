@@ -0,0 +1,224 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+# プロジェクトのルートディレクトリをPythonパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from PIL import Image
+from src.services.factory import ServiceContainer
+from src.utils.config import load_config
+from src.utils.tracing import tracer
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.gif', '.webp', '.tif', '.tiff'}
+TASKS = ('ocr', 'vision', 'summary', 'translate', 'all')
+# 複数の画像を1回のリクエストにまとめられる処理
+BATCH_TASKS = ('ocr', 'translate')
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="画像をまとめてOCR・解析し、結果をJSONLで出力します")
+    parser.add_argument('inputs', nargs='+', help="画像ファイル・ディレクトリ・globパターン（'-'で標準入力からパスを読み込む）")
+    parser.add_argument('--task', choices=TASKS, default='ocr', help="実行する処理（既定: ocr）")
+    parser.add_argument('--lang', default='ja', help="OCRの抽出言語（既定: ja）")
+    parser.add_argument('--concurrency', type=int, default=4, help="同時に処理する画像数（既定: 4）")
+    parser.add_argument('--batch-size', type=int, help="ocr・translateで1回のリクエストにまとめる画像数（既定: BATCH_SIZE）")
+    parser.add_argument('--output', help="出力先のJSONLファイル（既定: SAVE_DIRECTORY/batch_<task>.jsonl）")
+    parser.add_argument('--recursive', action='store_true', help="ディレクトリを再帰的に探索する")
+    parser.add_argument('--no-resume', action='store_true', help="出力ファイルにある処理済みの画像も再処理する")
+    return parser.parse_args(argv)
+
+def is_image(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+
+def expand_input(pattern: str, recursive: bool):
+    if os.path.isdir(pattern):
+        walker = Path(pattern).rglob('*') if recursive else Path(pattern).iterdir()
+        for path in sorted(walker):
+            if path.is_file() and is_image(str(path)):
+                yield str(path)
+    elif os.path.isfile(pattern):
+        yield pattern
+    else:
+        for path in sorted(glob.glob(pattern, recursive=recursive)):
+            if os.path.isfile(path) and is_image(path):
+                yield path
+
+async def iter_paths(inputs, recursive: bool):
+    for pattern in inputs:
+        if pattern == '-':
+            # 標準入力からパスを1行ずつ読み込む（別プロセスからのストリームにも対応）
+            while True:
+                line = await asyncio.to_thread(sys.stdin.readline)
+                if not line:
+                    break
+                line = line.strip()
+                if line:
+                    for path in expand_input(line, recursive):
+                        yield path
+        else:
+            for path in expand_input(pattern, recursive):
+                yield path
+
+def load_completed(output_path: str, task: str) -> set:
+    # 前回の出力から成功済みの画像を読み込み、再開時にスキップする
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('task') == task and 'error' not in record:
+                completed.add(record['path'])
+    return completed
+
+def end_last_line(output_path: str):
+    # 前回の実行が行の途中で止まっていた場合、追記する最初の結果がその行につながらないよう改行を補う
+    if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        return
+    with open(output_path, 'rb+') as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b'\n':
+            f.write(b'\n')
+
+def load_image(path: str) -> Image.Image:
+    with Image.open(path) as image:
+        image.load()
+        return image.convert('RGB')
+
+async def run_task(services: ServiceContainer, task: str, image: Image.Image, lang: str) -> dict:
+    if task == 'ocr':
+        return {'ocr': await services.ocr.aperform_ocr(image, lang)}
+    if task == 'vision':
+        return {'vision': await services.vision.aanalyze_image(image)}
+    if task == 'summary':
+        return {'summary': await services.summary.asummarize_image(image)}
+    if task == 'translate':
+        text = await services.ocr.aperform_ocr(image, lang)
+        translation = await services.translation.atranslate_text(text) if text else ''
+        return {'ocr': text, 'translation': translation}
+    return await services.pipeline.aanalyze_all(image, lang)
+
+async def run_batch_task(services: ServiceContainer, task: str, images: list, lang: str) -> list:
+    texts = await services.ocr.aperform_ocr_batch(images, lang)
+    if task == 'ocr':
+        return [{'ocr': text} for text in texts]
+    targets = [text for text in texts if text]
+    translations = iter(await services.translation.atranslate_batch(targets)) if targets else iter(())
+    return [{'ocr': text, 'translation': next(translations) if text else ''} for text in texts]
+
+async def process_paths(services, args, paths: list) -> list:
+    if len(paths) == 1:
+        return [await process_path(services, args, paths[0])]
+    
+    started = time.perf_counter()
+    records = [{'path': path, 'task': args.task} for path in paths]
+    images = []
+    for record in records:
+        try:
+            images.append(await asyncio.to_thread(load_image, record['path']))
+        except Exception as e:
+            record['error'] = str(e)
+    
+    loaded = [record for record in records if 'error' not in record]
+    if loaded:
+        try:
+            for record, result in zip(loaded, await run_batch_task(services, args.task, images, args.lang)):
+                record.update(result)
+        except Exception as e:
+            for record in loaded:
+                record['error'] = str(e)
+    
+    # まとめて処理した場合の所要時間はバッチ全体の値
+    elapsed = round(time.perf_counter() - started, 3)
+    timestamp = datetime.now().isoformat(timespec='seconds')
+    for record in records:
+        record['elapsed'] = elapsed
+        record['timestamp'] = timestamp
+    return records
+
+async def process_path(services, args, path: str) -> dict:
+    started = time.perf_counter()
+    record = {'path': path, 'task': args.task}
+    try:
+        image = await asyncio.to_thread(load_image, path)
+        record.update(await run_task(services, args.task, image, args.lang))
+    except Exception as e:
+        record['error'] = str(e)
+    record['elapsed'] = round(time.perf_counter() - started, 3)
+    record['timestamp'] = datetime.now().isoformat(timespec='seconds')
+    return record
+
+async def run_batch(args) -> int:
+    config = load_config()
+    tracer.configure(config)
+    services = ServiceContainer(config)
+    output_path = args.output or os.path.join(config.save_directory, f'batch_{args.task}.jsonl')
+    completed = set() if args.no_resume else load_completed(output_path, args.task)
+
+    batch_size = max(1, args.batch_size or config.batch_size) if args.task in BATCH_TASKS else 1
+    semaphore = asyncio.Semaphore(max(1, args.concurrency))
+    pending = set()
+    counts = {'done': 0, 'skipped': 0, 'failed': 0}
+
+    end_last_line(output_path)
+    with open(output_path, 'a', encoding='utf-8') as output:
+        async def worker(paths):
+            try:
+                for record in await process_paths(services, args, paths):
+                    # 1件ごとに書き出すので途中で止めても処理済みの結果は残る
+                    output.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    output.flush()
+                    if 'error' in record:
+                        counts['failed'] += 1
+                        print(f"Error processing {record['path']}: {record['error']}", file=sys.stderr)
+                    else:
+                        counts['done'] += 1
+            finally:
+                semaphore.release()
+
+        async def dispatch(paths):
+            # 同時実行数を超える場合は空きが出るまで次の画像を読み込まない
+            await semaphore.acquire()
+            task = asyncio.create_task(worker(paths))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+
+        batch = []
+        async for path in iter_paths(args.inputs, args.recursive):
+            path = os.path.abspath(path)
+            if path in completed:
+                counts['skipped'] += 1
+                continue
+            completed.add(path)
+            batch.append(path)
+            if len(batch) >= batch_size:
+                await dispatch(batch)
+                batch = []
+        if batch:
+            await dispatch(batch)
+
+        if pending:
+            await asyncio.gather(*pending)
+
+    await services.aclose()
+    services.close()
+    tracer.close()
+    print(f"完了: {counts['done']}件 / スキップ: {counts['skipped']}件 / 失敗: {counts['failed']}件 -> {output_path}", file=sys.stderr)
+    return 1 if counts['failed'] else 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    sys.exit(asyncio.run(run_batch(args)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import importlib.util
+import threading
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+from PyQt6.QtGui import QAction
+from PyQt6.QtNetwork import QLocalServer, QLocalSocket
+from PyQt6.QtWidgets import QApplication, QMenu, QStyle, QSystemTrayIcon
+
+# ローカルソケット・ホットキー・トレイから受け付けるコマンド
+COMMANDS = ('capture-area', 'capture-full', 'capture-last', 'capture-scroll', 'show', 'quit')
+
+class CaptureDaemon(QObject):
+    # 常駐してAPIクライアント・キャプチャ方式・モニター構成を準備済みに保ち、
+    # トレイ・ローカルソケット・グローバルホットキーからのコマンドでキャプチャする
+    command_received = pyqtSignal(str)
+
+    def __init__(self, config, window, parent=None):
+        super().__init__(parent)
+        self.config = config
+        self.window = window
+        self.server = None
+        self.tray = None
+        self.hotkeys = None
+        self.keepalive_timer = None
+        self.command_received.connect(self.dispatch)
+
+    def start(self) -> bool:
+        if not self._listen():
+            return False
+        QApplication.instance().setQuitOnLastWindowClosed(False)
+        self.window.resident = True
+        self._setup_tray()
+        self._start_hotkeys()
+        if self.config.daemon_keepalive_interval > 0:
+            self.keepalive_timer = QTimer(self)
+            self.keepalive_timer.timeout.connect(self._keep_alive)
+            self.keepalive_timer.start(int(self.config.daemon_keepalive_interval * 1000))
+        return True
+
+    def _listen(self) -> bool:
+        name = self.config.daemon_socket_name
+        if send_command(name, 'ping', quiet=True) == 0:
+            print(f"Daemon is already running on {name}")
+            return False
+        # 前回異常終了した場合に残ったソケットを削除してから待ち受ける
+        QLocalServer.removeServer(name)
+        self.server = QLocalServer(self)
+        if not self.server.listen(name):
+            print(f"Error starting daemon server: {self.server.errorString()}")
+            return False
+        self.server.newConnection.connect(self._accept)
+        return True
+
+    def _accept(self):
+        while self.server.hasPendingConnections():
+            connection = self.server.nextPendingConnection()
+            connection.readyRead.connect(lambda connection=connection: self._read(connection))
+            connection.disconnected.connect(connection.deleteLater)
+
+    def _read(self, connection):
+        # 1回の接続で1行のコマンドを受け付ける
+        if not connection.canReadLine():
+            return
+        command = bytes(connection.readLine()).decode('utf-8').strip()
+        if command == 'ping':
+            reply = 'ok'
+        elif command in COMMANDS:
+            reply = 'ok'
+            # 応答を先に返し、キャプチャはイベントループに戻ってから始める
+            QTimer.singleShot(0, lambda: self.dispatch(command))
+        else:
+            reply = f'error: unknown command {command}'
+        connection.write(f'{reply}\n'.encode('utf-8'))
+        connection.flush()
+        connection.disconnectFromServer()
+
+    def dispatch(self, command):
+        # 常駐プロセスが落ちないよう、キャプチャの失敗はここで受け止める
+        try:
+            self._run(command)
+        except Exception as e:
+            print(f"Error running daemon command {command}: {e}")
+            self.window.show()
+
+    def _run(self, command):
+        if command == 'capture-area':
+            self.window.capture_area()
+        elif command == 'capture-full':
+            self.window.capture_full_screen()
+        elif command == 'capture-last':
+            self.window.capture_last_region()
+        elif command == 'capture-scroll':
+            # 1回目で開始し、2回目で終了してOCR
+            self.window.toggle_scroll_capture()
+        elif command == 'show':
+            self.window.show()
+            self.window.raise_()
+            self.window.activateWindow()
+        elif command == 'quit':
+            self.quit()
+
+    def _setup_tray(self):
+        if not QSystemTrayIcon.isSystemTrayAvailable():
+            print("System tray is not available; use hotkeys or the local socket to send commands")
+            return
+        icon = QApplication.style().standardIcon(QStyle.StandardPixmap.SP_ComputerIcon)
+        self.tray = QSystemTrayIcon(icon, self)
+        self.tray.setToolTip("VisionAssist Pro")
+        menu = QMenu()
+        for label, command in (
+            ("エリア選択", 'capture-area'),
+            ("フルスクリーン", 'capture-full'),
+            ("前回の範囲", 'capture-last'),
+            ("スクロールキャプチャ開始・終了", 'capture-scroll'),
+            ("ウィンドウを表示", 'show'),
+            ("終了", 'quit')
+        ):
+            action = QAction(label, menu)
+            action.triggered.connect(lambda checked=False, command=command: self.dispatch(command))
+            menu.addAction(action)
+        self.tray_menu = menu
+        self.tray.setContextMenu(menu)
+        self.tray.activated.connect(self._on_tray_activated)
+        self.tray.show()
+
+    def _on_tray_activated(self, reason):
+        if reason == QSystemTrayIcon.ActivationReason.Trigger:
+            self.dispatch('capture-area')
+
+    def _start_hotkeys(self):
+        # グローバルホットキーはpynputがある場合のみ（コールバックは別スレッドなのでシグナル経由で渡す）
+        if not self.config.daemon_hotkeys:
+            return
+        if importlib.util.find_spec('pynput') is None:
+            print("pynput is not installed; global hotkeys are disabled")
+            return
+        from pynput import keyboard
+        bindings = {
+            hotkey: (lambda command=command: self.command_received.emit(command))
+            for hotkey, command in self.config.daemon_hotkeys.items()
+            if command in COMMANDS
+        }
+        try:
+            self.hotkeys = keyboard.GlobalHotKeys(bindings)
+            self.hotkeys.start()
+        except Exception as e:
+            print(f"Error registering global hotkeys: {e}")
+            self.hotkeys = None
+
+    def _keep_alive(self):
+        # 待機中に接続プールの接続が切れないよう、トークンを消費しないリクエストを送る
+        if self.window._services is None:
+            return
+        threading.Thread(target=self._ping_api, name='keep-alive', daemon=True).start()
+
+    def _ping_api(self):
+        try:
+            self.window.services.client.models.list()
+        except Exception as e:
+            print(f"Error keeping API connection alive: {e}")
+
+    def quit(self):
+        if self.hotkeys is not None:
+            self.hotkeys.stop()
+        if self.tray is not None:
+            self.tray.hide()
+        if self.server is not None:
+            self.server.close()
+        self.window.resident = False
+        self.window.close()
+        QApplication.instance().quit()
+
+def send_command(name: str, command: str, timeout_ms: int = 1000, quiet: bool = False) -> int:
+    # 常駐中のプロセスにコマンドを送る（終了コード: 0=成功）
+    socket = QLocalSocket()
+    socket.connectToServer(name)
+    if not socket.waitForConnected(timeout_ms):
+        if not quiet:
+            print(f"Daemon is not running: {socket.errorString()}")
+        return 1
+    socket.write(f'{command}\n'.encode('utf-8'))
+    socket.flush()
+    if not socket.waitForReadyRead(timeout_ms):
+        if not quiet:
+            print("No response from daemon")
+        return 1
+    reply = bytes(socket.readLine()).decode('utf-8').strip()
+    socket.disconnectFromServer()
+    if not quiet:
+        print(reply)
+    return 0 if reply == 'ok' else 1
@@ -0,0 +1,140 @@
+from datetime import datetime
+from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QComboBox,
+                            QListWidget, QListWidgetItem, QLabel, QPushButton, QSplitter)
+from PyQt6.QtGui import QPixmap
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal
+from .widgets import ResultTextEdit
+
+KIND_LABELS = {'ocr': 'OCR', 'vision': '画像解説', 'all': '一括'}
+FIELD_LABELS = (('ocr', 'OCR結果'), ('summary', '要約結果'), ('translation', '翻訳結果'), ('vision', '画像解説'))
+
+class HistoryPanel(QWidget):
+    # 保存済みのキャプチャ結果を検索・閲覧し、ダブルクリック（または読み込みボタン）で結果タブに戻す
+    entry_activated = pyqtSignal(object)
+    page_size = 200
+
+    def __init__(self, store_provider, parent=None):
+        super().__init__(parent)
+        self.store_provider = store_provider
+        self.offset = 0
+        self.exhausted = False
+        self.changed = True
+
+        layout = QVBoxLayout(self)
+        search_row = QHBoxLayout()
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("履歴を検索（空白で区切ると、すべての語を含むものを表示）")
+        self.search_box.setClearButtonEnabled(True)
+        self.kind_filter = QComboBox()
+        self.kind_filter.addItem("すべて", None)
+        for kind, label in KIND_LABELS.items():
+            self.kind_filter.addItem(label, kind)
+        search_row.addWidget(self.search_box)
+        search_row.addWidget(self.kind_filter)
+        layout.addLayout(search_row)
+
+        splitter = QSplitter(Qt.Orientation.Horizontal)
+        self.entry_list = QListWidget()
+        detail = QWidget()
+        detail_layout = QVBoxLayout(detail)
+        detail_layout.setContentsMargins(0, 0, 0, 0)
+        self.thumbnail = QLabel()
+        self.thumbnail.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.detail_text = ResultTextEdit()
+        self.detail_text.setReadOnly(True)
+        self.restore_button = QPushButton("結果タブに読み込む")
+        self.restore_button.setEnabled(False)
+        detail_layout.addWidget(self.thumbnail)
+        detail_layout.addWidget(self.detail_text)
+        detail_layout.addWidget(self.restore_button)
+        splitter.addWidget(self.entry_list)
+        splitter.addWidget(detail)
+        splitter.setSizes([300, 500])
+        layout.addWidget(splitter)
+
+        self.count_label = QLabel()
+        layout.addWidget(self.count_label)
+
+        # 入力のたびに検索しないよう、入力が止まってから検索する
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(200)
+        self.search_timer.timeout.connect(self.refresh)
+        self.search_box.textChanged.connect(self.search_timer.start)
+        self.kind_filter.currentIndexChanged.connect(self.refresh)
+        self.entry_list.currentItemChanged.connect(self._show_entry)
+        self.entry_list.itemDoubleClicked.connect(lambda item: self.entry_activated.emit(item.data(Qt.ItemDataRole.UserRole)))
+        self.entry_list.verticalScrollBar().valueChanged.connect(self._on_scroll)
+        self.restore_button.clicked.connect(self._restore_current)
+
+    def mark_changed(self):
+        # 履歴が書き込まれた（表示中なら一覧を更新し、非表示なら次に表示した時に更新する）
+        self.changed = True
+        if self.isVisible() and not self.search_timer.isActive():
+            self.search_timer.start()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.changed:
+            self.refresh()
+
+    def refresh(self):
+        self.changed = False
+        self.offset = 0
+        self.exhausted = False
+        self.entry_list.clear()
+        self._load_page()
+
+    def _on_scroll(self, value):
+        # 末尾までスクロールしたら続きを読み込む
+        if value == self.entry_list.verticalScrollBar().maximum() and not self.exhausted:
+            self._load_page()
+
+    def _load_page(self):
+        store = self.store_provider()
+        if store is None:
+            return
+        try:
+            entries = store.search(
+                self.search_box.text(), kind=self.kind_filter.currentData(),
+                limit=self.page_size, offset=self.offset
+            )
+        except Exception as e:
+            print(f"Error searching history: {e}")
+            entries = []
+        self.offset += len(entries)
+        self.exhausted = len(entries) < self.page_size
+        for entry in entries:
+            timestamp = datetime.fromtimestamp(entry.created_at).strftime('%Y-%m-%d %H:%M')
+            item = QListWidgetItem(f"{timestamp}  [{KIND_LABELS.get(entry.kind, entry.kind)}]  {entry.preview[:80]}")
+            item.setData(Qt.ItemDataRole.UserRole, entry)
+            self.entry_list.addItem(item)
+        suffix = '' if self.exhausted else '以上'
+        self.count_label.setText(f"{self.entry_list.count()}件{suffix}")
+
+    def _show_entry(self, item, previous=None):
+        entry = item.data(Qt.ItemDataRole.UserRole) if item is not None else None
+        self.restore_button.setEnabled(entry is not None)
+        if entry is None:
+            self.thumbnail.clear()
+            self.detail_text.clear()
+            return
+
+        pixmap = QPixmap(entry.thumbnail) if entry.thumbnail else QPixmap()
+        if pixmap.isNull():
+            self.thumbnail.clear()
+        else:
+            self.thumbnail.setPixmap(pixmap)
+
+        sections = [f"{datetime.fromtimestamp(entry.created_at):%Y-%m-%d %H:%M:%S}  {entry.model or ''}"]
+        if entry.timings:
+            sections[0] += '  ' + ' / '.join(f"{stage} {value:.0f}ms" for stage, value in entry.timings.items())
+        for field, label in FIELD_LABELS:
+            if entry.texts[field]:
+                sections.append(f"■ {label}\n{entry.texts[field]}")
+        self.detail_text.setText('\n\n'.join(sections))
+
+    def _restore_current(self):
+        item = self.entry_list.currentItem()
+        if item is not None:
+            self.entry_activated.emit(item.data(Qt.ItemDataRole.UserRole))
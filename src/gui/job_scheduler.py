@@ -0,0 +1,185 @@
+import itertools
+import queue
+import threading
+import time
+from PyQt6.QtCore import QObject, pyqtSignal
+from ..services.completion import RequestCancelled, cancellation
+
+# 数値が小さいほど優先（キャプチャ直後の処理 > ユーザー操作 > バックグラウンド処理）
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 10
+PRIORITY_BACKGROUND = 20
+
+class JobCancelled(RequestCancelled):
+    pass
+
+class Job:
+    def __init__(self, job_id, func, args, priority, key, stream, update_interval,
+                 on_finished=None, on_partial=None, on_failed=None):
+        self.id = job_id
+        self.func = func
+        self.args = args
+        self.priority = priority
+        self.key = key
+        self.stream = stream
+        self.update_interval = update_interval
+        self.on_finished = on_finished
+        self.on_partial = on_partial
+        self.on_failed = on_failed
+        self._cancelled = threading.Event()
+        self.started = False
+        self._pending = []
+        self._last_emit = 0.0
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+class JobScheduler(QObject):
+    # ワーカースレッドから発行し、メインスレッドのスロットで各ジョブのコールバックへ振り分ける
+    job_partial = pyqtSignal(int, str)
+    job_finished = pyqtSignal(int, object)
+    job_failed = pyqtSignal(int, str)
+
+    def __init__(self, max_workers=2, update_interval=0.05, parent=None):
+        super().__init__(parent)
+        self.update_interval = update_interval
+        self._queue = queue.PriorityQueue()
+        self._ids = itertools.count(1)
+        self._sequence = itertools.count()
+        self._jobs = {}
+        self._keys = {}
+        self._lock = threading.Lock()
+
+        self.job_partial.connect(self._dispatch_partial)
+        self.job_finished.connect(self._dispatch_finished)
+        self.job_failed.connect(self._dispatch_failed)
+
+        self._workers = []
+        for i in range(max_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, func, *args, priority=PRIORITY_NORMAL, key=None, stream=False,
+               on_finished=None, on_partial=None, on_failed=None) -> int:
+        job = Job(next(self._ids), func, args, priority, key, stream, self.update_interval,
+                  on_finished, on_partial, on_failed)
+        with self._lock:
+            # 同じキーの古いジョブは新しいジョブで置き換える（未実行なら実行せず、実行中なら結果を捨てる）
+            if key is not None:
+                superseded = self._keys.get(key)
+                if superseded is not None:
+                    superseded.cancel()
+                self._keys[key] = job
+            self._jobs[job.id] = job
+        self._queue.put((priority, next(self._sequence), job))
+        return job.id
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            job.cancel()
+
+    def cancel_key(self, key):
+        with self._lock:
+            job = self._keys.get(key)
+        if job is not None:
+            job.cancel()
+
+    def is_started(self, job_id) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job is not None and job.started
+
+    def is_active(self, job_id) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job is not None and not job.cancelled
+
+    def shutdown(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancel()
+        for _ in self._workers:
+            self._queue.put((float('inf'), next(self._sequence), None))
+
+    def _worker_loop(self):
+        while True:
+            _, _, job = self._queue.get()
+            if job is None:
+                return
+            if job.cancelled:
+                self._forget(job)
+                continue
+            job.started = True
+            try:
+                # ストリーミングしないジョブも、APIを呼ぶ前（処理の段階の間・再試行の前）に取り消しを確かめる
+                with cancellation(lambda job=job: job.cancelled):
+                    if job.stream:
+                        result = job.func(*job.args, on_delta=lambda text, job=job: self._on_delta(job, text))
+                        self._flush_partial(job)
+                    else:
+                        result = job.func(*job.args)
+                if not job.cancelled:
+                    self.job_finished.emit(job.id, result)
+                else:
+                    self._forget(job)
+            except RequestCancelled:
+                self._forget(job)
+            except Exception as e:
+                print(f"Error in job {job.id}: {e}")
+                if not job.cancelled:
+                    self.job_failed.emit(job.id, str(e))
+                else:
+                    self._forget(job)
+
+    def _on_delta(self, job, text):
+        # キャンセル済みならストリームを打ち切る
+        if job.cancelled:
+            raise JobCancelled()
+        # トークンごとに通知するとUIスレッドが溢れるため、一定間隔でまとめて送る
+        job._pending.append(text)
+        if time.monotonic() - job._last_emit >= job.update_interval:
+            self._flush_partial(job)
+
+    def _flush_partial(self, job):
+        if job._pending and not job.cancelled:
+            self.job_partial.emit(job.id, ''.join(job._pending))
+        job._pending = []
+        job._last_emit = time.monotonic()
+
+    def _forget(self, job):
+        with self._lock:
+            self._jobs.pop(job.id, None)
+            if job.key is not None and self._keys.get(job.key) is job:
+                del self._keys[job.key]
+
+    def _dispatch_partial(self, job_id, text):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None and not job.cancelled and job.on_partial is not None:
+            job.on_partial(text)
+
+    def _dispatch_finished(self, job_id, result):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return
+        self._forget(job)
+        if not job.cancelled and job.on_finished is not None:
+            job.on_finished(result)
+
+    def _dispatch_failed(self, job_id, message):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return
+        self._forget(job)
+        if not job.cancelled and job.on_failed is not None:
+            job.on_failed(message)
@@ -1,32 +1,18 @@
+import os
+import threading
+import time
 from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QToolBar, 
                             QStatusBar, QMenuBar, QMenu, QMessageBox, QTabWidget,
-                            QApplication, QComboBox, QHBoxLayout, QLabel)
-from PyQt6.QtGui import QAction, QIcon, QPainter, QPen, QColor, QPainterPath
-from PyQt6.QtCore import Qt, QTimer, QRect, QRectF, QThread, pyqtSignal
+                            QApplication, QComboBox, QHBoxLayout, QLabel, QDialog)
+from PyQt6.QtGui import QAction, QIcon, QPainter, QPen, QColor, QPainterPath, QGuiApplication
+from PyQt6.QtCore import Qt, QTimer, QRect, QRectF, pyqtSignal
 from .capture_overlay import CaptureOverlay
 from src.gui.widgets import ResultTextEdit
+from .history_panel import HistoryPanel
+from .job_scheduler import JobScheduler, PRIORITY_INTERACTIVE, PRIORITY_NORMAL
 from ..services.capture_service import CaptureService
-from ..services.ocr_service import OCRService
-from ..services.translation_service import TranslationService
-from ..services.summary_service import SummaryService
-from ..services.vision_service import VisionService
-
-class ProcessingThread(QThread):
-    finished = pyqtSignal(str)
-    
-    def __init__(self, service_method, *args):
-        super().__init__()
-        self.service_method = service_method
-        self.args = args
-    
-    def run(self):
-        try:
-            result = self.service_method(*self.args)
-            self.finished.emit(result)
-        except Exception as e:
-            print(f"Error in thread: {e}")
-        finally:
-            self.quit()
+from ..utils.startup_timer import startup_timer
+from ..utils.tracing import tracer, traced
 
 class LoadingOverlay(QWidget):
     def __init__(self, parent=None):
@@ -48,21 +34,146 @@ class LoadingOverlay(QWidget):
         self.label.setText("処理中" + "." * self.dots)
 
 class EnhancedOCRTool(QMainWindow):
+    # ウォッチ中のバックグラウンドスレッドからの変化通知をメインスレッドに渡す
+    watch_changed = pyqtSignal(object, float)
+    # 履歴の書き込みスレッドからの通知
+    history_changed = pyqtSignal()
+    # スクロールキャプチャのスレッドからの進捗（つなげた高さ, 上限に達したか）
+    scroll_progress = pyqtSignal(int, bool)
+    
     def __init__(self, config):
         super().__init__()
         self.config = config
+        tracer.configure(config)
         self.setWindowTitle("VisionAssist Pro")
         self.setGeometry(100, 100, 800, 600)
         
-        # サービスの初期化
-        self.ocr_service = OCRService(config)
-        self.translation_service = TranslationService(config)
-        self.summary_service = SummaryService(config)
-        self.capture_service = CaptureService()
-        self.vision_service = VisionService(config)
+        # サービス（openai・PIL・numpyなど重いモジュールを読み込む）は初回利用時かウィンドウ表示後に初期化する
+        self._services = None
+        self._frame_deduplicator = None
+        self._history_store = None
+        self._services_lock = threading.Lock()
+        self._deduplicator_lock = threading.Lock()
+        self._history_lock = threading.Lock()
+        state_path = os.path.join(config.save_directory, 'capture_state.json') if config.remember_monitor else None
+        self.capture_service = CaptureService(config.capture_backend, state_path)
+        self._watch_screens()
+        self.current_frame = None
+        self.area_purpose = 'capture'
+        self.region_watcher = None
+        self.watch_last_text = ''
+        self.watch_changed.connect(self._handle_watch_change)
+        self.scroll_capture = None
+        self.scroll_progress.connect(self._handle_scroll_progress)
+        self.current_history_id = None
+        self.frozen_frame = None
+        self.frozen_pixmap = None
+        self.overlay_ratio = 1.0
+        self._hidden_callback = None
+        # 常駐モードでは閉じてもアプリを終了せず、ウィンドウを隠すだけにする
+        self.resident = False
+        
+        # API呼び出しは上限付きのワーカープールで実行する
+        self.job_scheduler = JobScheduler(
+            max_workers=config.job_workers,
+            update_interval=config.stream_update_interval_ms / 1000,
+            parent=self
+        )
+        self.active_jobs = set()
+        self.prefetcher = None
+        if config.prefetch_enabled:
+            from .prefetch import ResultPrefetcher
+            self.prefetcher = ResultPrefetcher.from_config(config, self.job_scheduler)
         
         self.setup_ui()
         
+    @property
+    def services(self):
+        # APIクライアントと結果キャッシュは全サービスで共有
+        with self._services_lock:
+            if self._services is None:
+                with startup_timer.phase("create services"):
+                    from ..services.factory import ServiceContainer
+                    self._services = ServiceContainer(self.config)
+            return self._services
+    
+    @property
+    def result_cache(self):
+        return self.services.cache
+    
+    @property
+    def ocr_service(self):
+        return self.services.ocr
+    
+    @property
+    def translation_service(self):
+        return self.services.translation
+    
+    @property
+    def summary_service(self):
+        return self.services.summary
+    
+    @property
+    def vision_service(self):
+        return self.services.vision
+    
+    @property
+    def pipeline_service(self):
+        return self.services.pipeline
+    
+    @property
+    def frame_deduplicator(self):
+        if not self.config.dedup_enabled:
+            return None
+        with self._deduplicator_lock:
+            if self._frame_deduplicator is None:
+                with startup_timer.phase("create frame deduplicator"):
+                    from ..utils.frame_diff import FrameDeduplicator
+                    self._frame_deduplicator = FrameDeduplicator.from_config(self.config)
+            return self._frame_deduplicator
+    
+    @property
+    def history_store(self):
+        if not self.config.history_enabled:
+            return None
+        with self._history_lock:
+            if self._history_store is None:
+                from ..utils.history_store import HistoryStore
+                self._history_store = HistoryStore.from_config(self.config, on_change=self.history_changed.emit)
+            return self._history_store
+    
+    def _watch_screens(self):
+        # 画面の追加・削除・解像度変更があったらモニター構成のキャッシュを破棄する
+        app = QGuiApplication.instance()
+        if app is None:
+            return
+        app.screenAdded.connect(self._on_screen_added)
+        app.screenRemoved.connect(lambda screen: self.capture_service.invalidate_monitors())
+        for screen in app.screens():
+            self._on_screen_added(screen, invalidate=False)
+    
+    def _on_screen_added(self, screen, invalidate=True):
+        screen.geometryChanged.connect(lambda geometry: self.capture_service.invalidate_monitors())
+        if invalidate:
+            self.capture_service.invalidate_monitors()
+    
+    def start_warm_up(self):
+        # ウィンドウ表示後、最初のキャプチャまでにバックグラウンドでサービスを準備しておく
+        if not self.config.warm_up_services:
+            startup_timer.print_report()
+            return
+        threading.Thread(target=self._warm_up, name="warm-up", daemon=True).start()
+    
+    def _warm_up(self):
+        try:
+            self.services
+            self.frame_deduplicator
+            with startup_timer.phase("import capture backend"):
+                self.capture_service.warm_up()
+        except Exception as e:
+            print(f"Error warming up services: {e}")
+        startup_timer.print_report()
+        
     def setup_ui(self):
         self.setup_menubar()
         self.setup_toolbar()
@@ -92,6 +203,39 @@ class EnhancedOCRTool(QMainWindow):
         area_capture_action.triggered.connect(self.capture_area)
         capture_menu.addAction(area_capture_action)
         
+        last_capture_action = QAction("前回の範囲", self)
+        last_capture_action.setShortcut("Ctrl+R")
+        last_capture_action.triggered.connect(self.capture_last_region)
+        capture_menu.addAction(last_capture_action)
+        
+        reselect_monitor_action = QAction("モニターを選び直す", self)
+        reselect_monitor_action.triggered.connect(self.capture_service.forget_monitor)
+        capture_menu.addAction(reselect_monitor_action)
+        
+        capture_menu.addSeparator()
+        
+        watch_start_action = QAction("ウォッチ開始（範囲を監視してOCR）", self)
+        watch_start_action.setShortcut("Ctrl+W")
+        watch_start_action.triggered.connect(self.start_watch)
+        capture_menu.addAction(watch_start_action)
+        
+        watch_stop_action = QAction("ウォッチ停止", self)
+        watch_stop_action.setShortcut("Ctrl+Shift+W")
+        watch_stop_action.triggered.connect(self.stop_watch)
+        capture_menu.addAction(watch_stop_action)
+        
+        capture_menu.addSeparator()
+        
+        scroll_start_action = QAction("スクロールキャプチャ開始", self)
+        scroll_start_action.setShortcut("Ctrl+L")
+        scroll_start_action.triggered.connect(self.start_scroll_capture)
+        capture_menu.addAction(scroll_start_action)
+        
+        scroll_stop_action = QAction("スクロールキャプチャ終了（つなげた画像を処理）", self)
+        scroll_stop_action.setShortcut("Ctrl+Shift+L")
+        scroll_stop_action.triggered.connect(self.stop_scroll_capture)
+        capture_menu.addAction(scroll_stop_action)
+        
         # モードメニュー
         mode_menu = menubar.addMenu("モード")
         ocr_mode_action = QAction("OCRモード", self)
@@ -102,6 +246,10 @@ class EnhancedOCRTool(QMainWindow):
         vision_mode_action.triggered.connect(lambda: self.mode_selector.setCurrentText("画像説モード"))
         mode_menu.addAction(vision_mode_action)
         
+        all_mode_action = QAction("一括モード（OCR・要約・翻訳）", self)
+        all_mode_action.triggered.connect(lambda: self.mode_selector.setCurrentText("一括モード"))
+        mode_menu.addAction(all_mode_action)
+        
         # 処理メニュー
         process_menu = menubar.addMenu("処理")
         
@@ -126,7 +274,7 @@ class EnhancedOCRTool(QMainWindow):
         
         # モード選択用コンボボックス
         self.mode_selector = QComboBox()
-        self.mode_selector.addItems(["OCRモード", "画像解説モード"])
+        self.mode_selector.addItems(["OCRモード", "画像解説モード", "一括モード"])
         self.mode_selector.currentTextChanged.connect(self.on_mode_changed)
         toolbar.addWidget(self.mode_selector)
         
@@ -155,7 +303,7 @@ class EnhancedOCRTool(QMainWindow):
         for action in actions[4:]:  # モード選択、セパレータ、キャプチャーボタンを除く
             toolbar.removeAction(action)
         
-        if mode == "OCRモード":
+        if mode in ("OCRモード", "一括モード"):
             for action in self.ocr_actions:
                 toolbar.addAction(action)
             self.tab_widget.setCurrentWidget(self.ocr_result)
@@ -171,39 +319,94 @@ class EnhancedOCRTool(QMainWindow):
         self.summary_result = ResultTextEdit()
         self.translation_result = ResultTextEdit()
         self.vision_result = ResultTextEdit()
+        self.watch_log = ResultTextEdit()
+        self.watch_log.setReadOnly(True)
         
         self.tab_widget.addTab(self.ocr_result, "OCR結果")
         self.tab_widget.addTab(self.summary_result, "要約結果")
         self.tab_widget.addTab(self.translation_result, "翻訳結果")
         self.tab_widget.addTab(self.vision_result, "画像解説")
+        self.tab_widget.addTab(self.watch_log, "ウォッチログ")
+        
+        if self.config.history_enabled:
+            self.history_panel = HistoryPanel(lambda: self.history_store)
+            self.history_panel.entry_activated.connect(self._restore_history_entry)
+            self.history_changed.connect(self.history_panel.mark_changed)
+            self.tab_widget.addTab(self.history_panel, "履歴")
+        
+    def _when_hidden(self, callback):
+        # ウィンドウを隠し、hideEventを受け取ってから実行する（呼び出し側で先にhide()しないこと）
+        # 合成マネージャーが画面からウィンドウや閉じたばかりのダイアログを消すまでの時間はCAPTURE_HIDE_DELAY_MSで待つ
+        self._hidden_callback = callback
+        if self.isVisible():
+            self.hide()
+        else:
+            self._schedule_hidden_callback()
+        
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        if self._hidden_callback is not None:
+            self._schedule_hidden_callback()
+        
+    def _schedule_hidden_callback(self):
+        QTimer.singleShot(self.config.capture_hide_delay_ms, self._run_hidden_callback)
+        
+    def _run_hidden_callback(self):
+        # 他のトップレベルウィンドウ（モニター選択ダイアログなど）がまだ閉じていなければ、閉じるまで待つ
+        if any(isinstance(widget, QDialog) and widget.isVisible() for widget in QApplication.topLevelWidgets()):
+            QTimer.singleShot(self.config.capture_hide_delay_ms or 50, self._run_hidden_callback)
+            return
+        callback, self._hidden_callback = self._hidden_callback, None
+        if callback is not None:
+            callback()
+        
+    def _select_monitor(self):
+        return self.capture_service.select_monitor(self, remember=self.config.remember_monitor)
         
     def capture_full_screen(self):
-        self.hide()
-        monitor = self.capture_service.select_monitor(self)
+        monitor = self._select_monitor()
         if monitor is not None:
-            QTimer.singleShot(500, lambda: self._do_full_capture(monitor))
-        else:
-            self.show()
+            self._when_hidden(lambda: self._do_full_capture(monitor))
         
     def _do_full_capture(self, monitor=None):
         self.current_image = self.capture_service.capture_full_screen(monitor)
         self.show()
-        
-        if self.mode_selector.currentText() == "OCRモード":
-            self.perform_ocr()
-        else:
-            self.analyze_image()
+        self._process_capture()
         
     def capture_area(self):
-        self.hide()
-        monitor = self.capture_service.select_monitor(self)
+        self._select_area('capture')
+        
+    def _select_area(self, purpose):
+        self.area_purpose = purpose
+        monitor = self._select_monitor()
         if monitor is not None:
-            QTimer.singleShot(100, lambda: self._show_overlay(monitor))
-        else:
-            self.show()
+            self._when_hidden(lambda: self._show_overlay(monitor))
+        
+    def capture_last_region(self):
+        # 前回選択した範囲を、範囲選択なしでそのままキャプチャする
+        region = self.capture_service.last_region()
+        if region is None:
+            self.capture_area()
+            return
+        monitor, rect = region
+        self._when_hidden(lambda: self._do_region_capture(monitor, rect))
+        
+    def _do_region_capture(self, monitor, rect):
+        self.current_image = self.capture_service.capture_area(rect, monitor)
+        self.show()
+        self._process_capture()
         
     def _show_overlay(self, monitor=None):
         self.selected_monitor = monitor
+        # 画面を一度だけ取得して静止画として表示し、選択後はこの画像から切り出す
+        self.frozen_frame = None
+        self.frozen_pixmap = None
+        if self.config.capture_frozen_frame:
+            try:
+                self.frozen_frame = self.capture_service.grab_monitor(monitor)
+            except Exception as e:
+                print(f"Error capturing frozen frame: {e}")
+        
         self.overlay = QWidget()
         self.overlay.setWindowFlags(
             Qt.WindowType.WindowStaysOnTopHint | 
@@ -212,16 +415,10 @@ class EnhancedOCRTool(QMainWindow):
         )
         self.overlay.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground)
         
-        if monitor:
-            self.overlay.setGeometry(
-                monitor['left'],
-                monitor['top'],
-                monitor['width'],
-                monitor['height']
-            )
-        else:
-            self.overlay.setGeometry(0, 0, QApplication.primaryScreen().size().width(),
-                                    QApplication.primaryScreen().size().height())
+        # モニターの範囲は物理ピクセルなので、対応するQScreenの論理座標で重ね、倍率で物理ピクセルに戻す
+        screen = self.capture_service.match_screen(QApplication.screens(), monitor) or QApplication.primaryScreen()
+        self.overlay_ratio = screen.devicePixelRatio()
+        self.overlay.setGeometry(screen.geometry())
 
         self.start_x = None
         self.start_y = None
@@ -238,6 +435,9 @@ class EnhancedOCRTool(QMainWindow):
         self.canvas.mouseReleaseEvent = self.on_release
         self.canvas.paintEvent = self.on_paint
 
+        if self.frozen_frame is not None:
+            self.frozen_pixmap = self.capture_service.frame_pixmap(self.frozen_frame, self.overlay_ratio)
+
         self.overlay.show()
 
     def on_press(self, event):
@@ -269,6 +469,8 @@ class EnhancedOCRTool(QMainWindow):
 
     def on_paint(self, event):
         painter = QPainter(self.canvas)
+        if self.frozen_pixmap is not None:
+            painter.drawPixmap(self.canvas.rect(), self.frozen_pixmap)
         # 画面全体に薄い灰色の半透明オーバーレイを描画
         painter.fillRect(self.canvas.rect(), QColor(128, 128, 128, 60))
 
@@ -299,16 +501,128 @@ class EnhancedOCRTool(QMainWindow):
         self._handle_area_capture(rect)
 
     def _handle_area_capture(self, rect):
-        self.current_image = self.capture_service.capture_area(rect, self.selected_monitor)
+        # 以降はモニター内の物理ピクセル座標で扱う
+        rect = self.capture_service.physical_rect(rect, self.overlay_ratio)
+        frozen_frame = self.frozen_frame
+        self.frozen_frame = None
+        self.frozen_pixmap = None
+        if self.area_purpose == 'watch':
+            self.overlay.close()
+            self.overlay = None
+            self.show()
+            self._begin_watch(self.capture_service.area_bbox(rect, self.selected_monitor))
+            return
+        if self.area_purpose == 'scroll':
+            self.overlay.close()
+            self.overlay = None
+            self.show()
+            if not rect.isEmpty():
+                self._begin_scroll_capture(self.capture_service.area_bbox(rect, self.selected_monitor))
+            return
+        
+        if rect.isEmpty():
+            self.overlay.close()
+            self.overlay = None
+            self.show()
+            return
+        
+        self.capture_service.remember_region(self.selected_monitor, rect)
+        if frozen_frame is not None:
+            self.current_image = self.capture_service.crop_frame(frozen_frame, rect)
+        else:
+            self.current_image = self.capture_service.capture_area(rect, self.selected_monitor)
         self.overlay.close()
         self.overlay = None
         self.show()
+        self._process_capture()
+        
+    def _process_capture(self, kind=None):
+        # kindを指定しなければ選択中のモードで処理する
+        self._cancel_prefetch()
+        if kind is None:
+            mode = self.mode_selector.currentText()
+            if mode == "OCRモード":
+                kind = 'ocr'
+            elif mode == "一括モード":
+                kind = 'all'
+            else:
+                kind = 'vision'
+        
+        # 直近とほぼ同じ画面ならAPIを呼ばずに前回の結果を表示
+        # 縮小とハッシュの計算はUIスレッドを止めないようワーカーで行う（新しいキャプチャが来れば置き換えられる）
+        if self.frame_deduplicator is not None:
+            image = self.current_image
+            self.current_frame = None
+            self.job_scheduler.submit(
+                self.frame_deduplicator.observe, image,
+                priority=PRIORITY_INTERACTIVE, key='capture',
+                on_finished=lambda observed: self._handle_observed_frame(kind, image, *observed),
+                on_failed=lambda message: self._handle_observed_frame(kind, image, None, False)
+            )
+            return
+        self._start_capture_job(kind)
+        
+    def _handle_observed_frame(self, kind, image, frame, is_duplicate):
+        if image is not getattr(self, 'current_image', None):
+            return
+        self.current_frame = frame
+        if is_duplicate and kind in frame.results:
+            self.job_scheduler.cancel_key('capture')
+            self._finish_job(None)
+            if kind == 'ocr':
+                self._handle_ocr_result(frame.results[kind], record=False)
+            elif kind == 'all':
+                self._handle_all_results(frame.results[kind], record=False)
+            else:
+                self._handle_vision_result(frame.results[kind], record=False)
+            self.status_bar.showMessage("画面に変化がないため前回の結果を表示しています", 3000)
+            return
+        self._start_capture_job(kind)
         
-        if self.mode_selector.currentText() == "OCRモード":
+    def _start_capture_job(self, kind):
+        if kind == 'ocr':
             self.perform_ocr()
+        elif kind == 'all':
+            self.perform_all()
         else:
             self.analyze_image()
         
+    def _remember_frame_result(self, frame, kind, text):
+        if frame is not None and text:
+            frame.results[kind] = text
+        
+    def _record_history(self, kind, **texts):
+        # 書き込みは履歴のスレッドで行うため、ここではキューに積むだけ
+        store = self.history_store
+        if store is None:
+            return
+        try:
+            self.current_history_id = store.record(
+                kind,
+                image=getattr(self, 'current_image', None),
+                model=self.config.vision_model,
+                timings=tracer.stage_timings() if tracer.enabled else None,
+                **texts
+            )
+        except Exception as e:
+            print(f"Error recording history: {e}")
+        
+    def _update_history(self, **texts):
+        # 直近のキャプチャの履歴に、あとから実行した要約・翻訳を追加する
+        store = self.history_store
+        if store is not None and self.current_history_id:
+            store.update(self.current_history_id, **texts)
+        
+    def _restore_history_entry(self, entry):
+        self._cancel_prefetch()
+        self.current_history_id = entry.capture_id
+        self.ocr_result.setText(entry.texts['ocr'])
+        self.summary_result.setText(entry.texts['summary'])
+        self.translation_result.setText(entry.texts['translation'])
+        self.vision_result.setText(entry.texts['vision'])
+        self.tab_widget.setCurrentWidget(self.vision_result if entry.kind == 'vision' else self.ocr_result)
+        self.status_bar.showMessage("履歴から結果を読み込みました", 3000)
+        
     def perform_ocr(self):
         if not hasattr(self, 'current_image'):
             return
@@ -316,15 +630,141 @@ class EnhancedOCRTool(QMainWindow):
         self.show_loading()
         self.status_bar.showMessage("OCR処理中...")
         
-        self.current_thread = ProcessingThread(self.ocr_service.perform_ocr, self.current_image)
-        self.current_thread.finished.connect(self._handle_ocr_result)
-        self.current_thread.start()
+        frame = self.current_frame
+        self._submit_job(
+            self.ocr_result, self.ocr_service.perform_ocr, self.current_image,
+            key='capture', priority=PRIORITY_INTERACTIVE,
+            on_finished=lambda text: self._handle_ocr_result(text, frame)
+        )
 
-    def _handle_ocr_result(self, text):
+    def _submit_job(self, target, service_method, *args, on_finished, key=None, priority=PRIORITY_NORMAL, stream=None):
+        if stream is None:
+            stream = self.config.streaming_enabled
+        if stream:
+            target.clear()
+        
+        job_id = None
+        
+        def finished(result):
+            self._finish_job(job_id)
+            on_finished(result)
+        
+        def failed(message):
+            self._finish_job(job_id)
+            self.status_bar.showMessage("処理に失敗しました", 3000)
+            QMessageBox.warning(self, "エラー", f"処理に失敗しました:\n{message}")
+        
+        job_id = self.job_scheduler.submit(
+            service_method, *args,
+            priority=priority, key=key, stream=stream,
+            on_finished=finished,
+            on_partial=lambda text: self._handle_partial_result(target, text),
+            on_failed=failed
+        )
+        self.active_jobs.add(job_id)
+        return job_id
+        
+    def _finish_job(self, job_id):
+        # 置き換えられたジョブも含めて、実行中のものがなくなったらローディング表示を消す
+        self.active_jobs.discard(job_id)
+        self.active_jobs = {j for j in self.active_jobs if self.job_scheduler.is_active(j)}
+        if not self.active_jobs:
+            self.hide_loading()
+        
+    def _show_done(self, message):
+        # 計測が有効なら、直近の各段階（キャプチャ・エンコード・API・表示）の所要時間を添える
+        timing = tracer.status_text() if tracer.enabled else ''
+        if timing:
+            self.status_bar.showMessage(f"{message}（{timing}）", 8000)
+        else:
+            self.status_bar.showMessage(message, 3000)
+        
+    def _handle_partial_result(self, target, text):
+        # 最初の断片が届いた時点でローディング表示を消して逐次表示する
         self.hide_loading()
+        if self.tab_widget.currentWidget() is not target:
+            self.tab_widget.setCurrentWidget(target)
+        target.append_text(text)
+        
+    def perform_all(self):
+        if not hasattr(self, 'current_image'):
+            return
+        
+        self.show_loading()
+        self.status_bar.showMessage("OCR・要約・翻訳を処理中...")
+        
+        # JSONで一括取得するためストリーミング表示は行わない
+        frame = self.current_frame
+        self._submit_job(
+            self.ocr_result, self.pipeline_service.analyze_all, self.current_image,
+            key='capture', priority=PRIORITY_INTERACTIVE, stream=False,
+            on_finished=lambda results: self._handle_all_results(results, frame)
+        )
+
+    @traced('ui.all_results')
+    def _handle_all_results(self, results, frame=None, record=True):
+        self._cancel_prefetch()
+        if frame is not None and results.get('ocr'):
+            frame.results['all'] = results
+        if record:
+            self._record_history('all', ocr=results['ocr'], summary=results['summary'], translation=results['translation'])
+        self.ocr_result.setText(results['ocr'])
+        self.summary_result.setText(results['summary'])
+        self.translation_result.setText(results['translation'])
+        self.tab_widget.setCurrentWidget(self.ocr_result)
+        self._show_done("OCR・要約・翻訳完了")
+        
+    @traced('ui.ocr_result')
+    def _handle_ocr_result(self, text, frame=None, record=True):
+        self._remember_frame_result(frame, 'ocr', text)
+        if record:
+            self._record_history('ocr', ocr=text)
         self.ocr_result.setText(text)
         self.tab_widget.setCurrentWidget(self.ocr_result)
-        self.status_bar.showMessage("OCR完了", 3000)
+        self._show_done("OCR完了")
+        self._start_prefetch()
+        
+    def _start_prefetch(self):
+        # 要約・翻訳を先に実行し、終わったらタブを切り替えずに結果だけ入れておく
+        if self.prefetcher is None:
+            return
+        self.prefetcher.start(
+            self.ocr_result.toPlainText(),
+            {'summary': self.summary_service.summarize_text, 'translation': self.translation_service.translate_text},
+            on_finished=self._handle_prefetched
+        )
+        
+    def _cancel_prefetch(self):
+        if self.prefetcher is not None:
+            self.prefetcher.cancel()
+        
+    def _handle_prefetched(self, action, source_text, text):
+        if self.ocr_result.toPlainText() != source_text:
+            return
+        if action == 'summary':
+            self._update_history(summary=text)
+            self.summary_result.setText(text)
+        elif action == 'translation':
+            self._update_history(translation=text)
+            self.translation_result.setText(text)
+        
+    def _take_prefetched(self, action, source_text, handler, submit) -> bool:
+        # 先読みが使えなければFalseを返す。待っている間に先読みが取り消された場合はsubmitで改めて送る
+        if self.prefetcher is None:
+            return False
+        
+        def finished(result):
+            if not self.active_jobs:
+                self.hide_loading()
+            handler(result)
+        
+        def failed(message):
+            if not self.active_jobs:
+                self.hide_loading()
+            self.status_bar.showMessage("処理に失敗しました", 3000)
+            QMessageBox.warning(self, "エラー", f"処理に失敗しました:\n{message}")
+        
+        return self.prefetcher.take(action, source_text, finished, failed, submit)
         
     def summarize_text(self):
         source_text = self.ocr_result.toPlainText()
@@ -335,15 +775,22 @@ class EnhancedOCRTool(QMainWindow):
         self.show_loading()
         self.status_bar.showMessage("要約処理中...")
         
-        self.current_thread = ProcessingThread(self.summary_service.summarize_text, source_text)
-        self.current_thread.finished.connect(self._handle_summary_result)
-        self.current_thread.start()
+        def submit():
+            self._submit_job(
+                self.summary_result, self.summary_service.summarize_text, source_text,
+                key='summary', on_finished=self._handle_summary_result
+            )
+        
+        # 先読み済み（または先読み中）ならその結果を使う
+        if not self._take_prefetched('summary', source_text, self._handle_summary_result, submit):
+            submit()
 
+    @traced('ui.summary_result')
     def _handle_summary_result(self, text):
-        self.hide_loading()
+        self._update_history(summary=text)
         self.summary_result.setText(text)
         self.tab_widget.setCurrentWidget(self.summary_result)
-        self.status_bar.showMessage("要約完了", 3000)
+        self._show_done("要約完了")
         
     def translate_text(self, target_lang=None):
         source_text = self.ocr_result.toPlainText()
@@ -354,15 +801,21 @@ class EnhancedOCRTool(QMainWindow):
         self.show_loading()
         self.status_bar.showMessage("翻訳中...")
         
-        self.current_thread = ProcessingThread(self.translation_service.translate_text, source_text)
-        self.current_thread.finished.connect(self._handle_translation_result)
-        self.current_thread.start()
+        def submit():
+            self._submit_job(
+                self.translation_result, self.translation_service.translate_text, source_text,
+                key='translation', on_finished=self._handle_translation_result
+            )
+        
+        if not self._take_prefetched('translation', source_text, self._handle_translation_result, submit):
+            submit()
 
+    @traced('ui.translation_result')
     def _handle_translation_result(self, text):
-        self.hide_loading()
+        self._update_history(translation=text)
         self.translation_result.setText(text)
         self.tab_widget.setCurrentWidget(self.translation_result)
-        self.status_bar.showMessage("翻訳完了", 3000)
+        self._show_done("翻訳完了")
         
     def analyze_image(self):
         if not hasattr(self, 'current_image'):
@@ -371,16 +824,119 @@ class EnhancedOCRTool(QMainWindow):
         self.show_loading()
         self.status_bar.showMessage("画像解析中...")
         
-        self.current_thread = ProcessingThread(self.vision_service.analyze_image, self.current_image)
-        self.current_thread.finished.connect(self._handle_vision_result)
-        self.current_thread.start()
+        frame = self.current_frame
+        self._submit_job(
+            self.vision_result, self.vision_service.analyze_image, self.current_image,
+            key='capture', priority=PRIORITY_INTERACTIVE,
+            on_finished=lambda text: self._handle_vision_result(text, frame)
+        )
 
-    def _handle_vision_result(self, text):
-        self.hide_loading()
+    @traced('ui.vision_result')
+    def _handle_vision_result(self, text, frame=None, record=True):
+        self._remember_frame_result(frame, 'vision', text)
+        if record:
+            self._record_history('vision', vision=text)
         self.vision_result.setText(text)
         self.tab_widget.setCurrentWidget(self.vision_result)
-        self.status_bar.showMessage("解析完了", 3000)
+        self._show_done("解析完了")
 
+    def start_watch(self):
+        # 監視する範囲を選択してからウォッチを開始
+        self.stop_watch()
+        self._select_area('watch')
+        
+    def _begin_watch(self, bbox):
+        from ..services.watch_service import RegionWatcher
+        self.watch_last_text = ''
+        self.watch_ocr = None
+        if self.config.watch_incremental:
+            # 変化した帯だけを再OCRし、前回の結果に差し込む
+            from ..services.incremental_ocr import IncrementalOCR
+            self.watch_ocr = IncrementalOCR.from_config(self.config, self.ocr_service)
+        self.region_watcher = RegionWatcher.from_config(
+            self.config, self.capture_service, bbox, self.watch_changed.emit
+        )
+        self.region_watcher.start()
+        self.tab_widget.setCurrentWidget(self.watch_log)
+        self.status_bar.showMessage("ウォッチ中（Ctrl+Shift+Wで停止）")
+        
+    def stop_watch(self):
+        if self.region_watcher is None:
+            return
+        self.region_watcher.stop()
+        self.region_watcher = None
+        self.job_scheduler.cancel_key('watch')
+        self.status_bar.showMessage("ウォッチを停止しました", 3000)
+        
+    def _handle_watch_change(self, image, fraction):
+        if self.region_watcher is None:
+            return
+        # 変化が続く場合は古いフレームのOCRを破棄して最新のものだけを処理する
+        ocr = self.watch_ocr.update if self.watch_ocr is not None else self.ocr_service.perform_ocr
+        self.job_scheduler.submit(
+            ocr, image,
+            key='watch', priority=PRIORITY_NORMAL,
+            on_finished=self._handle_watch_result,
+            on_failed=lambda message: self.status_bar.showMessage(f"ウォッチ中のOCRに失敗しました: {message}", 5000)
+        )
+        
+    def start_scroll_capture(self):
+        # 範囲を選択したあと、ユーザーがスクロールするたびに新しく見えた部分をつなげていく
+        self.cancel_scroll_capture()
+        self._select_area('scroll')
+        
+    def toggle_scroll_capture(self):
+        if self.scroll_capture is None:
+            self.start_scroll_capture()
+        else:
+            self.stop_scroll_capture()
+        
+    def _begin_scroll_capture(self, bbox):
+        from ..services.scroll_capture import ScrollCapture
+        self.scroll_capture = ScrollCapture.from_config(
+            self.config, self.capture_service, bbox, self.scroll_progress.emit
+        )
+        self.scroll_capture.start()
+        self.status_bar.showMessage("スクロールキャプチャ中：対象をスクロールしてください（Ctrl+Shift+Lで終了してOCR）")
+        
+    def _handle_scroll_progress(self, height, full):
+        if self.scroll_capture is None:
+            return
+        if full:
+            self.status_bar.showMessage(f"スクロールキャプチャが上限の高さ（{height}px）に達しました（Ctrl+Shift+Lで終了してOCR）")
+        else:
+            self.status_bar.showMessage(f"スクロールキャプチャ中：{height}px（Ctrl+Shift+Lで終了してOCR）")
+        
+    def stop_scroll_capture(self):
+        # つなげた1枚の画像をまとめてOCRする（大きな画像は設定に応じてタイル分割される）
+        if self.scroll_capture is None:
+            return
+        scroll_capture, self.scroll_capture = self.scroll_capture, None
+        image = scroll_capture.stop()
+        if image is None:
+            self.status_bar.showMessage("スクロールキャプチャを終了しました", 3000)
+            return
+        if scroll_capture.stitcher.gaps:
+            print(f"Scroll capture could not find the overlap {scroll_capture.stitcher.gaps} time(s); some content may be repeated")
+        self.current_image = image
+        self._process_capture('ocr')
+        
+    def cancel_scroll_capture(self):
+        if self.scroll_capture is not None:
+            self.scroll_capture.stop()
+            self.scroll_capture = None
+        
+    @traced('ui.watch_result')
+    def _handle_watch_result(self, text):
+        from ..services.watch_service import new_lines
+        lines = new_lines(self.watch_last_text, text or '')
+        self.watch_last_text = text or ''
+        if not lines:
+            return
+        timestamp = time.strftime('%H:%M:%S')
+        separator = '\n' if self.watch_log.toPlainText() else ''
+        self.watch_log.append_text(f"{separator}[{timestamp}]\n" + '\n'.join(lines))
+        
     def show_loading(self):
         if not hasattr(self, 'loading_overlay'):
             self.loading_overlay = LoadingOverlay(self)
@@ -392,8 +948,18 @@ class EnhancedOCRTool(QMainWindow):
             self.loading_overlay.hide()
 
     def closeEvent(self, event):
+        if self.resident:
+            self.hide()
+            event.ignore()
+            return
         # アプリケーション終了時の処理
-        if hasattr(self, 'current_thread'):
-            self.current_thread.quit()
-            self.current_thread.wait()
+        self.stop_watch()
+        self.cancel_scroll_capture()
+        self.job_scheduler.shutdown()
+        if self._services is not None:
+            self._services.close()
+        self.capture_service.close()
+        if self._history_store is not None:
+            self._history_store.close()
+        tracer.close()
         event.accept()
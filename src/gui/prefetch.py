@@ -0,0 +1,107 @@
+from .job_scheduler import PRIORITY_BACKGROUND
+from ..utils.text_chunking import estimate_tokens
+
+class PrefetchEntry:
+    def __init__(self, text, tokens):
+        self.text = text
+        self.tokens = tokens
+        self.job_id = None
+        self.done = False
+        self.result = None
+        self.waiters = []
+
+class ResultPrefetcher:
+    # OCR結果が出た時点で要約・翻訳を低優先度のジョブとして先に実行しておき、
+    # ユーザーが操作した時にその結果を使う（実行前ならキャンセルして通常の優先度で実行し直す）
+    def __init__(self, scheduler, actions, max_tokens=4000, token_budget=100000):
+        self.scheduler = scheduler
+        self.actions = list(actions)
+        self.max_tokens = max_tokens
+        self.token_budget = token_budget
+        self.spent_tokens = 0
+        self.entries = {}
+
+    @classmethod
+    def from_config(cls, config, scheduler):
+        return cls(
+            scheduler,
+            config.prefetch_actions,
+            max_tokens=config.prefetch_max_tokens,
+            token_budget=config.prefetch_token_budget
+        )
+
+    def start(self, text, tasks, on_finished) -> list:
+        # tasks: {'summary': 関数, ...}。先読みを始めた処理の名前を返す
+        self.cancel()
+        tokens = estimate_tokens(text)
+        if not text.strip() or (self.max_tokens > 0 and tokens > self.max_tokens):
+            return []
+        started = []
+        for action in self.actions:
+            func = tasks.get(action)
+            if func is None:
+                continue
+            if self.token_budget > 0 and self.spent_tokens + tokens > self.token_budget:
+                print("Prefetch token budget is exhausted; skipping speculative requests")
+                break
+            self.spent_tokens += tokens
+            entry = PrefetchEntry(text, tokens)
+            # ストリーミングで受け取り、取り消した時は実行中のリクエストも次の断片で打ち切る
+            entry.job_id = self.scheduler.submit(
+                func, text,
+                priority=PRIORITY_BACKGROUND, key=f'prefetch-{action}', stream=True,
+                on_finished=lambda result, action=action, entry=entry: self._finished(action, entry, result, on_finished),
+                on_failed=lambda message, action=action, entry=entry: self._failed(action, entry, message)
+            )
+            self.entries[action] = entry
+            started.append(action)
+        return started
+
+    def take(self, action, text, on_finished, on_failed, on_miss) -> bool:
+        # 同じテキストの先読みがあれば結果（実行中なら完了時）をon_finishedに渡してTrueを返す
+        # 完了を待つ間に先読みが取り消された場合はon_missを呼ぶ（呼び出し側で通常のリクエストを送る）
+        entry = self.entries.get(action)
+        if entry is None or entry.text != text:
+            return False
+        if entry.done:
+            on_finished(entry.result)
+            return True
+        if not self.scheduler.is_started(entry.job_id):
+            # 他のジョブの後ろで待っている間は、通常の優先度で実行し直した方が早い
+            self._discard(action, entry)
+            return False
+        entry.waiters.append((on_finished, on_failed, on_miss))
+        return True
+
+    def cancel(self):
+        for action, entry in list(self.entries.items()):
+            self._discard(action, entry)
+
+    def _discard(self, action, entry):
+        if not entry.done:
+            # 実行前に取り消したものは先読みの使用量に数えない
+            if not self.scheduler.is_started(entry.job_id):
+                self.spent_tokens -= entry.tokens
+            self.scheduler.cancel(entry.job_id)
+        if self.entries.get(action) is entry:
+            del self.entries[action]
+        waiters, entry.waiters = entry.waiters, []
+        for _, _, missed in waiters:
+            missed()
+
+    def _finished(self, action, entry, result, on_finished):
+        entry.done = True
+        entry.result = result
+        waiters, entry.waiters = entry.waiters, []
+        if waiters:
+            for finished, _, _ in waiters:
+                finished(result)
+        elif self.entries.get(action) is entry:
+            on_finished(action, entry.text, result)
+
+    def _failed(self, action, entry, message):
+        if self.entries.get(action) is entry:
+            del self.entries[action]
+        waiters, entry.waiters = entry.waiters, []
+        for _, failed, _ in waiters:
+            failed(message)
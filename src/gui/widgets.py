@@ -1,7 +1,16 @@
 from PyQt6.QtWidgets import QTextEdit
+from PyQt6.QtGui import QTextCursor
 
 class ResultTextEdit(QTextEdit):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setAcceptRichText(False)
         self.setLineWrapMode(QTextEdit.LineWrapMode.WidgetWidth)
+
+    def append_text(self, text):
+        # 末尾に追記（ストリーミング表示用）
+        cursor = self.textCursor()
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertText(text)
+        self.setTextCursor(cursor)
+        self.ensureCursorVisible()
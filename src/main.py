@@ -6,20 +6,54 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent
 sys.path.append(str(project_root))
 
-from PyQt6.QtWidgets import QApplication
-from src.gui.main_window import EnhancedOCRTool
-from src.utils.config import load_config
+from src.utils.startup_timer import startup_timer
 
 def main():
+    # --profile-startup または VISION_ASSIST_PROFILE_STARTUP=1 で起動時間を計測
+    if '--profile-startup' in sys.argv or os.getenv('VISION_ASSIST_PROFILE_STARTUP') == '1':
+        startup_timer.enable()
+        sys.argv = [arg for arg in sys.argv if arg != '--profile-startup']
+    
     # 設定の読み込み
-    config = load_config()
+    with startup_timer.phase("load config"):
+        from src.utils.config import load_config
+        config = load_config()
+    
+    # --send <コマンド> で常駐中のプロセスにコマンドを送って終了する
+    if '--send' in sys.argv:
+        index = sys.argv.index('--send')
+        command = sys.argv[index + 1] if index + 1 < len(sys.argv) else 'show'
+        from PyQt6.QtCore import QCoreApplication
+        from src.gui.daemon import send_command
+        app = QCoreApplication(sys.argv[:1])
+        sys.exit(send_command(config.daemon_socket_name, command))
+    
+    # --daemon でウィンドウを表示せずに常駐する
+    daemon_mode = '--daemon' in sys.argv
+    sys.argv = [arg for arg in sys.argv if arg != '--daemon']
     
     # アプリケーションの起動
-    app = QApplication(sys.argv)
+    with startup_timer.phase("import PyQt6"):
+        from PyQt6.QtCore import QTimer
+        from PyQt6.QtWidgets import QApplication
+    with startup_timer.phase("create QApplication"):
+        app = QApplication(sys.argv)
     
-    # メインウィンドウの作成と表示
-    window = EnhancedOCRTool(config)
-    window.show()
+    # メインウィンドウの作成と表示（重いサービスは表示後にバックグラウンドで初期化）
+    with startup_timer.phase("import main_window"):
+        from src.gui.main_window import EnhancedOCRTool
+    with startup_timer.phase("create window"):
+        window = EnhancedOCRTool(config)
+    if daemon_mode:
+        from src.gui.daemon import CaptureDaemon
+        daemon = CaptureDaemon(config, window)
+        if not daemon.start():
+            sys.exit(1)
+    else:
+        with startup_timer.phase("show window"):
+            window.show()
+    QTimer.singleShot(0, lambda: startup_timer.mark("first event loop (painted)"))
+    QTimer.singleShot(0, window.start_warm_up)
     
     sys.exit(app.exec())
 
@@ -0,0 +1,126 @@
+import importlib.util
+import threading
+from typing import Optional, Tuple
+
+# bboxは (left, top, right, bottom) の仮想デスクトップ座標。Noneなら全モニター
+BBox = Optional[Tuple[int, int, int, int]]
+
+class CapturedFrame:
+    # キャプチャしたピクセルをコピーせずに保持し、必要になった時だけPIL画像に変換する
+    def __init__(self, buffer, width: int, height: int, mode: str = 'BGRA'):
+        self.buffer = buffer
+        self.width = width
+        self.height = height
+        self.mode = mode
+
+    @property
+    def size(self):
+        return (self.width, self.height)
+
+    @property
+    def channels(self) -> int:
+        return 4 if self.mode == 'BGRA' else len(self.mode)
+
+    def to_numpy(self):
+        # バッファを共有する (高さ, 幅, チャンネル) の配列（コピーなし）
+        import numpy as np
+        return np.frombuffer(self.buffer, dtype=np.uint8).reshape(self.height, self.width, self.channels)
+
+    def memoryview(self) -> memoryview:
+        return memoryview(self.buffer)
+
+    def to_image(self, box=None):
+        # boxを指定すると、全体を変換してから切り出すのではなく、その範囲の行だけを1回で変換する
+        from PIL import Image
+        mode, rawmode = ('RGB', 'BGRX') if self.mode == 'BGRA' else (self.mode, self.mode)
+        if box is None:
+            return Image.frombuffer(mode, self.size, self.buffer, 'raw', rawmode, 0, 1)
+        left, top, right, bottom = box
+        if right <= left or bottom <= top:
+            return Image.new(mode, (max(0, right - left), max(0, bottom - top)))
+        stride = self.width * self.channels
+        offset = top * stride + left * self.channels
+        return Image.frombuffer(
+            mode, (right - left, bottom - top), memoryview(self.buffer)[offset:], 'raw', rawmode, stride, 1
+        )
+
+class CaptureBackend:
+    name = 'base'
+
+    def grab(self, bbox: BBox = None) -> CapturedFrame:
+        raise NotImplementedError
+
+    def grab_image(self, bbox: BBox = None):
+        return self.grab(bbox).to_image()
+
+    def close(self):
+        pass
+
+class PILCaptureBackend(CaptureBackend):
+    # PIL.ImageGrabによる従来の方式（どの環境でも動作するが毎回全体を確保するため遅い）
+    name = 'pil'
+
+    def grab(self, bbox: BBox = None) -> CapturedFrame:
+        image = self.grab_image(bbox)
+        return CapturedFrame(image.tobytes(), image.width, image.height, image.mode)
+
+    def grab_image(self, bbox: BBox = None):
+        from PIL import ImageGrab
+        return ImageGrab.grab(bbox=bbox, all_screens=True).convert('RGB')
+
+class MSSCaptureBackend(CaptureBackend):
+    # mssの取得オブジェクトを使い回し、指定範囲だけをBGRAのまま取得する
+    # （X11ではXShmGetImageによる共有メモリ経由になる）
+    # mssは共有メモリの内容を取得のたびに新しいbytearrayへコピーして返し、書き込み先を渡す手段がない。
+    # そのbytearrayをそのままフレームのバッファにして、こちらではそれ以上コピーしない
+    name = 'mss'
+
+    def __init__(self):
+        import mss
+        self._mss = mss
+        # mssのハンドルはスレッドをまたいで使えないためスレッドごとに保持する
+        self._local = threading.local()
+        self._grabbers = []
+        self._lock = threading.Lock()
+
+    def _grabber(self):
+        grabber = getattr(self._local, 'grabber', None)
+        if grabber is None:
+            grabber = self._mss.mss()
+            self._local.grabber = grabber
+            with self._lock:
+                self._grabbers.append(grabber)
+        return grabber
+
+    def grab(self, bbox: BBox = None) -> CapturedFrame:
+        grabber = self._grabber()
+        if bbox is None:
+            region = grabber.monitors[0]
+        else:
+            left, top, right, bottom = bbox
+            region = {'left': left, 'top': top, 'width': right - left, 'height': bottom - top}
+        shot = grabber.grab(region)
+        return CapturedFrame(shot.raw, shot.width, shot.height, 'BGRA')
+
+    def close(self):
+        with self._lock:
+            grabbers, self._grabbers = self._grabbers, []
+        for grabber in grabbers:
+            try:
+                grabber.close()
+            except Exception:
+                pass
+
+def mss_available() -> bool:
+    return importlib.util.find_spec('mss') is not None
+
+def create_capture_backend(name: str = 'auto') -> CaptureBackend:
+    name = (name or 'auto').lower()
+    if name == 'pil':
+        return PILCaptureBackend()
+    if name in ('mss', 'auto') and mss_available():
+        try:
+            return MSSCaptureBackend()
+        except Exception as e:
+            print(f"Error initializing mss capture backend: {e}")
+    return PILCaptureBackend()
@@ -1,7 +1,10 @@
-from PIL import ImageGrab
+import json
+import os
+import threading
 from PyQt6.QtCore import QRect
+from PyQt6.QtGui import QImage, QPixmap
 from PyQt6.QtWidgets import QDialog, QVBoxLayout, QComboBox, QPushButton, QLabel
-from screeninfo import get_monitors
+from ..utils.tracing import tracer
 
 class MonitorSelector(QDialog):
     def __init__(self, monitors, parent=None):
@@ -24,73 +27,213 @@ class MonitorSelector(QDialog):
         layout.addWidget(btn)
         
     def get_selected_monitor(self):
-        monitor = self.combo.currentData()
-        return {
-            'left': monitor.x,
-            'top': monitor.y,
-            'width': monitor.width,
-            'height': monitor.height
-        }
+        return monitor_region(self.combo.currentData())
 
+def monitor_region(monitor) -> dict:
+    return {
+        'left': monitor.x,
+        'top': monitor.y,
+        'width': monitor.width,
+        'height': monitor.height
+    }
+
+# PIL・mss・screeninfoは起動を速くするため初回利用時に読み込む
 class CaptureService:
-    @staticmethod
-    def get_monitors():
-        return list(get_monitors())
+    def __init__(self, backend='auto', state_path=None):
+        self.backend_name = backend
+        self._backend = None
+        self._backend_lock = threading.Lock()
+        self._monitors = None
+        self._monitors_lock = threading.Lock()
+        # state_pathを指定すると、最後に選んだモニターと範囲を保存して次回も使う
+        self.state_path = state_path
+        self.last_monitor = None
+        self.last_rect = None
+        self._load_state()
     
-    @staticmethod
-    def select_monitor(parent=None):
-        monitors = CaptureService.get_monitors()
-        if len(monitors) == 1:
-            monitor = monitors[0]
-            return {
-                'left': monitor.x,
-                'top': monitor.y,
-                'width': monitor.width,
-                'height': monitor.height
-            }
+    @property
+    def backend(self):
+        # 取得オブジェクトは作成コストが高いので一度だけ作って使い回す
+        with self._backend_lock:
+            if self._backend is None:
+                from .capture_backends import create_capture_backend
+                self._backend = create_capture_backend(self.backend_name)
+            return self._backend
+    
+    def warm_up(self):
+        self.get_monitors()
+        self.backend
+    
+    def close(self):
+        if self._backend is not None:
+            self._backend.close()
+    
+    def get_monitors(self):
+        # モニター構成は変わるまで使い回す（画面の追加・削除・解像度変更時にinvalidate_monitorsで破棄）
+        with self._monitors_lock:
+            if self._monitors is None:
+                from screeninfo import get_monitors
+                self._monitors = list(get_monitors())
+            return self._monitors
+    
+    def invalidate_monitors(self):
+        with self._monitors_lock:
+            self._monitors = None
+    
+    def select_monitor(self, parent=None, remember=False):
+        monitors = self.get_monitors()
+        regions = [monitor_region(monitor) for monitor in monitors]
+        if len(regions) == 1:
+            return regions[0]
+        # 前回選んだモニターが今もあれば、ダイアログを出さずにそれを使う
+        if remember and self.last_monitor in regions:
+            return self.last_monitor
         
         dialog = MonitorSelector(monitors, parent)
         if dialog.exec():
-            return dialog.get_selected_monitor()
+            self.last_monitor = dialog.get_selected_monitor()
+            self._save_state()
+            return self.last_monitor
         return None
+    
+    def forget_monitor(self):
+        self.last_monitor = None
+        self._save_state()
+    
+    def remember_region(self, monitor, rect: QRect):
+        self.last_monitor = monitor
+        self.last_rect = (rect.x(), rect.y(), rect.width(), rect.height())
+        self._save_state()
+    
+    def last_region(self):
+        # 前回の範囲（モニター構成が変わって使えない場合はNone）
+        if self.last_rect is None:
+            return None
+        regions = [monitor_region(monitor) for monitor in self.get_monitors()]
+        if self.last_monitor is not None and self.last_monitor not in regions:
+            return None
+        return self.last_monitor, QRect(*self.last_rect)
+    
+    def _load_state(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading capture state: {e}")
+            return
+        self.last_monitor = state.get('monitor')
+        self.last_rect = tuple(state['rect']) if state.get('rect') else None
+    
+    def _save_state(self):
+        if not self.state_path:
+            return
+        try:
+            with open(self.state_path, 'w', encoding='utf-8') as f:
+                json.dump({'monitor': self.last_monitor, 'rect': self.last_rect}, f)
+        except OSError as e:
+            print(f"Error saving capture state: {e}")
 
     @staticmethod
-    def capture_full_screen(monitor=None):
-        if monitor:
-            bbox = (
-                monitor['left'],
-                monitor['top'],
-                monitor['left'] + monitor['width'],
-                monitor['top'] + monitor['height']
-            )
+    def monitor_bbox(monitor):
+        return (
+            monitor['left'],
+            monitor['top'],
+            monitor['left'] + monitor['width'],
+            monitor['top'] + monitor['height']
+        )
+
+    def grab(self, bbox=None):
+        # 指定範囲のみをバッファとして取得（PIL画像への変換は呼び出し側で必要な時だけ行う）
+        with tracer.span('capture', backend=self.backend.name) as span:
             try:
-                screenshot = ImageGrab.grab(bbox=bbox, all_screens=True)
+                frame = self.backend.grab(bbox)
             except Exception as e:
-                print(f"Error capturing screen: {e}")
-                screenshot = ImageGrab.grab(all_screens=True)
-        else:
-            screenshot = ImageGrab.grab(all_screens=True)
-        return screenshot
+                print(f"Error capturing with {self.backend.name} backend: {e}")
+                from .capture_backends import PILCaptureBackend
+                frame = PILCaptureBackend().grab(bbox)
+            span.set(width=frame.width, height=frame.height, bytes=len(frame.buffer))
+            return frame
+
+    def _to_image(self, frame):
+        with tracer.span('capture.convert'):
+            return frame.to_image()
+
+    def capture_full_screen(self, monitor=None):
+        bbox = self.monitor_bbox(monitor) if monitor else None
+        return self._to_image(self.grab(bbox))
     
     @staticmethod
-    def capture_area(rect: QRect, monitor=None):
+    def area_bbox(rect: QRect, monitor=None):
+        # rectはモニター内の物理ピクセル座標
         if monitor:
-            bbox = (
+            return (
                 monitor['left'] + rect.x(),
                 monitor['top'] + rect.y(),
                 monitor['left'] + rect.x() + rect.width(),
                 monitor['top'] + rect.y() + rect.height()
             )
+        return (
+            rect.x(),
+            rect.y(),
+            rect.x() + rect.width(),
+            rect.y() + rect.height()
+        )
+    
+    def capture_area(self, rect: QRect, monitor=None):
+        return self._to_image(self.grab(self.area_bbox(rect, monitor)))
+    
+    def grab_monitor(self, monitor=None):
+        # エリア選択用にモニター全体を一度だけ取得する
+        return self.grab(self.monitor_bbox(monitor) if monitor else None)
+    
+    @staticmethod
+    def match_screen(screens, monitor):
+        # screeninfoのモニター（物理ピクセル）に対応するQScreenを探す
+        # QScreen.geometry()は論理座標なので、大きさはdevicePixelRatio倍して比べる
+        # （左上の位置はプラットフォームによって物理座標のままの場合と論理座標の場合がある）
+        if monitor is None:
+            return screens[0] if screens else None
+        for screen in screens:
+            geometry = screen.geometry()
+            ratio = screen.devicePixelRatio()
+            size = (round(geometry.width() * ratio), round(geometry.height() * ratio))
+            origins = ((geometry.x(), geometry.y()), (round(geometry.x() * ratio), round(geometry.y() * ratio)))
+            if size == (monitor['width'], monitor['height']) and (monitor['left'], monitor['top']) in origins:
+                return screen
+        return screens[0] if screens else None
+    
+    @staticmethod
+    def physical_rect(rect: QRect, ratio: float) -> QRect:
+        # オーバーレイ上の論理座標をモニター内の物理ピクセル座標に変換する（HiDPIではdevicePixelRatio倍）
+        left = round(rect.x() * ratio)
+        top = round(rect.y() * ratio)
+        right = round((rect.x() + rect.width()) * ratio)
+        bottom = round((rect.y() + rect.height()) * ratio)
+        return QRect(left, top, right - left, bottom - top)
+    
+    @staticmethod
+    def frame_box(frame, rect: QRect):
+        # モニター内の物理ピクセル座標の範囲を、バッファからはみ出さないように切り詰める
+        left = min(frame.width, max(0, rect.x()))
+        top = min(frame.height, max(0, rect.y()))
+        right = min(frame.width, max(left, rect.x() + rect.width()))
+        bottom = min(frame.height, max(top, rect.y() + rect.height()))
+        return left, top, right, bottom
+    
+    def crop_frame(self, frame, rect: QRect):
+        # 取得済みのバッファから選択範囲（物理ピクセル）だけを切り出す（再キャプチャしない）
+        with tracer.span('capture.crop'):
+            return frame.to_image(self.frame_box(frame, rect))
+    
+    @staticmethod
+    def frame_pixmap(frame, ratio: float) -> QPixmap:
+        # オーバーレイの背景に表示するため、バッファをコピー1回でQPixmapに変換する
+        if frame.mode == 'BGRA':
+            image = QImage(frame.buffer, frame.width, frame.height, frame.width * 4, QImage.Format.Format_RGB32)
         else:
-            bbox = (
-                rect.x(),
-                rect.y(),
-                rect.x() + rect.width(),
-                rect.y() + rect.height()
-            )
-        try:
-            screenshot = ImageGrab.grab(bbox=bbox, all_screens=True)
-        except Exception as e:
-            print(f"Error capturing area: {e}")
-            screenshot = ImageGrab.grab(bbox=bbox)
-        return screenshot
+            image = QImage(frame.buffer, frame.width, frame.height, frame.width * 3, QImage.Format.Format_RGB888)
+        pixmap = QPixmap.fromImage(image)
+        pixmap.setDevicePixelRatio(ratio)
+        return pixmap
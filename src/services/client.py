@@ -0,0 +1,65 @@
+import importlib.util
+import weakref
+import httpx
+from openai import DEFAULT_MAX_RETRIES, OpenAI, AsyncOpenAI
+from .rate_limit import RequestGovernor, attach_governor
+
+# 同期・非同期クライアントで同じ流量制御の状態を共有する（設定ごとに1つ）
+_governors = weakref.WeakKeyDictionary()
+
+def _governor(config) -> RequestGovernor:
+    governor = _governors.get(config)
+    if governor is None:
+        governor = _governors[config] = RequestGovernor.from_config(config)
+    return governor
+
+def _max_retries(config) -> int:
+    # 流量制御が有効な場合、再試行はSDKではなくRequestGovernorが行う
+    return 0 if config.rate_limit_enabled else DEFAULT_MAX_RETRIES
+
+def _http2_enabled(config) -> bool:
+    # HTTP/2はh2パッケージが入っている場合のみ有効にする
+    return config.http2 and importlib.util.find_spec('h2') is not None
+
+def _limits(config) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=config.http_max_connections,
+        max_keepalive_connections=config.http_max_keepalive,
+        keepalive_expiry=config.http_keepalive_expiry
+    )
+
+def _timeout(config) -> httpx.Timeout:
+    return httpx.Timeout(config.http_timeout, connect=config.http_connect_timeout)
+
+def create_client(config) -> OpenAI:
+    # 全サービスで共有する同期クライアント（接続プールとkeep-aliveを使い回す）
+    http_client = httpx.Client(
+        limits=_limits(config),
+        timeout=_timeout(config),
+        http2=_http2_enabled(config)
+    )
+    client = OpenAI(
+        api_key=config.openai_api_key,
+        base_url=config.openai_base_url,
+        http_client=http_client,
+        max_retries=_max_retries(config)
+    )
+    if config.rate_limit_enabled:
+        attach_governor(client, _governor(config))
+    return client
+
+def create_async_client(config) -> AsyncOpenAI:
+    http_client = httpx.AsyncClient(
+        limits=_limits(config),
+        timeout=_timeout(config),
+        http2=_http2_enabled(config)
+    )
+    client = AsyncOpenAI(
+        api_key=config.openai_api_key,
+        base_url=config.openai_base_url,
+        http_client=http_client,
+        max_retries=_max_retries(config)
+    )
+    if config.rate_limit_enabled:
+        attach_governor(client, _governor(config))
+    return client
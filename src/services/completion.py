@@ -0,0 +1,399 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+import openai
+from .rate_limit import RequestAttempt, governor_for, is_permanent_error
+from ..utils.text_chunking import estimate_tokens
+from ..utils.tracing import tracer
+
+# レート制限の見積もりに使う画像1枚あたりのトークン数
+IMAGE_TOKEN_ESTIMATE = 1000
+
+_cancel_check = contextvars.ContextVar('cancel_check', default=None)
+
+class RequestCancelled(BaseException):
+    # 呼び出し元が取り消した。asyncio.CancelledErrorと同様に、失敗時のフォールバック（except Exception）では捕まえない
+    pass
+
+@contextmanager
+def cancellation(check: Callable[[], bool]):
+    # この中から送るリクエストは、送る前にcheck()を確かめ、Trueならば送らずにRequestCancelledを送出する
+    token = _cancel_check.set(check)
+    try:
+        yield
+    finally:
+        _cancel_check.reset(token)
+
+def raise_if_cancelled():
+    check = _cancel_check.get()
+    if check is not None and check():
+        raise RequestCancelled()
+
+def bind_context(func):
+    # ThreadPoolExecutorのスレッドにも呼び出し元のキャンセル判定と計測中のスパンを引き継ぐ
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)
+
+def text_messages(content: str) -> list:
+    return [
+        {
+            "role": "user",
+            "content": content
+        }
+    ]
+
+def image_messages(prompt: str, image_url: str) -> list:
+    return [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": prompt
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": image_url
+                    }
+                }
+            ]
+        }
+    ]
+
+def multi_image_messages(prompt: str, image_urls: List[str]) -> list:
+    # 複数の画像を1つのリクエストにまとめる（画像の順序がそのまま番号になる）
+    return [
+        {
+            "role": "user",
+            "content": [{"type": "text", "text": prompt}] + [
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": image_url
+                    }
+                }
+                for image_url in image_urls
+            ]
+        }
+    ]
+
+class _Listener:
+    # 相乗りした呼び出し元1件。on_deltaが例外（キャンセル）を送出したら記録し、待っている呼び出し元で送出し直す
+    def __init__(self, on_delta, future=None):
+        self.on_delta = on_delta
+        self.future = future
+        self.error = None
+
+class _Flight:
+    # 実行中のリクエスト1件。同じリクエストを後から出した呼び出し元は結果（とストリームの断片）を共有する
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+        self.error = None
+        self.parts = []
+        self.listeners = []
+        self.future = None
+
+    def publish(self, delta: str):
+        with self.lock:
+            self.parts.append(delta)
+            listeners = list(self.listeners)
+        for listener in listeners:
+            try:
+                listener.on_delta(delta)
+            except (Exception, RequestCancelled) as e:
+                # 相乗りした側がキャンセルされても実行中のリクエストは止めず、その呼び出し元だけを待機から戻す
+                with self.lock:
+                    if listener in self.listeners:
+                        self.listeners.remove(listener)
+                    listener.error = e
+                    self.changed.notify_all()
+                if listener.future is not None and not listener.future.done():
+                    listener.future.set_result(None)
+
+    def subscribe(self, on_delta, future=None) -> _Listener:
+        # それまでに届いた断片を渡してから以降の断片を購読する
+        # （ロックを持ったまま渡すので、その間に届いた断片が先に届いて順序が入れ替わることはない）
+        listener = _Listener(on_delta, future)
+        with self.lock:
+            parts = ''.join(self.parts)
+            if parts:
+                on_delta(parts)
+            self.listeners.append(listener)
+        return listener
+
+    def finish(self):
+        with self.lock:
+            self.done.set()
+            self.changed.notify_all()
+
+    def wait(self, listener: Optional[_Listener] = None):
+        # 先行したリクエストの完了を待つ。待っている間に呼び出し元が取り消されたらその例外を送出する
+        with self.lock:
+            while not self.done.is_set():
+                if listener is not None and listener.error is not None:
+                    raise listener.error
+                self.changed.wait(0.1)
+                raise_if_cancelled()
+            if listener is not None and listener.error is not None:
+                raise listener.error
+
+    def fail(self, error: BaseException):
+        self.failed = True
+        self.error = error
+
+    def raise_if_permanent(self):
+        # 送り直しても同じ結果になる失敗なら、相乗りした側にも同じ例外を渡す（改めて実行しない）
+        if self.error is not None and is_permanent_error(self.error):
+            raise self.error
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+def _flight_key(client, model: str, messages: list, max_tokens: int, kwargs: dict) -> str:
+    digest = hashlib.sha256()
+    digest.update(f'{id(client)}\0{model}\0{max_tokens}\0'.encode('utf-8'))
+    digest.update(json.dumps([messages, kwargs], sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    return digest.hexdigest()
+
+def create_completion(client, model: str, messages: list, max_tokens: int = 1000,
+                      on_delta: Optional[Callable[[str], None]] = None, **kwargs) -> str:
+    # 同じ内容のリクエストが実行中ならAPIを呼ばずにその結果を待つ（ダブルクリックなどの重複を1回にまとめる）
+    raise_if_cancelled()
+    key = _flight_key(client, model, messages, max_tokens, kwargs)
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        listener = flight.subscribe(on_delta) if on_delta is not None else None
+        flight.wait(listener)
+        if not flight.failed:
+            return flight.result
+        # 先行したリクエストが一時的な失敗・中断で終わった場合は改めて実行する
+        flight.raise_if_permanent()
+        return create_completion(client, model, messages, max_tokens, on_delta, **kwargs)
+
+    def publish(delta):
+        if on_delta is not None:
+            on_delta(delta)
+        flight.publish(delta)
+
+    try:
+        flight.result = _request_completion(
+            client, model, messages, max_tokens, publish if on_delta is not None else None, **kwargs
+        )
+        return flight.result
+    except BaseException as e:
+        flight.fail(e)
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.finish()
+
+def _estimate_tokens(messages: list, max_tokens: int) -> int:
+    # レート制限のトークン数の見積もり（画像は1枚あたりおおよその値で数える）
+    tokens = max_tokens
+    for message in messages:
+        content = message['content']
+        if isinstance(content, str):
+            tokens += estimate_tokens(content)
+            continue
+        for part in content:
+            tokens += estimate_tokens(part['text']) if part['type'] == 'text' else IMAGE_TOKEN_ESTIMATE
+    return tokens
+
+def _payload_bytes(messages: list) -> int:
+    # 送信する本文のおおよその大きさ（画像はdata URLの長さ）
+    size = 0
+    for message in messages:
+        content = message['content']
+        if isinstance(content, str):
+            size += len(content.encode('utf-8'))
+            continue
+        for part in content:
+            size += len(part['text'].encode('utf-8')) if part['type'] == 'text' else len(part['image_url']['url'])
+    return size
+
+# stream_optionsを受け付けないOpenAI互換サーバーに一度拒否されたら、以降は付けずに送る
+_stream_usage_rejected = False
+
+def _stream_options_rejected(error: Exception, kwargs: dict) -> bool:
+    global _stream_usage_rejected
+    if 'stream_options' not in kwargs or not isinstance(error, openai.BadRequestError):
+        return False
+    print(f"Server rejected stream_options, retrying without usage reporting: {error}")
+    _stream_usage_rejected = True
+    del kwargs['stream_options']
+    return True
+
+def _record_usage(usage):
+    if usage is not None:
+        tracer.annotate(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+
+def _request_completion(client, model: str, messages: list, max_tokens: int = 1000,
+                        on_delta: Optional[Callable[[str], None]] = None, **kwargs) -> str:
+    with tracer.span('completion', model=model, stream=on_delta is not None, bytes=_payload_bytes(messages)):
+        return _governed_completion(client, model, messages, max_tokens, on_delta, **kwargs)
+
+def _governed_completion(client, model: str, messages: list, max_tokens: int,
+                         on_delta: Optional[Callable[[str], None]], **kwargs) -> str:
+    governor = governor_for(client)
+    if governor is None:
+        return _send_completion(client.chat.completions.create, model, messages, max_tokens, on_delta, None, **kwargs)
+    # レート制限のヘッダーを読むためにwith_raw_response経由で送る
+    create = client.chat.completions.with_raw_response.create
+    return governor.run(
+        model,
+        _estimate_tokens(messages, max_tokens),
+        lambda attempt: _send_completion(create, model, messages, max_tokens, on_delta, attempt, **kwargs)
+    )
+
+def _send_completion(create, model: str, messages: list, max_tokens: int,
+                     on_delta: Optional[Callable[[str], None]], attempt: Optional[RequestAttempt], **kwargs) -> str:
+    # on_deltaが指定された場合はストリーミングで受信し、届いた断片を逐次通知する
+    # 再試行の前にも取り消されていないかを確かめる
+    raise_if_cancelled()
+    if on_delta is not None:
+        kwargs['stream'] = True
+        if tracer.enabled and not _stream_usage_rejected:
+            # 計測用に最後のチャンクでトークン数を受け取る（拒否された場合は1回だけ付けずに送り直す）
+            kwargs['stream_options'] = {'include_usage': True}
+    started = time.perf_counter()
+    try:
+        response = create(model=model, messages=messages, max_tokens=max_tokens, **kwargs)
+    except Exception as e:
+        if not _stream_options_rejected(e, kwargs):
+            raise
+        response = create(model=model, messages=messages, max_tokens=max_tokens, **kwargs)
+    if attempt is not None:
+        attempt.headers = response.headers
+        response = response.parse()
+    
+    if on_delta is None:
+        _record_usage(getattr(response, 'usage', None))
+        return response.choices[0].message.content
+    
+    parts = []
+    for chunk in response:
+        _record_usage(getattr(chunk, 'usage', None))
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            if not parts:
+                tracer.annotate(first_token_ms=round((time.perf_counter() - started) * 1000, 1))
+            parts.append(delta)
+            if attempt is not None:
+                attempt.streamed = True
+            on_delta(delta)
+    return ''.join(parts)
+
+_aflights = {}
+
+async def acreate_completion(client, model: str, messages: list, max_tokens: int = 1000,
+                             on_delta: Optional[Callable[[str], None]] = None, **kwargs) -> str:
+    # create_completionのasyncio版（AsyncOpenAIクライアントを渡す）。相乗りはイベントループごとに行う
+    raise_if_cancelled()
+    key = (id(asyncio.get_running_loop()), _flight_key(client, model, messages, max_tokens, kwargs))
+    flight = _aflights.get(key)
+    if flight is not None:
+        if on_delta is None:
+            await asyncio.shield(flight.future)
+        else:
+            cancelled = asyncio.get_running_loop().create_future()
+            listener = flight.subscribe(on_delta, cancelled)
+            await asyncio.wait([asyncio.shield(flight.future), cancelled], return_when=asyncio.FIRST_COMPLETED)
+            if listener.error is not None:
+                raise listener.error
+        if not flight.failed:
+            return flight.result
+        flight.raise_if_permanent()
+        return await acreate_completion(client, model, messages, max_tokens, on_delta, **kwargs)
+
+    flight = _aflights[key] = _Flight()
+    flight.future = asyncio.get_running_loop().create_future()
+
+    def publish(delta):
+        if on_delta is not None:
+            on_delta(delta)
+        flight.publish(delta)
+
+    try:
+        flight.result = await _arequest_completion(
+            client, model, messages, max_tokens, publish if on_delta is not None else None, **kwargs
+        )
+        return flight.result
+    except BaseException as e:
+        flight.fail(e)
+        raise
+    finally:
+        _aflights.pop(key, None)
+        flight.future.set_result(None)
+
+async def _arequest_completion(client, model: str, messages: list, max_tokens: int = 1000,
+                               on_delta: Optional[Callable[[str], None]] = None, **kwargs) -> str:
+    with tracer.span('completion', model=model, stream=on_delta is not None, bytes=_payload_bytes(messages)):
+        return await _agoverned_completion(client, model, messages, max_tokens, on_delta, **kwargs)
+
+async def _agoverned_completion(client, model: str, messages: list, max_tokens: int,
+                                on_delta: Optional[Callable[[str], None]], **kwargs) -> str:
+    governor = governor_for(client)
+    if governor is None:
+        return await _asend_completion(client.chat.completions.create, model, messages, max_tokens, on_delta, None, **kwargs)
+    create = client.chat.completions.with_raw_response.create
+    return await governor.arun(
+        model,
+        _estimate_tokens(messages, max_tokens),
+        lambda attempt: _asend_completion(create, model, messages, max_tokens, on_delta, attempt, **kwargs)
+    )
+
+async def _asend_completion(create, model: str, messages: list, max_tokens: int,
+                            on_delta: Optional[Callable[[str], None]], attempt: Optional[RequestAttempt], **kwargs) -> str:
+    raise_if_cancelled()
+    if on_delta is not None:
+        kwargs['stream'] = True
+        if tracer.enabled and not _stream_usage_rejected:
+            kwargs['stream_options'] = {'include_usage': True}
+    started = time.perf_counter()
+    try:
+        response = await create(model=model, messages=messages, max_tokens=max_tokens, **kwargs)
+    except Exception as e:
+        if not _stream_options_rejected(e, kwargs):
+            raise
+        response = await create(model=model, messages=messages, max_tokens=max_tokens, **kwargs)
+    if attempt is not None:
+        attempt.headers = response.headers
+        response = response.parse()
+    
+    if on_delta is None:
+        _record_usage(getattr(response, 'usage', None))
+        return response.choices[0].message.content
+    
+    parts = []
+    async for chunk in response:
+        _record_usage(getattr(chunk, 'usage', None))
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            if not parts:
+                tracer.annotate(first_token_ms=round((time.perf_counter() - started) * 1000, 1))
+            parts.append(delta)
+            if attempt is not None:
+                attempt.streamed = True
+            on_delta(delta)
+    return ''.join(parts)
@@ -0,0 +1,36 @@
+from .client import create_client, create_async_client
+from .ocr_service import OCRService
+from .pipeline_service import PipelineService
+from .summary_service import SummaryService
+from .translation_service import TranslationService
+from .vision_service import VisionService
+from ..utils.result_cache import ResultCache
+from ..utils.translation_memory import TranslationMemory
+
+class ServiceContainer:
+    # APIクライアント（接続プール）と結果キャッシュを全サービスで共有する
+    def __init__(self, config):
+        self.config = config
+        self.cache = ResultCache.from_config(config) if config.cache_enabled else None
+        self.translation_memory = (
+            TranslationMemory.from_config(config) if config.translation_memory_enabled else None
+        )
+        self.client = create_client(config)
+        self.async_client = create_async_client(config)
+        
+        shared = {'client': self.client, 'async_client': self.async_client}
+        self.ocr = OCRService(config, cache=self.cache, **shared)
+        self.summary = SummaryService(config, cache=self.cache, **shared)
+        self.translation = TranslationService(config, memory=self.translation_memory, **shared)
+        self.vision = VisionService(config, cache=self.cache, **shared)
+        self.pipeline = PipelineService(
+            config, self.ocr, self.summary, self.translation, cache=self.cache, **shared
+        )
+
+    def close(self):
+        self.client.close()
+        if self.translation_memory is not None:
+            self.translation_memory.close()
+
+    async def aclose(self):
+        await self.async_client.close()
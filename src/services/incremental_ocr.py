@@ -0,0 +1,107 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from .completion import RequestCancelled, bind_context
+from ..utils.frame_diff import changed_regions, plan_bands
+from ..utils.tiling import is_blank
+
+class IncrementalOCR:
+    # 同じ範囲を繰り返しキャプチャする場合に、変化した帯だけをOCRし直して前回の結果に差し込む
+    def __init__(self, ocr_service, lang='ja', band_height=384, pixel_tolerance=12,
+                 full_refresh_ratio=0.6, max_workers=4):
+        self.ocr_service = ocr_service
+        self.lang = lang
+        self.band_height = band_height
+        self.pixel_tolerance = pixel_tolerance
+        self.full_refresh_ratio = full_refresh_ratio
+        self.max_workers = max_workers
+        self._previous = None
+        self._bands = []
+        self._texts = {}
+        # OCRに失敗した帯（画面が変わらなくても次の更新で再試行する）
+        self._failed = set()
+        self._lock = threading.Lock()
+        self.last_ocr_pixels = 0
+
+    @classmethod
+    def from_config(cls, config, ocr_service) -> 'IncrementalOCR':
+        return cls(
+            ocr_service,
+            band_height=config.incremental_band_height,
+            pixel_tolerance=config.dedup_pixel_tolerance,
+            max_workers=config.ocr_tile_workers
+        )
+
+    @property
+    def text(self) -> str:
+        return '\n'.join(self._texts[band] for band in self._bands if self._texts.get(band))
+
+    def reset(self):
+        with self._lock:
+            self._previous = None
+            self._bands = []
+            self._texts = {}
+            self._failed = set()
+
+    def update(self, image: Image.Image) -> str:
+        with self._lock:
+            gray = np.asarray(image.convert('L'), dtype=np.int16)
+
+            if self._previous is None or self._previous.shape != gray.shape:
+                self._refresh(image, gray)
+                return self.text
+
+            regions = changed_regions(self._previous, gray, pixel_tolerance=self.pixel_tolerance)
+            self._previous = gray
+            if not regions and not self._failed:
+                self.last_ocr_pixels = 0
+                return self.text
+
+            dirty = [
+                band for band in self._bands
+                if band in self._failed or any(top < band[1] and bottom > band[0] for _, top, _, bottom in regions)
+            ]
+            dirty_height = sum(bottom - top for top, bottom in dirty)
+            # スクロールなどで大部分が変わった場合は帯を作り直して全体をOCRする
+            if dirty_height > gray.shape[0] * self.full_refresh_ratio:
+                self._refresh(image, gray)
+            else:
+                self._ocr_bands(image, dirty)
+            return self.text
+
+    def _refresh(self, image: Image.Image, gray: np.ndarray):
+        self._previous = gray
+        self._bands = plan_bands(gray, self.band_height)
+        self._texts = {}
+        self._failed = set()
+        self._ocr_bands(image, self._bands)
+
+    def _ocr_bands(self, image: Image.Image, bands):
+        crops = {band: image.crop((0, band[0], image.width, band[1])) for band in bands}
+        targets = {band: crop for band, crop in crops.items() if not is_blank(crop)}
+        for band in crops:
+            if band not in targets:
+                self._texts[band] = ''
+        self.last_ocr_pixels = sum(crop.width * crop.height for crop in targets.values())
+        if not targets:
+            return
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(targets))) as executor:
+            futures = {
+                band: executor.submit(bind_context(self.ocr_service.perform_ocr), crop, self.lang)
+                for band, crop in targets.items()
+            }
+            error = None
+            for band, future in futures.items():
+                try:
+                    self._texts[band] = (future.result() or '').strip()
+                    self._failed.discard(band)
+                except (Exception, RequestCancelled) as e:
+                    # 失敗・取り消しした帯は古いテキストのまま残し、次の更新で差分がなくても再試行する
+                    self._failed.add(band)
+                    error = error or e
+        if error is not None:
+            raise error
@@ -0,0 +1,119 @@
+import importlib.util
+import re
+import shutil
+from typing import Optional
+
+from PIL import Image
+
+# OCRServiceの言語指定からTesseractの言語コードへの対応（画面には英数字が混ざるので英語も併用）
+TESSERACT_LANGS = {
+    'ja': 'jpn+eng',
+    'en': 'eng',
+    'zh': 'chi_sim+eng',
+    'ko': 'kor+eng'
+}
+
+CJK_SPACE = re.compile(r'(?<=[　-ヿ㐀-鿿＀-￯]) (?=[　-ヿ㐀-鿿＀-￯])')
+
+class OCRResult:
+    def __init__(self, text: str, confidence: Optional[float], engine: str):
+        self.text = text
+        self.confidence = confidence
+        self.engine = engine
+
+class OCRBackend:
+    name = 'base'
+
+    def available(self) -> bool:
+        return True
+
+    def recognize(self, image: Image.Image, lang: str = 'ja') -> OCRResult:
+        raise NotImplementedError
+
+class TesseractBackend(OCRBackend):
+    # ローカルのTesseractによるOCR（pytesseractとtesseract本体が必要）
+    name = 'tesseract'
+
+    def __init__(self, langs: Optional[str] = None):
+        self.langs = langs
+
+    def available(self) -> bool:
+        return importlib.util.find_spec('pytesseract') is not None and shutil.which('tesseract') is not None
+
+    def recognize(self, image: Image.Image, lang: str = 'ja') -> OCRResult:
+        import pytesseract
+        langs = self.langs or TESSERACT_LANGS.get(lang, lang)
+        data = pytesseract.image_to_data(
+            image.convert('L'), lang=langs, output_type=pytesseract.Output.DICT
+        )
+
+        lines = {}
+        weighted = 0.0
+        total = 0
+        for i, word in enumerate(data['text']):
+            word = word.strip()
+            confidence = float(data['conf'][i])
+            if not word or confidence < 0:
+                continue
+            key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+            lines.setdefault(key, []).append(word)
+            # 長い単語ほど信頼度への寄与を大きくする
+            weighted += confidence * len(word)
+            total += len(word)
+
+        text = '\n'.join(CJK_SPACE.sub('', ' '.join(words)) for _, words in sorted(lines.items()))
+        confidence = weighted / total / 100 if total else 0.0
+        return OCRResult(text, confidence, self.name)
+
+LOCAL_BACKENDS = {
+    'tesseract': TesseractBackend
+}
+
+class OCRRouter:
+    # ローカルOCRの信頼度を見て、そのまま使うかリモートのモデルに回すかを決める
+    def __init__(self, backend: OCRBackend, mode: str = 'auto', min_confidence: float = 0.8, min_chars: int = 1):
+        self.backend = backend
+        self.mode = mode
+        self.min_confidence = min_confidence
+        self.min_chars = min_chars
+        self.local_count = 0
+        self.escalated_count = 0
+
+    @classmethod
+    def from_config(cls, config) -> Optional['OCRRouter']:
+        if config.ocr_engine == 'remote':
+            return None
+        backend_class = LOCAL_BACKENDS.get(config.ocr_local_backend)
+        if backend_class is None:
+            print(f"Unknown local OCR backend: {config.ocr_local_backend}")
+            return None
+        backend = backend_class(config.ocr_local_langs)
+        if not backend.available():
+            print(f"Local OCR backend '{backend.name}' is not available; using the remote model")
+            return None
+        return cls(backend, config.ocr_engine, config.ocr_local_min_confidence)
+
+    def accept(self, result: OCRResult) -> bool:
+        if self.mode == 'local':
+            return True
+        return (
+            result.confidence is not None
+            and result.confidence >= self.min_confidence
+            and len(result.text.strip()) >= self.min_chars
+        )
+
+    def try_local(self, image: Image.Image, lang: str) -> Optional[OCRResult]:
+        # 採用できる場合は結果を、リモートに回すべき場合はNoneを返す
+        try:
+            result = self.backend.recognize(image, lang)
+        except Exception as e:
+            print(f"Error in local OCR: {e}")
+            if self.mode == 'local':
+                raise
+            self.escalated_count += 1
+            return None
+        if self.accept(result):
+            self.local_count += 1
+            return result
+        self.escalated_count += 1
+        return None
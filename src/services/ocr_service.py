@@ -1,41 +1,329 @@
-from openai import OpenAI
-import base64
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
 from PIL import Image
-import io
+from .client import create_client, create_async_client
+from .completion import create_completion, acreate_completion, bind_context, image_messages, multi_image_messages
+from .ocr_backends import OCRRouter
+from ..utils.image_encoding import EncodingProfile, encode_image
+from ..utils.tiling import plan_tiles, is_blank, merge_tile_texts
+from ..utils.tracing import traced
 
 class OCRService:
-    def __init__(self, config):
-        self.client = OpenAI(api_key=config.openai_api_key)
+    def __init__(self, config, cache=None, client=None, async_client=None):
+        self.config = config
+        self.client = client if client is not None else create_client(config)
+        self._async_client = async_client
         self.vision_model = config.vision_model
+        self.cache = cache
+        self.image_profile = EncodingProfile.from_config(config, 'ocr')
+        self.tiling = config.ocr_tiling
+        self.tile_threshold = config.ocr_tile_threshold
+        self.tile_size = config.ocr_tile_size
+        self.tile_overlap = config.ocr_tile_overlap
+        self.tile_workers = config.ocr_tile_workers
+        self.batch_size = config.batch_size
+        self.batch_max_dimension = config.batch_max_image_dimension
+        # OCR_ENGINEがremote以外ならローカルOCRを先に試し、信頼度が低い場合だけモデルに送る
+        self.router = OCRRouter.from_config(config)
 
-    def image_to_base64(self, image: Image.Image) -> str:
-        buffered = io.BytesIO()
-        image.save(buffered, format="PNG")
-        return base64.b64encode(buffered.getvalue()).decode('utf-8')
-
-    def perform_ocr(self, image: Image.Image, lang='ja') -> str:
-        base64_image = self.image_to_base64(image)
-        
-        response = self.client.chat.completions.create(
-            model=self.vision_model,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": f"この画像内のテキストを{lang}で抽出してください。レイアウトは保持せず、テキストのみを出力してください。"
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=1000
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = create_async_client(self.config)
+        return self._async_client
+
+    def _prompt(self, lang: str) -> str:
+        return f"この画像内のテキストを{lang}で抽出してください。レイアウトは保持せず、テキストのみを出力してください。"
+
+    def _tile_prompt(self, lang: str) -> str:
+        return (
+            f"この画像は画面の一部を切り出したものです。画像内のテキストを{lang}で抽出してください。"
+            "レイアウトは保持せず、テキストのみを出力してください。テキストがない場合は何も出力しないでください。"
+        )
+
+    def _batch_prompt(self, lang: str, count: int) -> str:
+        return (
+            f"{count}枚の画像が順に添付されています。各画像内のテキストを{lang}で抽出してください。"
+            "レイアウトは保持せず、テキストのみを抽出し、テキストがない画像は空文字列にしてください。"
+            f'結果は {{"results": [1枚目のテキスト, 2枚目のテキスト, ...]}} の形で、要素数が{count}のJSONオブジェクトのみで出力してください。'
         )
+
+    @traced('service.ocr')
+    def perform_ocr(self, image: Image.Image, lang='ja', on_delta=None) -> str:
+        # キャッシュにあればローカルOCRも試さずに返す
+        cache_key, cached = self._remote_lookup(image, lang)
+        if cached is not None:
+            return cached
+        local = self._try_local(image, lang)
+        if local is not None:
+            return local
+        return self._perform_remote_ocr(image, lang, cache_key, on_delta)
+
+    @traced('service.ocr')
+    async def aperform_ocr(self, image: Image.Image, lang='ja', on_delta=None) -> str:
+        cache_key, cached = await asyncio.to_thread(self._remote_lookup, image, lang)
+        if cached is not None:
+            return cached
+        local = await asyncio.to_thread(self._try_local, image, lang)
+        if local is not None:
+            return local
+        return await self._aperform_remote_ocr(image, lang, cache_key, on_delta)
+
+    def _try_local(self, image: Image.Image, lang: str):
+        if self.router is None:
+            return None
+        local = self.router.try_local(image, lang)
+        return local.text if local is not None else None
+
+    def _remote_lookup(self, image: Image.Image, lang: str):
+        # タイル分割する画像は結合後の全文をキャッシュしている
+        if self.should_tile(image):
+            return self._lookup(self._tiled_cache_name(), image, self._tile_prompt(lang), lang)
+        return self._lookup('ocr', image, self._prompt(lang), lang)
+
+    def _perform_remote_ocr(self, image: Image.Image, lang: str, cache_key, on_delta=None) -> str:
+        # タイル分割時は各タイルの結果が順不同で届くため、結合後の全文のみを返す
+        if self.should_tile(image):
+            return self._ocr_tiles(self._tile_prompt(lang), cache_key, self._tiles(image), lang)
+        return self._request_ocr(image, self._prompt(lang), cache_key, on_delta)
+
+    async def _aperform_remote_ocr(self, image: Image.Image, lang: str, cache_key, on_delta=None) -> str:
+        if self.should_tile(image):
+            tiles = await asyncio.to_thread(self._tiles, image)
+            return await self._aocr_tiles(self._tile_prompt(lang), cache_key, tiles, lang)
+        return await self._arequest_ocr(image, self._prompt(lang), cache_key, on_delta)
+
+    def _complete(self, request: dict) -> str:
+        return create_completion(self.client, self.vision_model, **request)
+
+    async def _acomplete(self, request: dict) -> str:
+        return await acreate_completion(self.async_client, self.vision_model, **request)
+
+    @traced('service.ocr_batch')
+    def perform_ocr_batch(self, images: List[Image.Image], lang='ja') -> List[str]:
+        # 小さな画像はBATCH_SIZE枚ずつ1回のリクエストにまとめ、結果を画像ごとに分けて返す
+        results, pending, single = self._route_batch(images, lang)
+        for index, image, cache_key in single:
+            results[index] = self._perform_remote_ocr(image, lang, cache_key)
+        
+        groups = self._batches(pending)
+        if groups:
+            with ThreadPoolExecutor(max_workers=min(self.tile_workers, len(groups))) as executor:
+                texts = list(executor.map(bind_context(lambda group: self._ocr_batch(group, lang)), groups))
+            self._fill_batches(results, groups, texts)
+        return results
+
+    @traced('service.ocr_batch')
+    async def aperform_ocr_batch(self, images: List[Image.Image], lang='ja') -> List[str]:
+        results, pending, single = await asyncio.to_thread(self._route_batch, images, lang)
+        for index, image, cache_key in single:
+            results[index] = await self._aperform_remote_ocr(image, lang, cache_key)
+        
+        semaphore = asyncio.Semaphore(self.tile_workers)
+        
+        async def ocr_batch(group):
+            async with semaphore:
+                return await self._aocr_batch(group, lang)
+        
+        groups = self._batches(pending)
+        self._fill_batches(results, groups, await asyncio.gather(*(ocr_batch(group) for group in groups)))
+        return results
+
+    def _route_batch(self, images: List[Image.Image], lang: str):
+        # キャッシュとローカルOCR（この順に試す）で済む画像は結果を埋め、残りをまとめて送るもの（pending）と1枚ずつ送るもの（single）に分ける
+        results = [None] * len(images)
+        pending = []
+        single = []
+        for index, image in enumerate(images):
+            batchable = self._batchable(image)
+            if batchable:
+                cache_key, cached = self._lookup('ocr', image, self._prompt(lang), lang)
+            else:
+                cache_key, cached = self._remote_lookup(image, lang)
+            if cached is None:
+                cached = self._try_local(image, lang)
+            if cached is not None:
+                results[index] = cached
+            elif batchable:
+                pending.append((index, image, cache_key))
+            else:
+                single.append((index, image, cache_key))
+        return results, pending, single
+
+    def _fill_batches(self, results: list, groups: list, texts: list):
+        for group, group_texts in zip(groups, texts):
+            for (index, _, _), text in zip(group, group_texts):
+                results[index] = text
+
+    def _batchable(self, image: Image.Image) -> bool:
+        return self.batch_size > 1 and max(image.width, image.height) <= self.batch_max_dimension
+
+    def _batches(self, pending: list) -> list:
+        return [pending[start:start + self.batch_size] for start in range(0, len(pending), self.batch_size)]
+
+    def _parse_batch(self, content, count: int):
+        try:
+            results = json.loads(content)['results']
+        except (TypeError, ValueError, KeyError):
+            return None
+        if not isinstance(results, list) or len(results) != count:
+            return None
+        if not all(isinstance(text, str) for text in results):
+            return None
+        return results
+
+    def _batch_request(self, group: list, lang: str) -> dict:
+        encoded_images = [encode_image(image, self.image_profile) for _, image, _ in group]
+        return {
+            'messages': multi_image_messages(
+                self._batch_prompt(lang, len(group)),
+                [encoded_image.data_url for encoded_image in encoded_images]
+            ),
+            'max_tokens': min(4000, 1000 * len(group)),
+            'response_format': {"type": "json_object"}
+        }
+
+    def _store_batch(self, group: list, content):
+        # 画像ごとの対応が取れない場合はNoneを返し、呼び出し側で1枚ずつ処理し直す
+        texts = self._parse_batch(content, len(group))
+        if texts is None:
+            return None
+        return [self._store(cache_key, text) for (_, _, cache_key), text in zip(group, texts)]
+
+    def _ocr_batch(self, group: list, lang: str) -> List[str]:
+        if len(group) == 1:
+            _, image, cache_key = group[0]
+            return [self._request_ocr(image, self._prompt(lang), cache_key)]
+        
+        try:
+            content = self._complete(self._batch_request(group, lang))
+        except Exception as e:
+            print(f"Error in batched OCR request: {e}")
+            content = None
+        
+        texts = self._store_batch(group, content)
+        if texts is None:
+            return [self._request_ocr(image, self._prompt(lang), cache_key) for _, image, cache_key in group]
+        return texts
+
+    async def _aocr_batch(self, group: list, lang: str) -> List[str]:
+        if len(group) == 1:
+            _, image, cache_key = group[0]
+            return [await self._arequest_ocr(image, self._prompt(lang), cache_key)]
+        
+        try:
+            content = await self._acomplete(await asyncio.to_thread(self._batch_request, group, lang))
+        except Exception as e:
+            print(f"Error in batched OCR request: {e}")
+            content = None
+        
+        texts = await asyncio.to_thread(self._store_batch, group, content)
+        if texts is None:
+            return [await self._arequest_ocr(image, self._prompt(lang), cache_key) for _, image, cache_key in group]
+        return texts
+
+    def perform_tiled_ocr(self, image: Image.Image, lang='ja') -> str:
+        # 大きな画像は重なりのあるタイルに分割して並列にOCRし、読み順に結合する
+        prompt, cache_key, cached, tiles = self._plan_tiled(image, lang)
+        if cached is not None:
+            return cached
+        return self._ocr_tiles(prompt, cache_key, tiles, lang)
+
+    def _ocr_tiles(self, prompt: str, cache_key, tiles: list, lang: str) -> str:
+        if not tiles:
+            return ''
+        
+        with ThreadPoolExecutor(max_workers=min(self.tile_workers, len(tiles))) as executor:
+            results = list(executor.map(bind_context(lambda tile: self._ocr_image(tile, prompt, lang)), [tile for _, tile in tiles]))
+        return self._store_tiled(cache_key, tiles, results)
+
+    async def aperform_tiled_ocr(self, image: Image.Image, lang='ja') -> str:
+        prompt, cache_key, cached, tiles = await asyncio.to_thread(self._plan_tiled, image, lang)
+        if cached is not None:
+            return cached
+        return await self._aocr_tiles(prompt, cache_key, tiles, lang)
+
+    async def _aocr_tiles(self, prompt: str, cache_key, tiles: list, lang: str) -> str:
+        if not tiles:
+            return ''
+        
+        semaphore = asyncio.Semaphore(self.tile_workers)
+        
+        async def ocr_tile(tile):
+            async with semaphore:
+                return await self._aocr_image(tile, prompt, lang)
         
-        return response.choices[0].message.content 
\ No newline at end of file
+        results = await asyncio.gather(*(ocr_tile(tile) for _, tile in tiles))
+        return await asyncio.to_thread(self._store_tiled, cache_key, tiles, results)
+
+    def _plan_tiled(self, image: Image.Image, lang: str):
+        # キャッシュにあればタイルは切り出さない
+        prompt = self._tile_prompt(lang)
+        cache_key, cached = self._lookup(self._tiled_cache_name(), image, prompt, lang)
+        if cached is not None:
+            return prompt, cache_key, cached, []
+        return prompt, cache_key, None, self._tiles(image)
+
+    def _store_tiled(self, cache_key, tiles: list, results: list) -> str:
+        texts = {position: text for (position, _), text in zip(tiles, results)}
+        return self._store(cache_key, merge_tile_texts(texts))
+
+    def should_tile(self, image: Image.Image) -> bool:
+        if self.tiling == 'off':
+            return False
+        if self.tiling == 'on':
+            return True
+        return max(image.width, image.height) > self.tile_threshold
+
+    def _tiled_cache_name(self) -> str:
+        return f'ocr_tiled:{self.tile_size}:{self.tile_overlap}'
+
+    def _tiles(self, image: Image.Image):
+        tiles = []
+        for row, col, box in plan_tiles(image.width, image.height, self.tile_size, self.tile_overlap):
+            tile = image.crop(box)
+            if not is_blank(tile):
+                tiles.append(((row, col), tile))
+        return tiles
+
+    def _lookup(self, name: str, image: Image.Image, prompt: str, lang: str):
+        if self.cache is None:
+            return None, None
+        cache_key = self.cache.make_key(name, image, prompt, lang, self.vision_model)
+        return cache_key, self.cache.get(cache_key)
+
+    def _store(self, cache_key, result: str) -> str:
+        if cache_key is not None and result:
+            self.cache.set(cache_key, result)
+        return result
+
+    def _image_request(self, image: Image.Image, prompt: str, on_delta=None) -> dict:
+        encoded_image = encode_image(image, self.image_profile)
+        return {
+            'messages': image_messages(prompt, encoded_image.data_url),
+            'max_tokens': 1000,
+            'on_delta': on_delta
+        }
+
+    def _ocr_image(self, image: Image.Image, prompt: str, lang: str, on_delta=None) -> str:
+        cache_key, cached = self._lookup('ocr', image, prompt, lang)
+        if cached is not None:
+            return cached
+        return self._request_ocr(image, prompt, cache_key, on_delta)
+
+    async def _aocr_image(self, image: Image.Image, prompt: str, lang: str, on_delta=None) -> str:
+        # 画像のハッシュ計算とディスクキャッシュの読み書きはイベントループを止めないよう別スレッドで行う
+        cache_key, cached = await asyncio.to_thread(self._lookup, 'ocr', image, prompt, lang)
+        if cached is not None:
+            return cached
+        return await self._arequest_ocr(image, prompt, cache_key, on_delta)
+
+    def _request_ocr(self, image: Image.Image, prompt: str, cache_key, on_delta=None) -> str:
+        # キャッシュを引いた後に呼ぶ（同じ画像のハッシュを二度計算しない）
+        return self._store(cache_key, self._complete(self._image_request(image, prompt, on_delta)))
+
+    async def _arequest_ocr(self, image: Image.Image, prompt: str, cache_key, on_delta=None) -> str:
+        request = await asyncio.to_thread(self._image_request, image, prompt, on_delta)
+        return await asyncio.to_thread(self._store, cache_key, await self._acomplete(request))
@@ -0,0 +1,136 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from .client import create_client, create_async_client
+from .completion import create_completion, acreate_completion, bind_context, image_messages, raise_if_cancelled
+from ..utils.image_encoding import EncodingProfile, encode_image
+from ..utils.tracing import traced
+
+RESULT_KEYS = ('ocr', 'summary', 'translation')
+
+class PipelineService:
+    # OCR・要約・翻訳を1回のリクエストでまとめて取得する（解析に失敗した場合は個別に呼び出す）
+    def __init__(self, config, ocr_service, summary_service, translation_service,
+                 cache=None, client=None, async_client=None):
+        self.config = config
+        self.client = client if client is not None else create_client(config)
+        self._async_client = async_client
+        self.vision_model = config.vision_model
+        self.cache = cache
+        self.image_profile = EncodingProfile.from_config(config, 'ocr')
+        self.ocr_service = ocr_service
+        self.summary_service = summary_service
+        self.translation_service = translation_service
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = create_async_client(self.config)
+        return self._async_client
+
+    def _prompt(self, lang: str) -> str:
+        return (
+            f"この画像内のテキストを{lang}で抽出し、その要約と翻訳を作成してください。"
+            "翻訳は抽出したテキストが日本語なら英語に、それ以外なら日本語に翻訳してください。"
+            '結果は次のキーを持つJSONオブジェクトのみで出力してください: '
+            '{"ocr": 抽出したテキスト（レイアウトは保持しない）, "summary": 要約, "translation": 翻訳}'
+        )
+
+    def _lookup(self, image: Image.Image, prompt: str, lang: str):
+        if self.cache is None:
+            return None, None
+        cache_key = self.cache.make_key('pipeline', image, prompt, lang, self.vision_model)
+        cached = self.cache.get(cache_key)
+        return cache_key, self._parse(cached) if cached is not None else None
+
+    def _store(self, cache_key, results: dict) -> dict:
+        if cache_key is not None:
+            self.cache.set(cache_key, json.dumps(results, ensure_ascii=False))
+        return results
+
+    def _parse(self, content) -> dict:
+        try:
+            data = json.loads(content)
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(data, dict) or not all(isinstance(data.get(key), str) for key in RESULT_KEYS):
+            return None
+        return {key: data[key] for key in RESULT_KEYS}
+
+    def _request(self, image: Image.Image, prompt: str) -> dict:
+        encoded_image = encode_image(image, self.image_profile)
+        return {
+            'messages': image_messages(prompt, encoded_image.data_url),
+            'max_tokens': 3000,
+            'response_format': {"type": "json_object"}
+        }
+
+    @traced('service.pipeline')
+    def analyze_all(self, image: Image.Image, lang='ja') -> dict:
+        # タイル分割が必要な大きな画像は1回のリクエストでは文字が潰れるため個別に処理する
+        # ローカルOCRを使う場合も、画像を送らずに抽出したテキストだけで要約・翻訳する
+        if self.ocr_service.should_tile(image) or self.ocr_service.router is not None:
+            return self._analyze_separately(image, lang)
+        
+        prompt = self._prompt(lang)
+        cache_key, cached = self._lookup(image, prompt, lang)
+        if cached is not None:
+            return cached
+        
+        try:
+            content = create_completion(self.client, self.vision_model, **self._request(image, prompt))
+        except Exception as e:
+            print(f"Error in combined request: {e}")
+            content = None
+        
+        results = self._parse(content)
+        if results is None:
+            return self._analyze_separately(image, lang)
+        return self._store(cache_key, results)
+
+    @traced('service.pipeline')
+    async def aanalyze_all(self, image: Image.Image, lang='ja') -> dict:
+        if self.ocr_service.should_tile(image) or self.ocr_service.router is not None:
+            return await self._aanalyze_separately(image, lang)
+        
+        prompt = self._prompt(lang)
+        cache_key, cached = await asyncio.to_thread(self._lookup, image, prompt, lang)
+        if cached is not None:
+            return cached
+        
+        request = await asyncio.to_thread(self._request, image, prompt)
+        try:
+            content = await acreate_completion(self.async_client, self.vision_model, **request)
+        except Exception as e:
+            print(f"Error in combined request: {e}")
+            content = None
+        
+        results = self._parse(content)
+        if results is None:
+            return await self._aanalyze_separately(image, lang)
+        return await asyncio.to_thread(self._store, cache_key, results)
+
+    def _analyze_separately(self, image: Image.Image, lang: str) -> dict:
+        text = self.ocr_service.perform_ocr(image, lang)
+        if not text:
+            return {key: '' for key in RESULT_KEYS}
+        # OCRの間に取り消されていれば要約・翻訳は始めない
+        raise_if_cancelled()
+        
+        # 要約と翻訳は互いに依存しないので並列に実行する
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            summary = executor.submit(bind_context(self.summary_service.summarize_text), text)
+            translation = executor.submit(bind_context(self.translation_service.translate_text), text)
+            return {'ocr': text, 'summary': summary.result(), 'translation': translation.result()}
+
+    async def _aanalyze_separately(self, image: Image.Image, lang: str) -> dict:
+        text = await self.ocr_service.aperform_ocr(image, lang)
+        if not text:
+            return {key: '' for key in RESULT_KEYS}
+        
+        summary, translation = await asyncio.gather(
+            self.summary_service.asummarize_text(text),
+            self.translation_service.atranslate_text(text)
+        )
+        return {'ocr': text, 'summary': summary, 'translation': translation}
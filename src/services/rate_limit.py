@@ -0,0 +1,367 @@
+import asyncio
+import email.utils
+import random
+import re
+import threading
+import time
+import weakref
+from typing import Callable, Optional
+
+import openai
+
+from ..utils.tracing import tracer
+
+DURATION = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+# 一時的な失敗とみなして再試行するHTTPステータス
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+class RequestDeadlineExceeded(Exception):
+    pass
+
+def is_permanent_error(error: BaseException) -> bool:
+    # 同じリクエストを送り直しても結果が変わらない失敗（不正なリクエスト・認証エラーなど）
+    return isinstance(error, openai.APIStatusError) and error.status_code not in RETRY_STATUSES
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    # x-ratelimit-reset-* の "1s" / "6m0s" / "120ms" 形式を秒に変換する
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+
+def parse_retry_after(headers) -> Optional[float]:
+    if headers is None:
+        return None
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time()) if date else None
+
+def _wake(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+def _header_int(headers, name: str) -> Optional[int]:
+    try:
+        return int(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket:
+    # 1分あたりの上限から毎秒補充する。サーバーの残量ヘッダーが届いたらそちらに合わせる
+    def __init__(self, capacity: float):
+        self.capacity = capacity
+        self.rate = capacity / 60
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+    def sync(self, limit: Optional[int], remaining: Optional[int], now: float):
+        if limit:
+            self.capacity = float(limit)
+            self.rate = self.capacity / 60
+        if remaining is not None:
+            self._refill(now)
+            self.tokens = min(self.tokens, float(remaining))
+
+class ModelLimiter:
+    # モデルごとの同時実行数（AIMD）とリクエスト数・トークン数のバケット
+    def __init__(self, initial_concurrency: int = 4, max_concurrency: int = 16, min_concurrency: int = 1):
+        self.limit = float(initial_concurrency)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.active = 0
+        self.requests = None
+        self.tokens = None
+        self.blocked_until = 0.0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+        # 空きを待っている非同期の呼び出し（イベントループとFuture）。releaseで起こす
+        self._waiters = []
+
+    def _try_acquire(self, tokens: int) -> Optional[float]:
+        # 取得できれば0、できなければ待つべき秒数を返す（呼び出し側でロックを持つ）
+        # 同時実行数の空き待ちは他のリクエストの完了で起こされるため、Noneを返す
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.active >= int(self.limit):
+            return None
+        waits = [
+            bucket.wait_time(amount, now)
+            for bucket, amount in ((self.requests, 1), (self.tokens, tokens))
+            if bucket is not None
+        ]
+        if waits and max(waits) > 0:
+            return max(waits)
+        for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+            if bucket is not None:
+                bucket.consume(amount)
+        self.active += 1
+        return 0.0
+
+    def _wait_time(self, wait: Optional[float], deadline: float) -> float:
+        # 期限までに取得できる見込みがなければ待たずに諦める（空き待ちは起こされるまで、最長で期限まで待つ）
+        now = time.monotonic()
+        if wait is None:
+            wait = deadline - now
+            if wait <= 0:
+                raise RequestDeadlineExceeded("レート制限の待ち時間が期限を超えました")
+        elif now + wait > deadline:
+            raise RequestDeadlineExceeded("レート制限の待ち時間が期限を超えました")
+        return wait
+
+    def acquire(self, tokens: int, deadline: float):
+        with self.condition:
+            while True:
+                wait = self._try_acquire(tokens)
+                if wait == 0:
+                    return
+                self.condition.wait(self._wait_time(wait, deadline))
+
+    async def aacquire(self, tokens: int, deadline: float):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.condition:
+                wait = self._try_acquire(tokens)
+                if wait == 0:
+                    return
+                timeout = self._wait_time(wait, deadline)
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+            try:
+                await asyncio.wait_for(waiter, timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self.condition:
+                    if (loop, waiter) in self._waiters:
+                        self._waiters.remove((loop, waiter))
+
+    def release(self, headers=None, rate_limited: bool = False):
+        now = time.monotonic()
+        with self.condition:
+            self.active -= 1
+            if rate_limited:
+                # 制限に当たったら同時実行数を半分にし、指定があればその時間は新しいリクエストを止める
+                # （同時に返ってきた429で何度も半減しないよう、減らすのは1秒に1回まで）
+                if now - self.last_decrease >= 1.0:
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    self.last_decrease = now
+                retry_after = parse_retry_after(headers)
+                if retry_after:
+                    self.blocked_until = max(self.blocked_until, now + retry_after)
+            elif headers is not None:
+                # 成功するたびに少しずつ同時実行数を増やす
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            if headers is not None:
+                self._sync(headers, now)
+            self.condition.notify_all()
+            waiters, self._waiters = self._waiters, []
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:
+                # 待っていたイベントループが既に閉じている
+                pass
+
+    def _sync(self, headers, now: float):
+        for name in ('requests', 'tokens'):
+            limit = _header_int(headers, f'x-ratelimit-limit-{name}')
+            remaining = _header_int(headers, f'x-ratelimit-remaining-{name}')
+            if limit is None and remaining is None:
+                continue
+            bucket = getattr(self, name)
+            if bucket is None:
+                if not limit:
+                    continue
+                bucket = TokenBucket(limit)
+                setattr(self, name, bucket)
+            bucket.sync(limit, remaining, now)
+            # 残量が尽きている場合はリセットまで待つ
+            if remaining == 0:
+                reset = parse_duration(headers.get(f'x-ratelimit-reset-{name}'))
+                if reset:
+                    self.blocked_until = max(self.blocked_until, now + reset)
+
+class RequestAttempt:
+    # 1回の送信の状態（レスポンスヘッダーと、ストリームの断片を既に通知したか）
+    def __init__(self):
+        self.headers = None
+        self.streamed = False
+
+class RequestGovernor:
+    # 全サービスのAPI呼び出しに共通の流量制御・再試行
+    def __init__(self, max_retries: int = 5, base_delay: float = 0.5, max_delay: float = 30.0,
+                 deadline: float = 120.0, initial_concurrency: int = 4, max_concurrency: int = 16):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self._limiters = {}
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.rate_limited = 0
+
+    @classmethod
+    def from_config(cls, config) -> 'RequestGovernor':
+        return cls(
+            max_retries=config.api_max_retries,
+            base_delay=config.api_retry_base_delay,
+            max_delay=config.api_retry_max_delay,
+            deadline=config.api_request_deadline,
+            initial_concurrency=config.api_initial_concurrency,
+            max_concurrency=config.api_max_concurrency
+        )
+
+    def limiter(self, model: str) -> ModelLimiter:
+        with self._lock:
+            limiter = self._limiters.get(model)
+            if limiter is None:
+                limiter = self._limiters[model] = ModelLimiter(self.initial_concurrency, self.max_concurrency)
+            return limiter
+
+    def _retry_delay(self, error: Exception, attempt: RequestAttempt, tries: int, deadline: float) -> Optional[float]:
+        # 再試行しない場合はNone
+        if attempt.streamed or tries >= self.max_retries:
+            return None
+        if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+            retry_after = None
+        elif isinstance(error, openai.APIStatusError) and error.status_code in RETRY_STATUSES:
+            retry_after = parse_retry_after(error.response.headers)
+        else:
+            return None
+        # フルジッター付きの指数バックオフ（サーバーの指定があればそれ以上待つ）
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** tries))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        if time.monotonic() + delay > deadline:
+            return None
+        return delay
+
+    def _finish(self, limiter: ModelLimiter, attempt: RequestAttempt, error: Optional[Exception] = None):
+        headers = attempt.headers
+        if isinstance(error, openai.APIStatusError):
+            headers = error.response.headers
+        rate_limited = isinstance(error, openai.RateLimitError)
+        if rate_limited:
+            self.rate_limited += 1
+        limiter.release(headers, rate_limited)
+
+    def _report_retries(self, errors: list):
+        # 再試行は試行ごとではなくリクエストごとに1回だけ記録する（計測中はスパンにも残す）
+        if not errors:
+            return
+        tracer.annotate(retries=len(errors), retry_error=type(errors[-1]).__name__)
+        print(f"Request retried {len(errors)} time(s), last error: {errors[-1]}")
+
+    def run(self, model: str, tokens: int, send: Callable[[RequestAttempt], str]) -> str:
+        limiter = self.limiter(model)
+        deadline = time.monotonic() + self.deadline
+        errors = []
+        try:
+            while True:
+                limiter.acquire(tokens, deadline)
+                attempt = RequestAttempt()
+                try:
+                    result = send(attempt)
+                except Exception as e:
+                    self._finish(limiter, attempt, e)
+                    delay = self._retry_delay(e, attempt, len(errors), deadline)
+                    if delay is None:
+                        raise
+                    self.retries += 1
+                    errors.append(e)
+                    time.sleep(delay)
+                    continue
+                except BaseException:
+                    limiter.release()
+                    raise
+                self._finish(limiter, attempt)
+                return result
+        finally:
+            self._report_retries(errors)
+
+    async def arun(self, model: str, tokens: int, send) -> str:
+        limiter = self.limiter(model)
+        deadline = time.monotonic() + self.deadline
+        errors = []
+        try:
+            while True:
+                await limiter.aacquire(tokens, deadline)
+                attempt = RequestAttempt()
+                try:
+                    result = await send(attempt)
+                except Exception as e:
+                    self._finish(limiter, attempt, e)
+                    delay = self._retry_delay(e, attempt, len(errors), deadline)
+                    if delay is None:
+                        raise
+                    self.retries += 1
+                    errors.append(e)
+                    await asyncio.sleep(delay)
+                    continue
+                except BaseException:
+                    limiter.release()
+                    raise
+                self._finish(limiter, attempt)
+                return result
+        finally:
+            self._report_retries(errors)
+
+    def stats(self) -> dict:
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {
+            'retries': self.retries,
+            'rate_limited': self.rate_limited,
+            'concurrency': {model: round(limiter.limit, 2) for model, limiter in limiters.items()}
+        }
+
+_governors = weakref.WeakKeyDictionary()
+
+def attach_governor(client, governor: RequestGovernor):
+    _governors[client] = governor
+
+def governor_for(client) -> Optional[RequestGovernor]:
+    try:
+        return _governors.get(client)
+    except TypeError:
+        return None
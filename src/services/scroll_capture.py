@@ -0,0 +1,62 @@
+import threading
+
+from ..utils.scroll_stitch import ScrollStitcher
+
+class ScrollCapture:
+    # 指定範囲を短い間隔でキャプチャし、ユーザーがスクロールした分だけを縦につなげていく
+    def __init__(self, capture_service, bbox, on_progress=None, interval=0.15,
+                 min_overlap=32, max_height=20000):
+        self.capture_service = capture_service
+        self.bbox = bbox
+        self.on_progress = on_progress
+        self.interval = interval
+        self.stitcher = ScrollStitcher(min_overlap=min_overlap, max_height=max_height)
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, config, capture_service, bbox, on_progress=None) -> 'ScrollCapture':
+        return cls(
+            capture_service, bbox, on_progress,
+            interval=config.scroll_interval_ms / 1000,
+            min_overlap=config.scroll_min_overlap,
+            max_height=config.scroll_max_height
+        )
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="scroll-capture", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        # 停止してつなげた画像を返す
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        return self.stitcher.to_image()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error capturing scrolling region: {e}")
+            if self.stitcher.full:
+                # 上限の高さに達したら取得をやめ、停止されるのを待つ
+                if self.on_progress is not None:
+                    self.on_progress(self.stitcher.height, True)
+                return
+            self._stop.wait(self.interval)
+
+    def poll(self) -> int:
+        added = self.stitcher.add(self.capture_service.grab(self.bbox))
+        if added and self.on_progress is not None:
+            self.on_progress(self.stitcher.height, self.stitcher.full)
+        return added
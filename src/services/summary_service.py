@@ -1,55 +1,145 @@
-from openai import OpenAI
-import base64
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
-import io
+from .client import create_client, create_async_client
+from .completion import create_completion, acreate_completion, bind_context, image_messages, text_messages
+from ..utils.image_encoding import EncodingProfile, encode_image
+from ..utils.text_chunking import chunk_text, estimate_tokens, group_by_tokens
+from ..utils.tracing import traced
 
 class SummaryService:
-    def __init__(self, config):
-        self.client = OpenAI(api_key=config.openai_api_key)
+    def __init__(self, config, cache=None, client=None, async_client=None):
+        self.config = config
+        self.client = client if client is not None else create_client(config)
+        self._async_client = async_client
         self.vision_model = config.vision_model
+        self.cache = cache
+        self.image_profile = EncodingProfile.from_config(config, 'summary')
+        self.chunk_tokens = config.summary_chunk_tokens
+        self.chunk_summary_tokens = config.summary_chunk_summary_tokens
+        self.workers = config.summary_workers
 
-    def image_to_base64(self, image: Image.Image) -> str:
-        buffered = io.BytesIO()
-        image.save(buffered, format="PNG")
-        return base64.b64encode(buffered.getvalue()).decode('utf-8')
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = create_async_client(self.config)
+        return self._async_client
 
-    def summarize_image(self, image: Image.Image) -> str:
-        base64_image = self.image_to_base64(image)
+    def _image_prompt(self) -> str:
+        return "この画像内のテキストを要約してください。"
+
+    def _text_prompt(self, text: str) -> str:
+        return f"以下のテキストを要約してください:\n\n{text}"
+
+    def _chunk_prompt(self, chunk: str) -> str:
+        # チャンクの番号や総数は含めない（テキストを追加しても既存チャンクのキャッシュが使えるように）
+        return f"以下は長いテキストの一部です。重要な情報を漏らさないよう要約してください:\n\n{chunk}"
+
+    def _reduce_prompt(self, summaries: list) -> str:
+        joined = '\n\n---\n\n'.join(summaries)
+        return f"以下は長いテキストを分割して順に要約したものです。全体を1つの要約にまとめてください:\n\n{joined}"
+
+    def _lookup(self, image: Image.Image, prompt: str):
+        if self.cache is None:
+            return None, None
+        cache_key = self.cache.make_key('summary_image', image, prompt, model=self.vision_model)
+        return cache_key, self.cache.get(cache_key)
+
+    def _store(self, cache_key, result: str) -> str:
+        if cache_key is not None and result:
+            self.cache.set(cache_key, result)
+        return result
+
+    def _complete(self, request: dict) -> str:
+        return create_completion(self.client, self.vision_model, **request)
+
+    async def _acomplete(self, request: dict) -> str:
+        return await acreate_completion(self.async_client, self.vision_model, **request)
+
+    def _image_request(self, image: Image.Image, prompt: str, on_delta=None) -> dict:
+        encoded_image = encode_image(image, self.image_profile)
+        return {
+            'messages': image_messages(prompt, encoded_image.data_url),
+            'max_tokens': 1000,
+            'on_delta': on_delta
+        }
+
+    def _text_request(self, prompt: str, max_tokens: int, on_delta=None) -> dict:
+        return {'messages': text_messages(prompt), 'max_tokens': max_tokens, 'on_delta': on_delta}
+
+    @traced('service.summary')
+    def summarize_image(self, image: Image.Image, on_delta=None) -> str:
+        prompt = self._image_prompt()
+        cache_key, cached = self._lookup(image, prompt)
+        if cached is not None:
+            return cached
+        return self._store(cache_key, self._complete(self._image_request(image, prompt, on_delta)))
+
+    @traced('service.summary')
+    async def asummarize_image(self, image: Image.Image, on_delta=None) -> str:
+        # 画像のハッシュ計算とディスクキャッシュの読み書きはイベントループを止めないよう別スレッドで行う
+        prompt = self._image_prompt()
+        cache_key, cached = await asyncio.to_thread(self._lookup, image, prompt)
+        if cached is not None:
+            return cached
+        request = await asyncio.to_thread(self._image_request, image, prompt, on_delta)
+        return await asyncio.to_thread(self._store, cache_key, await self._acomplete(request))
+
+    @traced('service.summary')
+    def summarize_text(self, text: str, on_delta=None) -> str:
+        if estimate_tokens(text) <= self.chunk_tokens:
+            return self._complete(self._text_request(self._text_prompt(text), 1000, on_delta))
+        
+        # 長いテキストはチャンクごとに並列で要約し、要約同士を段階的に統合する
+        chunks = chunk_text(text, self.chunk_tokens)
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(chunks))) as executor:
+            summaries = list(executor.map(
+                bind_context(lambda chunk: self._complete_text(self._chunk_prompt(chunk), self.chunk_summary_tokens)),
+                chunks
+            ))
+            while len(summaries) > 1 and estimate_tokens(''.join(summaries)) > self.chunk_tokens:
+                summaries = list(executor.map(
+                    bind_context(lambda group: self._complete_text(self._reduce_prompt(group), self.chunk_summary_tokens)),
+                    group_by_tokens(summaries, self.chunk_tokens)
+                ))
+        return self._complete_text(self._reduce_prompt(summaries), 1000, on_delta)
+
+    @traced('service.summary')
+    async def asummarize_text(self, text: str, on_delta=None) -> str:
+        if estimate_tokens(text) <= self.chunk_tokens:
+            return await self._acomplete(self._text_request(self._text_prompt(text), 1000, on_delta))
         
-        response = self.client.chat.completions.create(
-            model=self.vision_model,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "この画像内のテキストを要約してください。"
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=1000
-        )
+        semaphore = asyncio.Semaphore(self.workers)
         
-        return response.choices[0].message.content
-
-    def summarize_text(self, text: str) -> str:
-        response = self.client.chat.completions.create(
-            model=self.vision_model,
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"以下のテキストを要約してください:\n\n{text}"
-                }
-            ],
-            max_tokens=1000
-        )
+        async def complete(prompt):
+            async with semaphore:
+                return await self._acomplete_text(prompt, self.chunk_summary_tokens)
         
-        return response.choices[0].message.content
+        chunks = chunk_text(text, self.chunk_tokens)
+        summaries = await asyncio.gather(*(complete(self._chunk_prompt(chunk)) for chunk in chunks))
+        while len(summaries) > 1 and estimate_tokens(''.join(summaries)) > self.chunk_tokens:
+            summaries = await asyncio.gather(*(
+                complete(self._reduce_prompt(group))
+                for group in group_by_tokens(summaries, self.chunk_tokens)
+            ))
+        return await self._acomplete_text(self._reduce_prompt(list(summaries)), 1000, on_delta)
+
+    def _lookup_text(self, prompt: str, max_tokens: int):
+        if self.cache is None:
+            return None, None
+        cache_key = self.cache.make_key(f'summary_text:{max_tokens}', None, prompt, model=self.vision_model)
+        return cache_key, self.cache.get(cache_key)
+
+    def _complete_text(self, prompt: str, max_tokens: int, on_delta=None) -> str:
+        # チャンク・中間要約はキャッシュし、テキストの追加時は変化した末尾だけを再計算する
+        cache_key, cached = self._lookup_text(prompt, max_tokens)
+        if cached is not None:
+            return cached
+        return self._store(cache_key, self._complete(self._text_request(prompt, max_tokens, on_delta)))
+
+    async def _acomplete_text(self, prompt: str, max_tokens: int, on_delta=None) -> str:
+        cache_key, cached = await asyncio.to_thread(self._lookup_text, prompt, max_tokens)
+        if cached is not None:
+            return cached
+        result = await self._acomplete(self._text_request(prompt, max_tokens, on_delta))
+        return await asyncio.to_thread(self._store, cache_key, result)
@@ -1,37 +1,194 @@
-from openai import OpenAI
-import base64
-from PIL import Image
-import io
-import re
+import asyncio
+import json
+from collections import namedtuple
+from typing import List
+from .client import create_client, create_async_client
+from .completion import create_completion, acreate_completion, text_messages
+from ..utils.language import detect_language, language_name
+from ..utils.translation_memory import split_segments
+from ..utils.tracing import traced
+
+TranslationPlan = namedtuple('TranslationPlan', 'source_lang target_lang parts known missing')
 
 class TranslationService:
-    def __init__(self, config):
-        self.client = OpenAI(api_key=config.openai_api_key)
+    def __init__(self, config, client=None, async_client=None, memory=None):
+        self.config = config
+        self.client = client if client is not None else create_client(config)
+        self._async_client = async_client
         self.vision_model = config.vision_model
-        self.language_codes = {
-            "日本語": "英語",
-            "英語": "日本語"
-        }
+        self.memory = memory
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = create_async_client(self.config)
+        return self._async_client
 
     def detect_language(self, text: str) -> str:
-        # 日本語の文字が含まれているかチェック
-        if re.search(r'[ぁ-んァ-ン一-龥]', text):
-            return "日本語"
-        return "英語"
-
-    def translate_text(self, text: str, target_lang: str = None) -> str:
-        source_lang = self.detect_language(text)
-        target_lang = self.language_codes[source_lang]
-        
-        response = self.client.chat.completions.create(
-            model=self.vision_model,
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"以下のテキストを{target_lang}に翻訳してください:\n\n{text}"
-                }
-            ],
-            max_tokens=1000
+        return language_name(detect_language(text))
+
+    def _languages(self, text: str, target_lang: str = None):
+        # 翻訳先の指定がなければ、日本語は英語に、それ以外は日本語に翻訳する
+        source_lang = detect_language(text)
+        if not target_lang:
+            target_lang = 'en' if source_lang == 'ja' else 'ja'
+        return source_lang, target_lang
+
+    def _prompt(self, text: str, target_lang: str) -> str:
+        return f"以下のテキストを{language_name(target_lang)}に翻訳してください:\n\n{text}"
+
+    def _segments_prompt(self, segments: list, target_lang: str) -> str:
+        return (
+            f'次のJSONの"segments"配列の各要素を{language_name(target_lang)}に翻訳してください。'
+            "各要素は画面上の同じテキストから切り出した文やラベルです。"
+            '要素の順序と数は変えず、結果は {"translations": [訳, ...]} の形のJSONオブジェクトのみで出力してください。\n\n'
+            + json.dumps({'segments': segments}, ensure_ascii=False)
         )
-        
-        return response.choices[0].message.content
+
+    def _parse_segments(self, content, segments: list):
+        try:
+            translations = json.loads(content)['translations']
+        except (TypeError, ValueError, KeyError):
+            return None
+        if not isinstance(translations, list) or len(translations) != len(segments):
+            return None
+        if not all(isinstance(translation, str) for translation in translations):
+            return None
+        return dict(zip(segments, translations))
+
+    def _plan(self, text: str, target_lang: str):
+        # 文・行単位に分割し、翻訳メモリにない断片だけを洗い出す
+        source_lang, target_lang = self._languages(text, target_lang)
+        parts = split_segments(text)
+        segments = [part for part, translatable in parts if translatable]
+        known = self.memory.lookup(segments, source_lang, target_lang, self.vision_model) if self.memory else {}
+        missing = list(dict.fromkeys(segment for segment in segments if segment not in known))
+        return TranslationPlan(source_lang, target_lang, parts, known, missing)
+
+    def _plan_all(self, texts: List[str], target_lang: str) -> list:
+        return [self._plan(text, target_lang) for text in texts]
+
+    def _assemble(self, parts, known: dict) -> str:
+        return ''.join(known[part] if translatable else part for part, translatable in parts)
+
+    @traced('service.translation')
+    def translate_text(self, text: str, target_lang: str = None, on_delta=None) -> str:
+        if self.memory is None:
+            return self._translate_whole(text, self._languages(text, target_lang)[1], on_delta)
+
+        plan = self._plan(text, target_lang)
+        if self._should_stream(plan, on_delta):
+            return self._translate_whole(text, plan.target_lang, on_delta)
+        # 未翻訳の断片はまとめて1回のリクエストで翻訳する
+        translations = self._translate_segments(plan.missing, plan.target_lang) if plan.missing else {}
+        result = self._apply(plan, translations)
+        if result is None:
+            print("Error in segment translation: unexpected response, translating the whole text")
+            return self._translate_whole(text, plan.target_lang, on_delta)
+        return result
+
+    @traced('service.translation')
+    async def atranslate_text(self, text: str, target_lang: str = None, on_delta=None) -> str:
+        if self.memory is None:
+            return await self._atranslate_whole(text, self._languages(text, target_lang)[1], on_delta)
+
+        # 翻訳メモリ（SQLite）の読み書きはイベントループを止めないよう別スレッドで行う
+        plan = await asyncio.to_thread(self._plan, text, target_lang)
+        if self._should_stream(plan, on_delta):
+            return await self._atranslate_whole(text, plan.target_lang, on_delta)
+        translations = await self._atranslate_segments(plan.missing, plan.target_lang) if plan.missing else {}
+        result = await asyncio.to_thread(self._apply, plan, translations)
+        if result is None:
+            print("Error in segment translation: unexpected response, translating the whole text")
+            return await self._atranslate_whole(text, plan.target_lang, on_delta)
+        return result
+
+    @traced('service.translation_batch')
+    def translate_batch(self, texts: List[str], target_lang: str = None) -> List[str]:
+        # 複数のテキストの未翻訳の断片を翻訳先の言語ごとに1回のリクエストへまとめ、テキストごとに組み立て直す
+        plans = self._plan_all(texts, target_lang)
+        translated = {
+            target: self._translate_segments(segments, target)
+            for target, segments in self._missing_by_target(plans).items()
+        }
+        outputs = []
+        for text, plan in zip(texts, plans):
+            result = self._apply(plan, translated.get(plan.target_lang))
+            # まとめた翻訳に失敗した場合はテキストごとに翻訳し直す
+            outputs.append(result if result is not None else self._translate_whole(text, plan.target_lang))
+        return outputs
+
+    @traced('service.translation_batch')
+    async def atranslate_batch(self, texts: List[str], target_lang: str = None) -> List[str]:
+        plans = await asyncio.to_thread(self._plan_all, texts, target_lang)
+        missing = self._missing_by_target(plans)
+        results = await asyncio.gather(*(
+            self._atranslate_segments(segments, target) for target, segments in missing.items()
+        ))
+        translated = dict(zip(missing, results))
+        outputs = []
+        for text, plan in zip(texts, plans):
+            result = await asyncio.to_thread(self._apply, plan, translated.get(plan.target_lang))
+            outputs.append(result if result is not None else await self._atranslate_whole(text, plan.target_lang))
+        return outputs
+
+    def _should_stream(self, plan: TranslationPlan, on_delta) -> bool:
+        # 断片ごとの翻訳はJSONで受け取るため途中経過を表示できない
+        # 翻訳メモリに1つもない場合は全体をストリーミングで翻訳し、訳が届いた順に表示する
+        return on_delta is not None and bool(plan.missing) and not plan.known
+
+    def _missing_by_target(self, plans: list) -> dict:
+        missing = {}
+        for plan in plans:
+            if plan.missing:
+                missing.setdefault(plan.target_lang, {}).update(dict.fromkeys(plan.missing))
+        return {target: list(segments) for target, segments in missing.items()}
+
+    def _apply(self, plan: TranslationPlan, translations):
+        # 翻訳した断片を翻訳メモリに保存して組み立てる（翻訳に失敗していればNone）
+        if plan.missing:
+            if translations is None:
+                return None
+            found = {segment: translations[segment] for segment in plan.missing}
+            if self.memory is not None:
+                self.memory.store(found, plan.source_lang, plan.target_lang, self.vision_model)
+            plan.known.update(found)
+        return self._assemble(plan.parts, plan.known)
+
+    def _complete(self, request: dict) -> str:
+        return create_completion(self.client, self.vision_model, **request)
+
+    async def _acomplete(self, request: dict) -> str:
+        return await acreate_completion(self.async_client, self.vision_model, **request)
+
+    def _segments_request(self, segments: list, target_lang: str) -> dict:
+        return {
+            'messages': text_messages(self._segments_prompt(segments, target_lang)),
+            'max_tokens': 3000,
+            'response_format': {"type": "json_object"}
+        }
+
+    def _whole_request(self, text: str, target_lang: str, on_delta=None) -> dict:
+        return {'messages': text_messages(self._prompt(text, target_lang)), 'max_tokens': 1000, 'on_delta': on_delta}
+
+    def _translate_segments(self, segments: list, target_lang: str):
+        try:
+            content = self._complete(self._segments_request(segments, target_lang))
+        except Exception as e:
+            print(f"Error in segment translation: {e}")
+            return None
+        return self._parse_segments(content, segments)
+
+    async def _atranslate_segments(self, segments: list, target_lang: str):
+        try:
+            content = await self._acomplete(self._segments_request(segments, target_lang))
+        except Exception as e:
+            print(f"Error in segment translation: {e}")
+            return None
+        return self._parse_segments(content, segments)
+
+    def _translate_whole(self, text: str, target_lang: str, on_delta=None) -> str:
+        return self._complete(self._whole_request(text, target_lang, on_delta))
+
+    async def _atranslate_whole(self, text: str, target_lang: str, on_delta=None) -> str:
+        return await self._acomplete(self._whole_request(text, target_lang, on_delta))
@@ -1,41 +1,67 @@
-from openai import OpenAI
-import base64
+import asyncio
 from PIL import Image
-import io
+from .client import create_client, create_async_client
+from .completion import create_completion, acreate_completion, image_messages
+from ..utils.image_encoding import EncodingProfile, encode_image
+from ..utils.tracing import traced
 
 class VisionService:
-    def __init__(self, config):
-        self.client = OpenAI(api_key=config.openai_api_key)
+    def __init__(self, config, cache=None, client=None, async_client=None):
+        self.config = config
+        self.client = client if client is not None else create_client(config)
+        self._async_client = async_client
         self.vision_model = config.vision_model
+        self.cache = cache
+        self.image_profile = EncodingProfile.from_config(config, 'vision')
 
-    def image_to_base64(self, image: Image.Image) -> str:
-        buffered = io.BytesIO()
-        image.save(buffered, format="PNG")
-        return base64.b64encode(buffered.getvalue()).decode('utf-8')
-
-    def analyze_image(self, image: Image.Image) -> str:
-        base64_image = self.image_to_base64(image)
-        
-        response = self.client.chat.completions.create(
-            model=self.vision_model,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "この画像の内容を詳しく説明してください。"
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=1000
-        )
-        
-        return response.choices[0].message.content
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = create_async_client(self.config)
+        return self._async_client
+
+    def _prompt(self) -> str:
+        return "この画像の内容を詳しく説明してください。"
+
+    def _lookup(self, image: Image.Image, prompt: str):
+        if self.cache is None:
+            return None, None
+        cache_key = self.cache.make_key('vision', image, prompt, model=self.vision_model)
+        return cache_key, self.cache.get(cache_key)
+
+    def _store(self, cache_key, result: str) -> str:
+        if cache_key is not None and result:
+            self.cache.set(cache_key, result)
+        return result
+
+    def _complete(self, request: dict) -> str:
+        return create_completion(self.client, self.vision_model, **request)
+
+    async def _acomplete(self, request: dict) -> str:
+        return await acreate_completion(self.async_client, self.vision_model, **request)
+
+    def _image_request(self, image: Image.Image, prompt: str, on_delta=None) -> dict:
+        encoded_image = encode_image(image, self.image_profile)
+        return {
+            'messages': image_messages(prompt, encoded_image.data_url),
+            'max_tokens': 1000,
+            'on_delta': on_delta
+        }
+
+    @traced('service.vision')
+    def analyze_image(self, image: Image.Image, on_delta=None) -> str:
+        prompt = self._prompt()
+        cache_key, cached = self._lookup(image, prompt)
+        if cached is not None:
+            return cached
+        return self._store(cache_key, self._complete(self._image_request(image, prompt, on_delta)))
+
+    @traced('service.vision')
+    async def aanalyze_image(self, image: Image.Image, on_delta=None) -> str:
+        # 画像のハッシュ計算とディスクキャッシュの読み書きはイベントループを止めないよう別スレッドで行う
+        prompt = self._prompt()
+        cache_key, cached = await asyncio.to_thread(self._lookup, image, prompt)
+        if cached is not None:
+            return cached
+        request = await asyncio.to_thread(self._image_request, image, prompt, on_delta)
+        return await asyncio.to_thread(self._store, cache_key, await self._acomplete(request))
@@ -0,0 +1,82 @@
+import threading
+import time
+
+from ..utils.frame_diff import array_signature, changed_fractions
+
+def new_lines(previous: str, current: str) -> list:
+    # 前回のOCR結果になかった行だけを取り出す（ログやチャットの追記分）
+    seen = {line.strip() for line in previous.splitlines() if line.strip()}
+    return [line for line in current.splitlines() if line.strip() and line.strip() not in seen]
+
+class RegionWatcher:
+    # 指定範囲を一定間隔でキャプチャし、前回OCRに送ったフレームから一定以上変化した時だけ通知する
+    def __init__(self, capture_service, bbox, on_change, interval=1.0, threshold=0.002,
+                 pixel_tolerance=12, min_dispatch_interval=3.0, signature_size=256):
+        self.capture_service = capture_service
+        self.bbox = bbox
+        self.on_change = on_change
+        self.interval = interval
+        self.threshold = threshold
+        self.pixel_tolerance = pixel_tolerance
+        self.min_dispatch_interval = min_dispatch_interval
+        self.signature_size = signature_size
+        self._stop = threading.Event()
+        self._thread = None
+        self._reference = None
+        self._last_dispatch = 0.0
+
+    @classmethod
+    def from_config(cls, config, capture_service, bbox, on_change) -> 'RegionWatcher':
+        return cls(
+            capture_service, bbox, on_change,
+            interval=config.watch_interval_ms / 1000,
+            threshold=config.watch_threshold,
+            pixel_tolerance=config.dedup_pixel_tolerance,
+            min_dispatch_interval=config.watch_min_ocr_interval_ms / 1000
+        )
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="region-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error watching region: {e}")
+            self._stop.wait(self.interval)
+
+    def poll(self) -> bool:
+        frame = self.capture_service.grab(self.bbox)
+        signature = array_signature(frame.to_numpy(), self.signature_size)
+
+        if self._reference is not None and self._reference.shape == signature.shape:
+            fraction = float(changed_fractions(signature, self._reference[None], self.pixel_tolerance)[0])
+            if fraction <= self.threshold:
+                return False
+        else:
+            fraction = 1.0
+
+        # 変化が続いている間もAPIを連続で呼ばないよう最短間隔を空ける
+        now = time.monotonic()
+        if now - self._last_dispatch < self.min_dispatch_interval:
+            return False
+
+        self._reference = signature
+        self._last_dispatch = now
+        self.on_change(frame.to_image(), fraction)
+        return True
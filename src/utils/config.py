@@ -1,6 +1,35 @@
 import os
 from dotenv import load_dotenv
 
+def _env_int(name: str, default):
+    value = os.getenv(name)
+    if value is None or value.strip() == '':
+        return default
+    return int(value)
+
+def _env_image_profile(prefix: str, format: str, max_dimension, quality: int) -> dict:
+    return {
+        'format': os.getenv(f'{prefix}_IMAGE_FORMAT', format),
+        'max_dimension': _env_int(f'{prefix}_IMAGE_MAX_DIMENSION', max_dimension),
+        'quality': _env_int(f'{prefix}_IMAGE_QUALITY', quality),
+        'token_budget': _env_int(f'{prefix}_IMAGE_TOKEN_BUDGET', None)
+    }
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+def _env_hotkeys(name: str, default: str) -> dict:
+    # "<ctrl>+<alt>+a=capture-area,..." 形式を {ホットキー: コマンド} に変換する
+    hotkeys = {}
+    for item in os.getenv(name, default).split(','):
+        if '=' in item:
+            hotkey, command = item.rsplit('=', 1)
+            hotkeys[hotkey.strip()] = command.strip()
+    return hotkeys
+
 class Config:
     def __init__(self):
         load_dotenv()
@@ -13,6 +42,138 @@ class Config:
         
         self.vision_model = os.getenv('OPENAI_VISION_MODEL', 'gpt-4o')
         
+        # OpenAI互換の別サーバー（ローカルのモックなど）を使う場合に指定
+        self.openai_base_url = os.getenv('OPENAI_BASE_URL') or None
+        
+        # 全サービスで共有するHTTP接続プール
+        self.http_max_connections = int(os.getenv('HTTP_MAX_CONNECTIONS', '20'))
+        self.http_max_keepalive = int(os.getenv('HTTP_MAX_KEEPALIVE', '10'))
+        self.http_keepalive_expiry = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '60'))
+        self.http_timeout = float(os.getenv('HTTP_TIMEOUT', '60'))
+        self.http_connect_timeout = float(os.getenv('HTTP_CONNECT_TIMEOUT', '10'))
+        self.http2 = _env_bool('HTTP2', True)
+        
+        # レート制限を考慮した流量制御と再試行（モデルごとの同時実行数をAIMDで調整）
+        self.rate_limit_enabled = _env_bool('RATE_LIMIT_ENABLED', True)
+        self.api_max_retries = int(os.getenv('API_MAX_RETRIES', '5'))
+        self.api_retry_base_delay = float(os.getenv('API_RETRY_BASE_DELAY', '0.5'))
+        self.api_retry_max_delay = float(os.getenv('API_RETRY_MAX_DELAY', '30'))
+        self.api_request_deadline = float(os.getenv('API_REQUEST_DEADLINE', '120'))
+        self.api_initial_concurrency = int(os.getenv('API_INITIAL_CONCURRENCY', '4'))
+        self.api_max_concurrency = int(os.getenv('API_MAX_CONCURRENCY', '16'))
+        
+        # 結果キャッシュ（CACHE_KEY_MODE: content=完全一致 / perceptual=見た目が同じなら一致）
+        self.cache_enabled = _env_bool('CACHE_ENABLED', True)
+        self.cache_directory = os.getenv('CACHE_DIRECTORY', os.path.join(self.save_directory, 'cache'))
+        self.cache_max_entries = int(os.getenv('CACHE_MAX_ENTRIES', '256'))
+        self.cache_max_disk_mb = int(os.getenv('CACHE_MAX_DISK_MB', '100'))
+        self.cache_ttl = int(os.getenv('CACHE_TTL_SECONDS', '86400'))
+        self.cache_key_mode = os.getenv('CACHE_KEY_MODE', 'content')
+        
+        # 同一画面の再キャプチャ検出（変化したセルの割合がしきい値以下なら前回の結果を再利用）
+        self.dedup_enabled = _env_bool('DEDUP_ENABLED', True)
+        self.dedup_threshold = float(os.getenv('DEDUP_THRESHOLD', '0.0005'))
+        self.dedup_pixel_tolerance = int(os.getenv('DEDUP_PIXEL_TOLERANCE', '12'))
+        self.dedup_history = int(os.getenv('DEDUP_HISTORY', '8'))
+        
+        # サービスごとの画像エンコード設定（OCRは文字の鮮明さ優先、画像解説は非可逆圧縮で軽量化）
+        self.image_profiles = {
+            'ocr': _env_image_profile('OCR', 'PNG', 2048, 90),
+            'summary': _env_image_profile('SUMMARY', 'PNG', 2048, 90),
+            'vision': _env_image_profile('VISION', 'JPEG', 1536, 80)
+        }
+        
+        # 大きなキャプチャのタイル分割OCR（OCR_TILING: auto / on / off）
+        self.ocr_tiling = os.getenv('OCR_TILING', 'auto').lower()
+        self.ocr_tile_threshold = int(os.getenv('OCR_TILE_THRESHOLD', '2000'))
+        self.ocr_tile_size = max(1, int(os.getenv('OCR_TILE_SIZE', '1024')))
+        # 重なりがタイルの大きさ以上だとタイルが進まないため、タイルの半分までに抑える
+        self.ocr_tile_overlap = min(max(0, int(os.getenv('OCR_TILE_OVERLAP', '64'))), self.ocr_tile_size // 2)
+        self.ocr_tile_workers = int(os.getenv('OCR_TILE_WORKERS', '4'))
+        
+        # OCRエンジンの選択（remote: モデルのみ / local: ローカルOCRのみ / auto: ローカルの信頼度が低い時だけモデル）
+        self.ocr_engine = os.getenv('OCR_ENGINE', 'remote').lower()
+        self.ocr_local_backend = os.getenv('OCR_LOCAL_BACKEND', 'tesseract').lower()
+        self.ocr_local_langs = os.getenv('OCR_LOCAL_LANGS') or None
+        self.ocr_local_min_confidence = float(os.getenv('OCR_LOCAL_MIN_CONFIDENCE', '0.8'))
+        
+        # 翻訳メモリ（文・ラベル単位の訳を保存し、未翻訳の部分だけをまとめて送る）
+        self.translation_memory_enabled = _env_bool('TRANSLATION_MEMORY_ENABLED', True)
+        self.translation_memory_path = os.getenv(
+            'TRANSLATION_MEMORY_PATH', os.path.join(self.save_directory, 'translation_memory.sqlite3')
+        )
+        
+        # キャプチャ履歴（結果とサムネイルを保存し、履歴タブから全文検索する）
+        self.history_enabled = _env_bool('HISTORY_ENABLED', True)
+        self.history_directory = os.getenv('HISTORY_DIRECTORY', os.path.join(self.save_directory, 'history'))
+        self.history_thumbnail_size = int(os.getenv('HISTORY_THUMBNAIL_SIZE', '256'))
+        
+        # 長いテキストの要約（見積もりトークン数で分割し、チャンクごとの要約を並列に作って統合する）
+        self.summary_chunk_tokens = int(os.getenv('SUMMARY_CHUNK_TOKENS', '3000'))
+        self.summary_chunk_summary_tokens = int(os.getenv('SUMMARY_CHUNK_SUMMARY_TOKENS', '500'))
+        self.summary_workers = int(os.getenv('SUMMARY_WORKERS', '4'))
+        
+        # 一括処理で小さな画像・テキストを1回のリクエストにまとめる件数（1でまとめない）
+        self.batch_size = int(os.getenv('BATCH_SIZE', '4'))
+        self.batch_max_image_dimension = int(os.getenv('BATCH_MAX_IMAGE_DIMENSION', '1024'))
+        
+        # 応答のストリーミング表示（更新間隔をまとめてUIスレッドへの通知を間引く）
+        self.streaming_enabled = _env_bool('STREAMING_ENABLED', True)
+        self.stream_update_interval_ms = int(os.getenv('STREAM_UPDATE_INTERVAL_MS', '50'))
+        
+        # API呼び出しを並列に実行するワーカー数
+        self.job_workers = int(os.getenv('JOB_WORKERS', '2'))
+        
+        # OCR完了後に要約・翻訳を低優先度で先読みする（PREFETCH_ACTIONS: summary,translation）
+        self.prefetch_enabled = _env_bool('PREFETCH_ENABLED', False)
+        self.prefetch_actions = [
+            action.strip() for action in os.getenv('PREFETCH_ACTIONS', 'summary,translation').split(',') if action.strip()
+        ]
+        # 先読みするテキストの見積もりトークン数の上限と、起動中に先読みへ使う合計の上限（0で無制限）
+        self.prefetch_max_tokens = int(os.getenv('PREFETCH_MAX_TOKENS', '4000'))
+        self.prefetch_token_budget = int(os.getenv('PREFETCH_TOKEN_BUDGET', '100000'))
+        
+        # 画面キャプチャの方式（auto: mssが使えればmss、なければPIL / mss / pil）
+        self.capture_backend = os.getenv('CAPTURE_BACKEND', 'auto').lower()
+        # エリア選択時に画面を一度だけ取得して静止画で表示し、選択範囲をその画像から切り出す
+        self.capture_frozen_frame = _env_bool('CAPTURE_FROZEN_FRAME', True)
+        # ウィンドウが隠れた（hideEventの）後、キャプチャするまでの追加の待ち時間
+        # 合成マネージャーのフェードアウトが写り込む環境でだけ指定する
+        self.capture_hide_delay_ms = int(os.getenv('CAPTURE_HIDE_DELAY_MS', '0'))
+        
+        # ウォッチモード（一定間隔で範囲をキャプチャし、変化した割合がしきい値を超えたらOCR）
+        self.watch_interval_ms = int(os.getenv('WATCH_INTERVAL_MS', '1000'))
+        self.watch_threshold = float(os.getenv('WATCH_THRESHOLD', '0.002'))
+        self.watch_min_ocr_interval_ms = int(os.getenv('WATCH_MIN_OCR_INTERVAL_MS', '3000'))
+        # 画面を帯に分割し、変化した帯だけを再OCRする
+        self.watch_incremental = _env_bool('WATCH_INCREMENTAL', True)
+        self.incremental_band_height = int(os.getenv('INCREMENTAL_BAND_HEIGHT', '384'))
+        
+        # スクロールキャプチャ（短い間隔でキャプチャし、前のフレームとの重なりを除いて縦につなげる）
+        self.scroll_interval_ms = int(os.getenv('SCROLL_INTERVAL_MS', '150'))
+        self.scroll_min_overlap = int(os.getenv('SCROLL_MIN_OVERLAP', '32'))
+        self.scroll_max_height = int(os.getenv('SCROLL_MAX_HEIGHT', '20000'))
+        
+        # 処理段階ごとの所要時間の計測（TRACE_LOG: スパンをJSONLで記録 / METRICS_PORT: Prometheus形式で公開、0で無効）
+        self.tracing_enabled = _env_bool('TRACING_ENABLED', True)
+        self.trace_log = os.getenv('TRACE_LOG') or None
+        self.metrics_port = int(os.getenv('METRICS_PORT', '0'))
+        
+        # 最後に選んだモニターと範囲を覚えて、次回以降はモニター選択ダイアログを省く
+        self.remember_monitor = _env_bool('REMEMBER_MONITOR', True)
+        
+        # 常駐モード（--daemon）：トレイ・ローカルソケット・グローバルホットキーからキャプチャを受け付ける
+        self.daemon_socket_name = os.getenv('DAEMON_SOCKET_NAME', 'vision-assist-pro')
+        self.daemon_hotkeys = _env_hotkeys(
+            'DAEMON_HOTKEYS',
+            '<ctrl>+<alt>+a=capture-area,<ctrl>+<alt>+f=capture-full,<ctrl>+<alt>+r=capture-last,<ctrl>+<alt>+s=capture-scroll'
+        )
+        # 待機中もAPIとの接続を保つため、この間隔（秒）で軽いリクエストを送る（0で無効）
+        self.daemon_keepalive_interval = float(os.getenv('DAEMON_KEEPALIVE_INTERVAL', '45'))
+        
+        # ウィンドウ表示後にバックグラウンドでAPIクライアントなどを初期化しておく
+        self.warm_up_services = _env_bool('WARM_UP_SERVICES', True)
+        
         if not os.path.exists(self.save_directory):
             os.makedirs(self.save_directory)
 
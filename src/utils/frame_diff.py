@@ -0,0 +1,137 @@
+import threading
+from collections import deque
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .image_hash import content_hash
+
+def frame_signature(image: Image.Image, size: int = 128) -> np.ndarray:
+    # 縮小したグレースケール画像（BOX縮小なので細かいノイズは平均化される）
+    small = image.resize((size, size), Image.Resampling.BOX).convert('L')
+    return np.asarray(small, dtype=np.int16)
+
+def array_signature(array: np.ndarray, size: int = 128) -> np.ndarray:
+    # キャプチャのバッファ (高さ, 幅, チャンネル) を間引いて輝度の近似値を取る（PILを経由しないので軽い）
+    step_y = max(1, array.shape[0] // size)
+    step_x = max(1, array.shape[1] // size)
+    sampled = array[::step_y, ::step_x, :3]
+    return sampled.mean(axis=2).astype(np.int16)
+
+def changed_fractions(signature: np.ndarray, others: np.ndarray, pixel_tolerance: int = 12) -> np.ndarray:
+    # others: (N, H, W) のシグネチャ群に対して変化したセルの割合を一括で計算
+    changed = np.abs(others - signature[np.newaxis]) > pixel_tolerance
+    return changed.mean(axis=(1, 2))
+
+def _runs(mask: np.ndarray, max_gap: int = 0) -> List[Tuple[int, int]]:
+    # 1次元のbool配列からTrueが連続する区間 [start, end) を返す（max_gap以下の隙間はつなげる）
+    indices = np.flatnonzero(mask)
+    if indices.size == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(indices) > max_gap + 1)
+    starts = np.concatenate(([indices[0]], indices[breaks + 1]))
+    ends = np.concatenate((indices[breaks], [indices[-1]])) + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+def changed_regions(previous: np.ndarray, current: np.ndarray, block: int = 16,
+                    pixel_tolerance: int = 12, max_gap: int = 2) -> List[Tuple[int, int, int, int]]:
+    # 2枚のグレースケール配列の差分をブロック単位にまとめ、変化した領域の (left, top, right, bottom) を返す
+    height, width = current.shape
+    changed = np.abs(current.astype(np.int16) - previous.astype(np.int16)) > pixel_tolerance
+
+    rows = -(-height // block)
+    cols = -(-width // block)
+    padded = np.zeros((rows * block, cols * block), dtype=bool)
+    padded[:height, :width] = changed
+    blocks = padded.reshape(rows, block, cols, block).any(axis=(1, 3))
+
+    regions = []
+    for top, bottom in _runs(blocks.any(axis=1), max_gap):
+        for left, right in _runs(blocks[top:bottom].any(axis=0), max_gap):
+            regions.append((
+                left * block,
+                top * block,
+                min(right * block, width),
+                min(bottom * block, height)
+            ))
+    return regions
+
+def plan_bands(gray: np.ndarray, target_height: int = 384, search: int = 64) -> List[Tuple[int, int]]:
+    # 画面を横長の帯に分割する。文字の行を切らないよう、目標の高さ付近で最も変化の少ない行で区切る
+    height = gray.shape[0]
+    ink = np.abs(np.diff(gray.astype(np.int16), axis=1)).sum(axis=1)
+    bands = []
+    top = 0
+    while height - top > target_height + search:
+        low = top + target_height - search
+        high = top + target_height + search
+        cut = low + int(np.argmin(ink[low:high]))
+        bands.append((top, cut))
+        top = cut
+    bands.append((top, height))
+    return bands
+
+class FrameRecord:
+    # 元の画像は持たず、縮小したシグネチャと元の解像度のピクセルのハッシュだけを保持する（4Kでも数十KB）
+    def __init__(self, signature: np.ndarray, size: Tuple[int, int], digest: Optional[str] = None):
+        self.signature = signature
+        self.size = size
+        self.digest = digest
+        self.results = {}
+
+class FrameDeduplicator:
+    def __init__(self, threshold: float = 0.0005, pixel_tolerance: int = 12,
+                 history_size: int = 8, signature_size: int = 128):
+        self.threshold = threshold
+        self.pixel_tolerance = pixel_tolerance
+        self.signature_size = signature_size
+        self.history = deque(maxlen=history_size)
+        # ワーカースレッドから呼ばれるため、履歴の更新を直列にする
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config) -> 'FrameDeduplicator':
+        return cls(
+            threshold=config.dedup_threshold,
+            pixel_tolerance=config.dedup_pixel_tolerance,
+            history_size=config.dedup_history
+        )
+
+    def observe(self, image: Image.Image) -> Tuple[FrameRecord, bool]:
+        # 直近のフレームとほぼ同じなら既存のレコードを、そうでなければ新しいレコードを返す
+        signature = frame_signature(image, self.signature_size)
+        digest = content_hash(image)
+        with self._lock:
+            record = self._find(signature, image.size, digest)
+            if record is not None:
+                self.history.remove(record)
+                self.history.append(record)
+                return record, True
+
+            record = FrameRecord(signature, image.size, digest)
+            self.history.append(record)
+            return record, False
+
+    def _find(self, signature: np.ndarray, size: Tuple[int, int], digest: str) -> Optional[FrameRecord]:
+        candidates = [record for record in self.history if record.size == size]
+        if not candidates:
+            return None
+
+        fractions = changed_fractions(
+            signature,
+            np.stack([record.signature for record in candidates]),
+            self.pixel_tolerance
+        )
+        # 縮小画像で近いものから順に、元の解像度でもピクセルが一致するもの（数字1文字の違いもない）だけを同じ画面とみなす
+        for index in np.argsort(fractions, kind='stable'):
+            if fractions[index] > self.threshold:
+                break
+            record = candidates[int(index)]
+            if record.digest is None or record.digest == digest:
+                return record
+        return None
+
+    def clear(self):
+        with self._lock:
+            self.history.clear()
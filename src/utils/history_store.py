@@ -0,0 +1,305 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, List, Optional
+
+TEXT_FIELDS = ('ocr', 'summary', 'translation', 'vision')
+COLUMNS = ('id', 'capture_id', 'created_at', 'kind', 'model', 'thumbnail', 'width', 'height') + TEXT_FIELDS + ('timings',)
+
+def bigram_tokens(texts) -> str:
+    # 2文字ずつの組（と各語の最後の1文字）を索引の語にする。記号や空白を含んでも1語になるよう16進数で表す
+    tokens = set()
+    for text in texts:
+        for word in (text or '').lower().split():
+            for index in range(len(word)):
+                tokens.add(word[index:index + 2].encode('utf-8').hex())
+    return ' '.join(sorted(tokens))
+
+def bigram_expression(term: str) -> str:
+    # 2文字の語はその組と一致させ、1文字の語はその文字で始まる組（または語末の1文字）に前方一致させる
+    token = '"' + term.lower().encode('utf-8').hex() + '"'
+    return token if len(term) == 2 else token + '*'
+
+class HistoryEntry:
+    def __init__(self, row, directory: str):
+        values = dict(zip(COLUMNS, row))
+        self.id = values['id']
+        self.capture_id = values['capture_id']
+        self.created_at = values['created_at']
+        self.kind = values['kind']
+        self.model = values['model']
+        self.thumbnail = os.path.join(directory, values['thumbnail']) if values['thumbnail'] else None
+        self.size = (values['width'], values['height'])
+        self.texts = {field: values[field] or '' for field in TEXT_FIELDS}
+        self.timings = json.loads(values['timings']) if values['timings'] else {}
+
+    @property
+    def preview(self) -> str:
+        # 一覧に表示する最初の1行
+        for field in TEXT_FIELDS:
+            for line in self.texts[field].splitlines():
+                if line.strip():
+                    return line.strip()
+        return ''
+
+class HistoryStore:
+    # キャプチャごとの結果（サムネイル・OCR・要約・翻訳・画像解説・所要時間）を保存し、全文検索する
+    # 書き込みは専用スレッドでまとめて行い、呼び出し側（UIスレッド）を待たせない
+    def __init__(self, directory: str, thumbnail_size: int = 256, on_change: Optional[Callable[[], None]] = None):
+        self.directory = directory
+        self.path = os.path.join(directory, 'history.sqlite3')
+        self.thumbnail_directory = os.path.join(directory, 'thumbnails')
+        self.thumbnail_size = thumbnail_size
+        self.on_change = on_change
+        if not os.path.exists(self.thumbnail_directory):
+            os.makedirs(self.thumbnail_directory)
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS captures ('
+                ' id INTEGER PRIMARY KEY,'
+                ' capture_id TEXT NOT NULL UNIQUE,'
+                ' created_at REAL NOT NULL,'
+                ' kind TEXT NOT NULL,'
+                ' model TEXT,'
+                ' thumbnail TEXT,'
+                ' width INTEGER,'
+                ' height INTEGER,'
+                ' ocr TEXT NOT NULL DEFAULT \'\','
+                ' summary TEXT NOT NULL DEFAULT \'\','
+                ' translation TEXT NOT NULL DEFAULT \'\','
+                ' vision TEXT NOT NULL DEFAULT \'\','
+                ' timings TEXT)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS captures_kind ON captures (kind, id)')
+            self.trigram = self._create_index()
+            if self.trigram:
+                self._create_bigram_index()
+
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name='history-writer', daemon=True)
+        self._writer.start()
+
+    @classmethod
+    def from_config(cls, config, on_change=None) -> 'HistoryStore':
+        return cls(config.history_directory, config.history_thumbnail_size, on_change)
+
+    def _create_index(self) -> bool:
+        # 日本語は単語の区切りがないため、使える場合はtrigramで索引を作る（部分一致で検索できる）
+        exists = self._conn.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'captures_fts'"
+        ).fetchone()
+        if exists:
+            return 'trigram' in exists[0]
+        columns = ', '.join(TEXT_FIELDS)
+        try:
+            self._conn.execute(
+                f"CREATE VIRTUAL TABLE captures_fts USING fts5({columns},"
+                " content='captures', content_rowid='id', tokenize='trigram')"
+            )
+            trigram = True
+        except sqlite3.OperationalError:
+            self._conn.execute(
+                f"CREATE VIRTUAL TABLE captures_fts USING fts5({columns},"
+                " content='captures', content_rowid='id')"
+            )
+            trigram = False
+        new_values = ', '.join(f'new.{field}' for field in TEXT_FIELDS)
+        old_values = ', '.join(f'old.{field}' for field in TEXT_FIELDS)
+        self._conn.execute(
+            'CREATE TRIGGER captures_ai AFTER INSERT ON captures BEGIN'
+            f' INSERT INTO captures_fts (rowid, {columns}) VALUES (new.id, {new_values}); END'
+        )
+        self._conn.execute(
+            'CREATE TRIGGER captures_ad AFTER DELETE ON captures BEGIN'
+            f" INSERT INTO captures_fts (captures_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values}); END"
+        )
+        self._conn.execute(
+            'CREATE TRIGGER captures_au AFTER UPDATE ON captures BEGIN'
+            f" INSERT INTO captures_fts (captures_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});"
+            f' INSERT INTO captures_fts (rowid, {columns}) VALUES (new.id, {new_values}); END'
+        )
+        return trigram
+
+    def _create_bigram_index(self):
+        # trigramの索引は3文字未満の語を検索できないため、短い語（日本語の2文字の単語など）用に2文字ずつの索引も持つ
+        exists = self._conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'captures_bigram'").fetchone()
+        if exists:
+            return
+        self._conn.execute('CREATE VIRTUAL TABLE captures_bigram USING fts5(grams)')
+        # 索引を作る前に保存した履歴も検索できるようにする
+        rows = self._conn.execute(f'SELECT id, {", ".join(TEXT_FIELDS)} FROM captures').fetchall()
+        self._conn.executemany(
+            'INSERT INTO captures_bigram (rowid, grams) VALUES (?, ?)',
+            [(row[0], bigram_tokens(row[1:])) for row in rows]
+        )
+
+    def _index_bigrams(self, conn, row_id: int):
+        if not self.trigram:
+            return
+        row = conn.execute(f'SELECT {", ".join(TEXT_FIELDS)} FROM captures WHERE id = ?', (row_id,)).fetchone()
+        conn.execute('DELETE FROM captures_bigram WHERE rowid = ?', (row_id,))
+        if row is not None:
+            conn.execute('INSERT INTO captures_bigram (rowid, grams) VALUES (?, ?)', (row_id, bigram_tokens(row)))
+
+    # 書き込み（専用スレッドで順に実行されるため、recordの直後のupdateも正しく反映される）
+    def record(self, kind: str, image=None, model: str = None, timings: dict = None, **texts) -> str:
+        capture_id = uuid.uuid4().hex
+        created_at = time.time()
+        self._queue.put(lambda conn: self._insert(conn, capture_id, created_at, kind, image, model, timings, texts))
+        return capture_id
+
+    def update(self, capture_id: str, **texts):
+        fields = {field: text for field, text in texts.items() if field in TEXT_FIELDS and text is not None}
+        if not capture_id or not fields:
+            return
+        self._queue.put(lambda conn: self._update(conn, capture_id, fields))
+
+    def _update(self, conn, capture_id: str, fields: dict):
+        assignments = ', '.join(f'{field} = ?' for field in fields)
+        conn.execute(f'UPDATE captures SET {assignments} WHERE capture_id = ?', list(fields.values()) + [capture_id])
+        row = conn.execute('SELECT id FROM captures WHERE capture_id = ?', (capture_id,)).fetchone()
+        if row is not None:
+            self._index_bigrams(conn, row[0])
+
+    def _insert(self, conn, capture_id, created_at, kind, image, model, timings, texts):
+        thumbnail, width, height = None, None, None
+        if image is not None:
+            width, height = image.size
+            thumbnail = self._save_thumbnail(capture_id, image)
+        cursor = conn.execute(
+            f'INSERT INTO captures ({", ".join(COLUMNS[1:])}) VALUES ({", ".join("?" * (len(COLUMNS) - 1))})',
+            [capture_id, created_at, kind, model, thumbnail, width, height]
+            + [texts.get(field) or '' for field in TEXT_FIELDS]
+            + [json.dumps(timings) if timings else None]
+        )
+        self._index_bigrams(conn, cursor.lastrowid)
+
+    def _save_thumbnail(self, capture_id: str, image) -> Optional[str]:
+        filename = f'{capture_id}.jpg'
+        try:
+            thumbnail = image.copy()
+            thumbnail.thumbnail((self.thumbnail_size, self.thumbnail_size))
+            thumbnail.convert('RGB').save(os.path.join(self.thumbnail_directory, filename), 'JPEG', quality=80)
+        except Exception as e:
+            print(f"Error saving history thumbnail: {e}")
+            return None
+        return os.path.join('thumbnails', filename)
+
+    def _write_loop(self):
+        conn = sqlite3.connect(self.path)
+        while True:
+            tasks = [self._queue.get()]
+            # 溜まっている書き込みは1つのトランザクションにまとめる
+            while len(tasks) < 100:
+                try:
+                    tasks.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in tasks
+            writes = [task for task in tasks if task is not None]
+            try:
+                with conn:
+                    for task in writes:
+                        task(conn)
+            except Exception:
+                # まとめた書き込みが失敗した場合は、失敗したもの以外を残せるよう1件ずつやり直す
+                for task in writes:
+                    try:
+                        with conn:
+                            task(conn)
+                    except Exception as e:
+                        print(f"Error writing history: {e}")
+            for _ in tasks:
+                self._queue.task_done()
+            if self.on_change is not None and not stop:
+                self.on_change()
+            if stop:
+                break
+        conn.close()
+
+    def flush(self):
+        self._queue.join()
+
+    # 読み込み
+    def _match_conditions(self, query: str):
+        # 空白で区切った語をすべて含む（各語は記号を含んでもそのまま一致させる）
+        # trigramの索引で探せない3文字未満の語は2文字ずつの索引で探す
+        terms = query.split()
+        long_terms = [term for term in terms if not self.trigram or len(term) >= 3]
+        short_terms = [term for term in terms if self.trigram and len(term) < 3]
+        conditions, params = [], []
+        if long_terms:
+            conditions.append('c.id IN (SELECT rowid FROM captures_fts WHERE captures_fts MATCH ?)')
+            params.append(' '.join('"' + term.replace('"', '""') + '"' for term in long_terms))
+        if short_terms:
+            conditions.append('c.id IN (SELECT rowid FROM captures_bigram WHERE captures_bigram MATCH ?)')
+            params.append(' '.join(bigram_expression(term) for term in short_terms))
+        return conditions, params
+
+    def search(self, query: str = '', kind: str = None, limit: int = 100, offset: int = 0) -> List[HistoryEntry]:
+        # 新しい順に返す。queryが空なら直近の履歴
+        columns = ', '.join(f'c.{column}' for column in COLUMNS)
+        conditions, params = self._match_conditions(query.strip())
+        if kind:
+            conditions.append('c.kind = ?')
+            params.append(kind)
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        sql = f'SELECT {columns} FROM captures c{where} ORDER BY c.id DESC LIMIT ? OFFSET ?'
+        with self._lock:
+            rows = self._conn.execute(sql, params + [limit, offset]).fetchall()
+        return [HistoryEntry(row, self.directory) for row in rows]
+
+    def get(self, capture_id: str) -> Optional[HistoryEntry]:
+        with self._lock:
+            row = self._conn.execute(
+                f'SELECT {", ".join(COLUMNS)} FROM captures WHERE capture_id = ?', (capture_id,)
+            ).fetchone()
+        return HistoryEntry(row, self.directory) if row else None
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM captures').fetchone()[0]
+
+    # 削除も書き込み用のスレッドで行い、UIスレッドを待たせない
+    def delete(self, capture_id: str):
+        self._queue.put(lambda conn: self._delete(conn, capture_id))
+
+    def clear(self):
+        self._queue.put(self._clear)
+
+    def _delete(self, conn, capture_id: str):
+        row = conn.execute('SELECT id, thumbnail FROM captures WHERE capture_id = ?', (capture_id,)).fetchone()
+        if row is None:
+            return
+        conn.execute('DELETE FROM captures WHERE id = ?', (row[0],))
+        if self.trigram:
+            conn.execute('DELETE FROM captures_bigram WHERE rowid = ?', (row[0],))
+        if row[1]:
+            self._remove_file(os.path.join(self.directory, row[1]))
+
+    def _clear(self, conn):
+        conn.execute('DELETE FROM captures')
+        if self.trigram:
+            conn.execute('DELETE FROM captures_bigram')
+        for filename in os.listdir(self.thumbnail_directory):
+            self._remove_file(os.path.join(self.thumbnail_directory, filename))
+
+    def _remove_file(self, path: str):
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"Error removing history thumbnail: {e}")
+
+    def close(self):
+        self._queue.put(None)
+        self._writer.join()
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,142 @@
+import base64
+import io
+import math
+import threading
+import weakref
+from typing import Optional
+
+from PIL import Image
+
+from .tracing import tracer
+
+MIME_TYPES = {
+    'PNG': 'image/png',
+    'JPEG': 'image/jpeg',
+    'WEBP': 'image/webp'
+}
+
+class EncodingProfile:
+    # format: PNG / JPEG / WEBP / AUTO（色数が少ない画面はPNG、写真などはJPEG）
+    def __init__(self, format: str = 'PNG', max_dimension: Optional[int] = 2048,
+                 quality: int = 85, token_budget: Optional[int] = None):
+        self.format = format.upper()
+        self.max_dimension = max_dimension
+        self.quality = quality
+        self.token_budget = token_budget
+
+    @classmethod
+    def from_config(cls, config, name: str) -> 'EncodingProfile':
+        settings = config.image_profiles[name]
+        return cls(
+            format=settings['format'],
+            max_dimension=settings['max_dimension'],
+            quality=settings['quality'],
+            token_budget=settings['token_budget']
+        )
+
+    def key(self):
+        return (self.format, self.max_dimension, self.quality, self.token_budget)
+
+class EncodedImage:
+    def __init__(self, data: bytes, format: str, width: int, height: int):
+        self.data = data
+        self.format = format
+        self.width = width
+        self.height = height
+        self._data_url = None
+
+    @property
+    def mime_type(self) -> str:
+        return MIME_TYPES[self.format]
+
+    @property
+    def data_url(self) -> str:
+        if self._data_url is None:
+            with tracer.span('encode.base64') as span:
+                encoded = base64.b64encode(self.data).decode('utf-8')
+                self._data_url = f"data:{self.mime_type};base64,{encoded}"
+                span.set(bytes=len(self._data_url))
+        return self._data_url
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    # OpenAIのdetail=highの計算方法：2048四方に収めた後、短辺を768にして512pxタイル単位で課金
+    width, height = server_resized_size(width, height)
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return 85 + 170 * tiles
+
+def server_resized_size(width: int, height: int):
+    # APIサーバー側で縮小される大きさ（これより大きく送っても精度は上がらない）
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+def target_size(width: int, height: int, profile: EncodingProfile):
+    target_width, target_height = server_resized_size(width, height)
+
+    if profile.max_dimension and max(target_width, target_height) > profile.max_dimension:
+        scale = profile.max_dimension / max(target_width, target_height)
+        target_width, target_height = int(target_width * scale), int(target_height * scale)
+
+    if profile.token_budget:
+        # 予算に収まるまで少しずつ縮小
+        while estimate_image_tokens(target_width, target_height) > profile.token_budget and min(target_width, target_height) > 64:
+            target_width, target_height = int(target_width * 0.9), int(target_height * 0.9)
+
+    return max(1, target_width), max(1, target_height)
+
+def choose_format(image: Image.Image, profile: EncodingProfile) -> str:
+    if profile.format != 'AUTO':
+        return profile.format
+    thumbnail = image.resize((64, 64), Image.Resampling.NEAREST)
+    if thumbnail.getcolors(maxcolors=256) is not None:
+        return 'PNG'
+    return 'JPEG'
+
+def _encode(image: Image.Image, profile: EncodingProfile) -> EncodedImage:
+    width, height = target_size(image.width, image.height, profile)
+    if (width, height) != image.size:
+        image = image.resize((width, height), Image.Resampling.LANCZOS)
+
+    image_format = choose_format(image, profile)
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    buffered = io.BytesIO()
+    if image_format == 'PNG':
+        image.save(buffered, format='PNG', optimize=False, compress_level=6)
+    else:
+        image.save(buffered, format=image_format, quality=profile.quality)
+    return EncodedImage(buffered.getvalue(), image_format, width, height)
+
+# 同じ画像を複数のサービスに渡しても一度だけエンコードするためのキャッシュ
+# PIL.Imageはハッシュ不可なのでidと弱参照で管理する
+_encoded_images = {}
+_lock = threading.RLock()
+
+def _forget(image_id):
+    with _lock:
+        entry = _encoded_images.get(image_id)
+        if entry is not None and entry[0]() is None:
+            del _encoded_images[image_id]
+
+def encode_image(image: Image.Image, profile: EncodingProfile) -> EncodedImage:
+    image_id = id(image)
+    with _lock:
+        entry = _encoded_images.get(image_id)
+        if entry is not None and entry[0]() is image:
+            encoded = entry[1].get(profile.key())
+            if encoded is not None:
+                return encoded
+
+    with tracer.span('encode', format=profile.format) as span:
+        encoded = _encode(image, profile)
+        span.set(format=encoded.format, width=encoded.width, height=encoded.height, bytes=len(encoded.data))
+
+    with _lock:
+        entry = _encoded_images.get(image_id)
+        if entry is None or entry[0]() is not image:
+            entry = (weakref.ref(image, lambda _, image_id=image_id: _forget(image_id)), {})
+            _encoded_images[image_id] = entry
+        entry[1][profile.key()] = encoded
+    return encoded
@@ -0,0 +1,23 @@
+import hashlib
+import numpy as np
+from PIL import Image
+
+def content_hash(image: Image.Image) -> str:
+    # ピクセルデータそのもののハッシュ（完全一致のみヒット）
+    digest = hashlib.sha256()
+    digest.update(f"{image.mode}:{image.width}x{image.height}:".encode('utf-8'))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+def perceptual_hash(image: Image.Image, hash_size: int = 16) -> str:
+    # 差分ハッシュ(dHash)：隣接ピクセルの明暗関係だけを比較するので
+    # カーソルの点滅や圧縮ノイズ程度の違いでは値が変わらない
+    gray = image.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = np.asarray(gray, dtype=np.int16)
+    bits = pixels[:, :-1] > pixels[:, 1:]
+    return np.packbits(bits).tobytes().hex()
+
+def image_hash(image: Image.Image, mode: str = 'content') -> str:
+    if mode == 'perceptual':
+        return 'p' + perceptual_hash(image)
+    return 'c' + content_hash(image)
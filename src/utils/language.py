@@ -0,0 +1,96 @@
+import re
+import unicodedata
+from collections import Counter
+
+# 言語コードと画面・プロンプトで使う日本語の言語名
+LANGUAGE_NAMES = {
+    'ja': '日本語',
+    'en': '英語',
+    'zh': '中国語',
+    'ko': '韓国語',
+    'ru': 'ロシア語',
+    'el': 'ギリシャ語',
+    'ar': 'アラビア語',
+    'he': 'ヘブライ語',
+    'th': 'タイ語',
+    'hi': 'ヒンディー語',
+    'fr': 'フランス語',
+    'de': 'ドイツ語',
+    'es': 'スペイン語',
+    'it': 'イタリア語',
+    'pt': 'ポルトガル語'
+}
+
+# 文字の種類（Unicodeのブロック）ごとの範囲
+SCRIPTS = (
+    ('kana', re.compile(r'[぀-ヿㇰ-ㇿｦ-ﾟ]')),
+    ('han', re.compile(r'[㐀-䶿一-鿿豈-﫿]')),
+    ('hangul', re.compile(r'[ᄀ-ᇿ㄰-㆏가-힯]')),
+    ('cyrillic', re.compile(r'[Ѐ-ӿ]')),
+    ('greek', re.compile(r'[Ͱ-Ͽ]')),
+    ('arabic', re.compile(r'[؀-ۿݐ-ݿ]')),
+    ('hebrew', re.compile(r'[֐-׿]')),
+    ('thai', re.compile(r'[฀-๿]')),
+    ('devanagari', re.compile(r'[ऀ-ॿ]')),
+    ('latin', re.compile(r'[A-Za-zÀ-ɏ]'))
+)
+
+SCRIPT_LANGUAGES = {
+    'hangul': 'ko',
+    'cyrillic': 'ru',
+    'greek': 'el',
+    'arabic': 'ar',
+    'hebrew': 'he',
+    'thai': 'th',
+    'devanagari': 'hi'
+}
+
+# ラテン文字の言語は頻出する機能語の出現数で推定する
+# （「y」「e」のような1文字の語は英文の選択肢やキー名にも現れるため含めない）
+STOPWORDS = {
+    'en': {'the', 'and', 'is', 'are', 'of', 'to', 'in', 'for', 'with', 'this', 'that', 'you', 'not'},
+    'fr': {'le', 'la', 'les', 'et', 'est', 'des', 'une', 'du', 'dans', 'pour', 'pas', 'vous', 'avec'},
+    'de': {'der', 'die', 'das', 'und', 'ist', 'nicht', 'ein', 'eine', 'mit', 'für', 'auf', 'sie', 'ich'},
+    'es': {'el', 'los', 'las', 'es', 'una', 'del', 'por', 'para', 'con', 'que', 'no', 'está'},
+    'it': {'il', 'gli', 'è', 'una', 'della', 'per', 'con', 'che', 'non', 'sono', 'di', 'questo'},
+    'pt': {'os', 'as', 'é', 'uma', 'do', 'da', 'para', 'com', 'que', 'não', 'em', 'você'}
+}
+
+# 日本語ではほとんど使われない中国語の頻出字（かなのない漢字だけの文の判別に使う）
+CHINESE_MARKERS = re.compile(r'[的这们么吗呢说个还没对从让给]')
+
+WORD = re.compile(r"[a-zà-ÿ']+")
+
+def script_counts(text: str) -> Counter:
+    return Counter({name: len(pattern.findall(text)) for name, pattern in SCRIPTS})
+
+def detect_language(text: str) -> str:
+    # 文字の種類の出現数から言語コードを推定する（判別できない場合は英語）
+    counts = script_counts(unicodedata.normalize('NFKC', text))
+    script, count = max(
+        ((name, value) for name, value in counts.items() if name != 'kana'),
+        key=lambda item: item[1]
+    )
+    # かなが含まれていれば、漢字や英単語の方が多くても日本語とみなす
+    if counts['kana'] and script in ('han', 'latin'):
+        return 'ja'
+    if count == 0:
+        return 'ja' if counts['kana'] else 'en'
+    if counts['han'] and script in ('han', 'latin'):
+        # 「設定」「保存 Save」のような漢字だけのラベルは日本語として扱う
+        return 'zh' if CHINESE_MARKERS.search(text) else 'ja'
+    if script == 'latin':
+        return detect_latin_language(text)
+    return SCRIPT_LANGUAGES[script]
+
+def detect_latin_language(text: str) -> str:
+    words = WORD.findall(text.lower())
+    scores = {lang: sum(word in stopwords for word in words) for lang, stopwords in STOPWORDS.items()}
+    best = max(scores, key=scores.get)
+    # 英語と同点や手がかりがない場合は英語とみなす
+    if scores[best] == 0 or scores[best] == scores['en']:
+        return 'en'
+    return best
+
+def language_name(code: str) -> str:
+    return LANGUAGE_NAMES.get(code, code)
@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from .image_hash import image_hash
+
+# 画像・プロンプト・言語・モデルをキーにしたAPI結果のキャッシュ（メモリLRU + ディスク）
+class ResultCache:
+    def __init__(self, directory: Optional[str] = None, max_entries: int = 256,
+                 max_disk_bytes: int = 100 * 1024 * 1024, ttl: Optional[float] = None,
+                 key_mode: str = 'content'):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self.key_mode = key_mode
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        # ディスク上のファイルの大きさを古い順に保持する（初回のディスク操作時に一度だけ走査する）
+        self._disk_files = None
+        self._disk_bytes = 0
+        self._disk_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.directory and not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+    @classmethod
+    def from_config(cls, config) -> 'ResultCache':
+        return cls(
+            directory=config.cache_directory,
+            max_entries=config.cache_max_entries,
+            max_disk_bytes=config.cache_max_disk_mb * 1024 * 1024,
+            ttl=config.cache_ttl or None,
+            key_mode=config.cache_key_mode
+        )
+
+    def make_key(self, service: str, image=None, prompt: str = '', lang: str = '', model: str = '') -> str:
+        digest = hashlib.sha256()
+        for part in (service, prompt, lang or '', model or ''):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        if image is not None:
+            digest.update(image_hash(image, self.key_mode).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if not self._expired(created, now):
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._memory[key]
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is not None and not self._expired(entry[0], now):
+                self._remember(key, entry)
+                self.disk_hits += 1
+                return entry[1]
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: str):
+        entry = (time.time(), value)
+        with self._lock:
+            self._remember(key, entry)
+        self._write_disk(key, entry)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        with self._disk_lock:
+            self._disk_files = None
+            self._disk_bytes = 0
+        if self.directory:
+            for name in os.listdir(self.directory):
+                if name.endswith('.json'):
+                    try:
+                        os.remove(os.path.join(self.directory, name))
+                    except OSError:
+                        pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            return {
+                'entries': len(self._memory),
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': hits / total if total else 0.0
+            }
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl is not None and now - created > self.ttl
+
+    def _remember(self, key: str, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _read_disk(self, key: str):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            created, value = data['created'], data['value']
+        except OSError:
+            return None
+        except (ValueError, KeyError, TypeError) as e:
+            # 壊れたファイル・形式の違うファイルは毎回読み直さないよう削除する
+            print(f"Error reading cache entry {key}: {e}")
+            self._remove_disk(key)
+            return None
+        if self._expired(created, time.time()):
+            self._remove_disk(key)
+            return None
+        try:
+            # ディスク側もLRUになるよう参照時刻を更新
+            os.utime(path)
+        except OSError:
+            pass
+        with self._disk_lock:
+            if self._disk_files is not None and key in self._disk_files:
+                self._disk_files.move_to_end(key)
+        return created, value
+
+    def _write_disk(self, key: str, entry):
+        if not self.directory:
+            return
+        # 書き込み途中のファイルを読まないよう一時ファイル経由で置き換える
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        data = json.dumps({'created': entry[0], 'value': entry[1]}, ensure_ascii=False).encode('utf-8')
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing cache: {e}")
+            return
+        with self._disk_lock:
+            self._load_disk_files()
+            self._disk_bytes += len(data) - self._disk_files.pop(key, 0)
+            self._disk_files[key] = len(data)
+            self._evict_disk()
+
+    def _remove_disk(self, key: str):
+        with self._disk_lock:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            if self._disk_files is not None:
+                self._disk_bytes -= self._disk_files.pop(key, 0)
+
+    def _load_disk_files(self):
+        # _disk_lockを持った状態で呼ぶ
+        if self._disk_files is not None:
+            return
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, entry.name[:-len('.json')], stat.st_size))
+        self._disk_files = OrderedDict((key, size) for _, key, size in sorted(files))
+        self._disk_bytes = sum(self._disk_files.values())
+
+    def _evict_disk(self):
+        # 上限を超えた時だけ古いものから削除する（_disk_lockを持った状態で呼ぶ）
+        while self._disk_bytes > self.max_disk_bytes and self._disk_files:
+            key, size = self._disk_files.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
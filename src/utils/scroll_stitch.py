@@ -0,0 +1,183 @@
+from typing import List, Optional
+
+import numpy as np
+
+def row_luminance(array: np.ndarray) -> np.ndarray:
+    # (高さ, 幅, チャンネル) の配列から、行の比較に使う輝度の近似値（3チャンネルの和）を取る
+    # （チャンネル軸でsumするより、チャンネルごとに足した方が1桁速い）
+    return array[:, :, 0].astype(np.uint16) + array[:, :, 1] + array[:, :, 2]
+
+def row_hashes(gray: np.ndarray, quantize: int = 3) -> np.ndarray:
+    # 各行を1つの値にまとめる。輝度の下位ビットを落としてから乱数の重みとの内積を取る（BLASで一括計算）
+    weights = np.random.default_rng(gray.shape[1]).random(gray.shape[1])
+    return (gray >> quantize).astype(np.float64) @ weights
+
+def informative_rows(gray: np.ndarray, min_contrast: int = 24) -> np.ndarray:
+    # 背景だけの行（余白・単色の行）はどこにでも一致するため、重なりの推定には使わない
+    return (gray.max(axis=1) - gray.min(axis=1)) > min_contrast
+
+def static_margins(previous: np.ndarray, current: np.ndarray, informative: np.ndarray) -> tuple:
+    # スクロールしても動かない上下の行（固定ヘッダー・フッター）の行数を返す
+    # 余白がたまたま一致しただけの場合は、あとから本文が入ってくるので固定とみなさない
+    same = previous == current
+    if same.all():
+        return len(same), 0
+    top = int(np.argmin(same))
+    bottom = int(np.argmin(same[::-1]))
+    if not informative[:top].any():
+        top = 0
+    if not informative[len(same) - bottom:].any():
+        bottom = 0
+    return top, bottom
+
+def find_scroll_offset(previous: np.ndarray, current: np.ndarray, informative: np.ndarray,
+                       min_overlap: int = 32, min_match: float = 0.8) -> Optional[int]:
+    # 前のフレームの行jと今のフレームの行iのハッシュが一致する組から移動量 j - i を数え、
+    # 票の多い移動量から順に、重なった行全体の一致率で確かめる
+    # 戻り値: 下方向へ動いた行数 / 0（動いていない・上方向へ戻った）/ None（重なりが見つからない）
+    height = len(current)
+    if height <= min_overlap:
+        return None
+    # カーソルの点滅など一部の行が変わっただけならスクロールしていない
+    if np.mean(previous == current) >= min_match:
+        return 0
+    limit = height - min_overlap
+    rows = np.flatnonzero(informative)
+    j, i = np.nonzero(previous[:, None] == current[None, rows])
+    shifts = j - rows[i]
+    shifts = shifts[(shifts != 0) & (np.abs(shifts) <= limit)]
+    if shifts.size == 0:
+        return None
+    votes = np.bincount(shifts + limit, minlength=2 * limit + 1)
+    # 票が同数なら重なりが大きい（移動量が小さい）方を選ぶ
+    order = np.lexsort((np.abs(np.arange(-limit, limit + 1)), -votes))
+    for index in order[:8]:
+        if votes[index] == 0:
+            break
+        shift = int(index) - limit
+        if shift > 0:
+            matched = previous[shift:] == current[:height - shift]
+        else:
+            matched = previous[:height + shift] == current[-shift:]
+        if np.mean(matched) >= min_match:
+            return max(shift, 0)
+    return None
+
+def locate_rows(haystack: np.ndarray, needle: np.ndarray, informative: np.ndarray,
+                min_overlap: int = 32, min_match: float = 0.8) -> Optional[int]:
+    # つなげ済みの行（haystack）の中で、今のフレームの行（needle）の先頭が来る位置を返す
+    # needleがhaystackの末尾からはみ出していてもよい。見つからなければNone
+    rows = np.flatnonzero(informative)
+    if rows.size == 0 or len(haystack) == 0:
+        return None
+    # 同じハッシュの行の組をソート済みの配列から一括で取り出し、位置の差ごとに数える
+    order = np.argsort(haystack, kind='stable')
+    sorted_hashes = haystack[order]
+    left = np.searchsorted(sorted_hashes, needle[rows], 'left')
+    counts = np.searchsorted(sorted_hashes, needle[rows], 'right') - left
+    total = int(counts.sum())
+    if total == 0:
+        return None
+    firsts = np.repeat(np.cumsum(counts) - counts, counts)
+    hay_rows = order[np.repeat(left, counts) + np.arange(total) - firsts]
+    positions = hay_rows - np.repeat(rows, counts)
+    offset = len(needle)
+    votes = np.bincount(positions + offset)
+    for index in np.argsort(-votes, kind='stable')[:8]:
+        if votes[index] == 0:
+            break
+        position = int(index) - offset
+        start, end = max(position, 0), min(position + len(needle), len(haystack))
+        if end - start < min(min_overlap, len(needle)):
+            continue
+        if np.mean(haystack[start:end] == needle[start - position:end - position]) >= min_match:
+            return position
+    return None
+
+class ScrollStitcher:
+    # スクロールしながら取得したフレームを、重なった部分を除いて縦につなげる
+    def __init__(self, min_overlap: int = 32, min_match: float = 0.8, max_height: int = 20000):
+        self.min_overlap = min_overlap
+        self.min_match = min_match
+        self.max_height = max_height
+        self.strips: List[np.ndarray] = []
+        self.height = 0
+        self.mode = None
+        self.header = None
+        self.footer = 0
+        self.gaps = 0
+        self._shape = None
+        self._previous_hashes = None
+        self._stitched_hashes: List[np.ndarray] = []
+
+    @property
+    def full(self) -> bool:
+        return self.height >= self.max_height
+
+    def add(self, frame) -> int:
+        # CapturedFrameを追加し、新たにつなげた行数を返す（変化がない・上方向へのスクロールは0）
+        array = frame.to_numpy()
+        gray = row_luminance(array)
+        hashes = row_hashes(gray)
+        if self._shape is None:
+            self.mode = frame.mode
+            self._shape = array.shape
+            self._previous_hashes = hashes
+            return self._append(array.copy(), hashes)
+        if array.shape != self._shape or self.full:
+            return 0
+
+        informative = informative_rows(gray)
+        if self.header is None:
+            top, bottom = static_margins(self._previous_hashes, hashes, informative)
+            # ほとんどの行が同じならまだスクロールしていない
+            if top + bottom > len(hashes) - self.min_overlap:
+                return 0
+            # 固定ヘッダー・フッターは1枚目の分だけを残し、以降は本文だけをつなげる
+            self.header, self.footer = top, bottom
+            if self.footer:
+                self.strips[0] = self.strips[0][:len(self.strips[0]) - self.footer]
+                self._stitched_hashes[0] = self._stitched_hashes[0][:len(self.strips[0])]
+                self.height -= self.footer
+
+        end = len(hashes) - self.footer
+        shift = find_scroll_offset(
+            self._previous_hashes[self.header:end], hashes[self.header:end],
+            informative[self.header:end], self.min_overlap, self.min_match
+        )
+        if shift == 0:
+            # 上に戻った間は一番下まで進んだフレームを基準のままにし、再び下へ進んだ分だけをつなげる
+            return 0
+        if shift is None:
+            # 前のフレームと重ならない場合は、つなげ済みの画像のどこに当たるかを探す
+            # （1画面以上上に戻った場合は取得済みなので捨て、末尾と重なる場合は続きだけをつなげる）
+            stitched = np.concatenate(self._stitched_hashes)
+            content = hashes[self.header:end]
+            position = locate_rows(stitched, content, informative[self.header:end], self.min_overlap, self.min_match)
+            if position is None:
+                # どこにも重ならない（スクロールが速すぎた）場合は本文をそのまま続ける
+                self.gaps += 1
+                shift = len(content)
+            else:
+                shift = position + len(content) - len(stitched)
+                if shift <= 0:
+                    return 0
+        self._previous_hashes = hashes
+        return self._append(array[end - shift:end].copy(), hashes[end - shift:end])
+
+    def _append(self, rows: np.ndarray, hashes: np.ndarray) -> int:
+        limit = max(0, self.max_height - self.height)
+        rows = rows[:limit]
+        if len(rows):
+            self.strips.append(rows)
+            self._stitched_hashes.append(hashes[:limit])
+            self.height += len(rows)
+        return len(rows)
+
+    def to_image(self):
+        # つなげた全体を1枚のPIL画像にする（フレームがなければNone）
+        if not self.strips:
+            return None
+        from ..services.capture_backends import CapturedFrame
+        stitched = np.ascontiguousarray(np.concatenate(self.strips, axis=0))
+        return CapturedFrame(stitched.tobytes(), stitched.shape[1], stitched.shape[0], self.mode).to_image()
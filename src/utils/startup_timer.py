@@ -0,0 +1,49 @@
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+class StartupTimer:
+    # 起動時の各フェーズ（import・初期化・初回描画など）の所要時間を記録する
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.enabled = False
+        self.records = []
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    @contextmanager
+    def phase(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, started, time.perf_counter() - started)
+
+    def mark(self, name: str):
+        if self.enabled:
+            self._record(name, time.perf_counter(), None)
+
+    def _record(self, name, started, duration):
+        with self._lock:
+            self.records.append((name, started - self.origin, duration, threading.current_thread().name))
+
+    def report(self) -> str:
+        lines = ["起動時間の計測結果:", f"  {'フェーズ':<28}{'開始(ms)':>10}{'所要(ms)':>10}  スレッド"]
+        with self._lock:
+            records = sorted(self.records, key=lambda record: record[1])
+        for name, offset, duration, thread_name in records:
+            duration_text = f"{duration * 1000:10.1f}" if duration is not None else f"{'-':>10}"
+            lines.append(f"  {name:<28}{offset * 1000:10.1f}{duration_text}  {thread_name}")
+        return '\n'.join(lines)
+
+    def print_report(self):
+        if self.enabled:
+            print(self.report(), file=sys.stderr)
+
+startup_timer = StartupTimer()
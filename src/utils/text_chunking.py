@@ -0,0 +1,74 @@
+import re
+from typing import List
+
+CJK = re.compile(r'[぀-ヿ㐀-鿿가-힯＀-￯]')
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+SENTENCE_BREAK = re.compile(r'(?<=[。！？.!?])\s*')
+
+def estimate_tokens(text: str) -> int:
+    # 厳密なトークナイザーは使わず、日本語などは1文字1トークン、それ以外は4文字1トークンで見積もる
+    cjk = len(CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def _split_oversized(piece: str, max_tokens: int) -> List[str]:
+    # 1段落が上限を超える場合は行、文、文字数の順に細かく分ける
+    for split in (str.splitlines, SENTENCE_BREAK.split):
+        parts = [part for part in split(piece) if part.strip()]
+        if len(parts) > 1:
+            result = []
+            for part in parts:
+                if estimate_tokens(part) > max_tokens:
+                    result.extend(_split_oversized(part, max_tokens))
+                else:
+                    result.append(part)
+            return result
+    # 最後の手段として見積もりが上限に収まる文字数で切る
+    size = max(1, len(piece) * max_tokens // max(1, estimate_tokens(piece)))
+    return [piece[start:start + size] for start in range(0, len(piece), size)]
+
+def chunk_text(text: str, max_tokens: int) -> List[str]:
+    # 段落単位で先頭から詰めていく。区切り位置は前方の内容だけで決まるので、
+    # 末尾にテキストを追加しても既存のチャンクは（最後の1つを除き）変わらない
+    pieces = []
+    for paragraph in PARAGRAPH_BREAK.split(text.strip()):
+        if not paragraph.strip():
+            continue
+        if estimate_tokens(paragraph) > max_tokens:
+            pieces.extend(_split_oversized(paragraph, max_tokens))
+        else:
+            pieces.append(paragraph)
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for piece in pieces:
+        tokens = estimate_tokens(piece)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append('\n\n'.join(current))
+            current = []
+            current_tokens = 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        chunks.append('\n\n'.join(current))
+    return chunks
+
+def group_by_tokens(texts: List[str], max_tokens: int) -> List[List[str]]:
+    # 集約段階用に要約を上限内のグループにまとめる（必ず2件以上まとめて段数を減らす）
+    groups = []
+    current = []
+    current_tokens = 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if len(current) >= 2 and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current = []
+            current_tokens = 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        if len(current) == 1 and groups:
+            groups[-1].append(current[0])
+        else:
+            groups.append(current)
+    return groups
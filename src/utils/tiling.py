@@ -0,0 +1,99 @@
+import math
+from typing import Dict, List, Tuple
+
+from PIL import Image
+
+def _tile_starts(length: int, tile_size: int, overlap: int) -> List[int]:
+    if length <= tile_size:
+        return [0]
+    # 重なりがタイル以上だと進まないため、タイルの半分までに抑える
+    overlap = min(max(0, overlap), tile_size // 2)
+    step = tile_size - overlap
+    count = math.ceil((length - overlap) / step)
+    # 端が細切れにならないよう均等に配置する
+    return [round(i * (length - tile_size) / (count - 1)) for i in range(count)]
+
+def plan_tiles(width: int, height: int, tile_size: int = 1024, overlap: int = 64) -> List[Tuple[int, int, Tuple[int, int, int, int]]]:
+    # (行, 列, (left, top, right, bottom)) を読み順（行ごとに左から右）で返す
+    tiles = []
+    for row, top in enumerate(_tile_starts(height, tile_size, overlap)):
+        for col, left in enumerate(_tile_starts(width, tile_size, overlap)):
+            box = (left, top, min(left + tile_size, width), min(top + tile_size, height))
+            tiles.append((row, col, box))
+    return tiles
+
+def is_blank(image: Image.Image, min_contrast: int = 16) -> bool:
+    # ほぼ単色のタイル（余白・背景のみ）にはテキストがないとみなしてAPIに送らない
+    low, high = image.convert('L').getextrema()
+    return high - low < min_contrast
+
+def _normalize(line: str) -> str:
+    return ''.join(line.split())
+
+def _strip_overlap(previous: List[str], current: List[str], max_lines: int = 5) -> List[str]:
+    # 上のタイルの末尾と現在のタイルの先頭で重複している行を取り除く
+    previous_norm = [_normalize(line) for line in previous if _normalize(line)]
+    current_norm = [_normalize(line) for line in current]
+    nonempty = [i for i, line in enumerate(current_norm) if line]
+
+    for count in range(min(max_lines, len(previous_norm), len(nonempty)), 0, -1):
+        if previous_norm[-count:] == [current_norm[i] for i in nonempty[:count]]:
+            return current[nonempty[count - 1] + 1:]
+    return current
+
+def _join_seam(left: str, right: str, max_chars: int = 32) -> str:
+    # 左右のタイルにまたがる1行をつなぐ（重なり部分で両方に写った文字は1回にする）
+    left, right = left.rstrip(), right.lstrip()
+    if not left or not right:
+        return left or right
+    for count in range(min(max_chars, len(left), len(right)), 1, -1):
+        if left[-count:] == right[:count]:
+            return left + right[count:]
+    # 日本語などは空白を入れずにつなぐ
+    separator = '' if not left[-1].isascii() or not right[0].isascii() else ' '
+    return left + separator + right
+
+def _merge_row(columns: List[List[str]]) -> List[str]:
+    # 同じ行のタイルを左から順にまとめる
+    merged = []
+    previous = []
+    for lines in columns:
+        lines = [line for line in lines if line.strip()]
+        if not merged:
+            merged = lines
+        elif len(lines) == len(merged):
+            # 行数が同じなら同じ高さの行とみなし、左右をつないで読み順を保つ
+            merged = [_join_seam(left, right) for left, right in zip(merged, lines)]
+        else:
+            # 対応が取れない場合は、すぐ左のタイル（重なりを共有するタイル）と丸ごと同じ行だけを除いて後ろに続ける
+            # 部分一致で比べると「OK」「1」など短い行が長い行に含まれて消えてしまう
+            seen = {_normalize(line) for line in previous}
+            merged = merged + [line for line in lines if _normalize(line) not in seen]
+        previous = lines
+    return merged
+
+def merge_tile_texts(texts: Dict[Tuple[int, int], str]) -> str:
+    if not texts:
+        return ''
+
+    rows = sorted({row for row, _ in texts})
+    cols = sorted({col for _, col in texts})
+    merged = []
+    for row in rows:
+        columns = []
+        for col in cols:
+            text = texts.get((row, col))
+            if not text:
+                continue
+            lines = text.strip().splitlines()
+            above = texts.get((row - 1, col))
+            if above:
+                lines = _strip_overlap(above.strip().splitlines(), lines)
+            columns.append(lines)
+        # 行ごとに左右のタイルをまとめてから追加する（列ごとに追加すると読み順が崩れる）
+        for line in _merge_row(columns):
+            # タイル境界で同じ行が連続した場合は1つにまとめる
+            if merged and line.strip() and _normalize(line) == _normalize(merged[-1]):
+                continue
+            merged.append(line)
+    return '\n'.join(merged).strip()
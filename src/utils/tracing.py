@@ -0,0 +1,229 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+# Prometheusのヒストグラムの区切り（秒）
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# ステータスバーに表示する段階と表示名
+STATUS_STAGES = (
+    ('capture', 'キャプチャ'),
+    ('encode', 'エンコード'),
+    ('completion', 'API'),
+    ('ui', '表示')
+)
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+class Span:
+    def __init__(self, name: str, parent: Optional['Span'], attrs: dict):
+        self.name = name
+        self.parent = parent
+        self.attrs = attrs
+        self.started = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+class StageStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.bytes = 0
+
+class Tracer:
+    # 処理の段階（キャプチャ・エンコード・API呼び出し・表示など）ごとの所要時間を集計する
+    def __init__(self):
+        self.enabled = False
+        self.stats = {}
+        self.tokens = {'prompt': 0, 'completion': 0}
+        self._lock = threading.Lock()
+        self._log = None
+        self._server = None
+
+    def configure(self, config):
+        self.enabled = config.tracing_enabled
+        if self.enabled and config.trace_log and self._log is None:
+            directory = os.path.dirname(config.trace_log)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            self._log = open(config.trace_log, 'a', encoding='utf-8')
+        if self.enabled and config.metrics_port and self._server is None:
+            self.serve_metrics(config.metrics_port)
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        if not self.enabled:
+            yield Span(name, None, attrs)
+            return
+        span = Span(name, _current_span.get(), attrs)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.duration = time.perf_counter() - span.started
+            self._record(span)
+
+    def current(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def annotate(self, **attrs):
+        # 実行中のスパンに属性（送信バイト数・トークン数など）を追加する
+        span = _current_span.get()
+        if span is not None:
+            span.set(**attrs)
+
+    def _record(self, span: Span):
+        with self._lock:
+            stats = self.stats.get(span.name)
+            if stats is None:
+                stats = self.stats[span.name] = StageStats()
+            stats.count += 1
+            stats.total += span.duration
+            stats.max = max(stats.max, span.duration)
+            stats.last = span.duration
+            stats.bytes += span.attrs.get('bytes', 0)
+            for index, bound in enumerate(BUCKETS):
+                if span.duration <= bound:
+                    stats.buckets[index] += 1
+            self.tokens['prompt'] += span.attrs.get('prompt_tokens', 0)
+            self.tokens['completion'] += span.attrs.get('completion_tokens', 0)
+            if self._log is not None:
+                record = {
+                    'time': datetime.now().isoformat(timespec='milliseconds'),
+                    'span': span.name,
+                    'parent': span.parent.name if span.parent is not None else None,
+                    'ms': round(span.duration * 1000, 2),
+                    'thread': threading.current_thread().name
+                }
+                record.update(span.attrs)
+                self._log.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+                self._log.flush()
+
+    def last_ms(self, prefix: str) -> Optional[float]:
+        # 名前が prefix で始まるスパンのうち、直近の値（ms）
+        with self._lock:
+            values = [stats.last for name, stats in self.stats.items()
+                      if name == prefix or name.startswith(prefix + '.')]
+        return max(values) * 1000 if values else None
+
+    def stage_timings(self) -> dict:
+        # ステータスバーに表示する各段階の直近の値（ms）
+        timings = {}
+        for prefix, _ in STATUS_STAGES:
+            value = self.last_ms(prefix)
+            if value is not None:
+                timings[prefix] = round(value, 1)
+        return timings
+
+    def status_text(self) -> str:
+        labels = dict(STATUS_STAGES)
+        return ' / '.join(f"{labels[prefix]} {value:.0f}ms" for prefix, value in self.stage_timings().items())
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                name: {
+                    'count': stats.count,
+                    'avg_ms': round(stats.total / stats.count * 1000, 2),
+                    'max_ms': round(stats.max * 1000, 2),
+                    'bytes': stats.bytes
+                }
+                for name, stats in self.stats.items()
+            }
+
+    def prometheus_text(self) -> str:
+        lines = [
+            '# HELP vision_assist_stage_seconds Time spent in each processing stage.',
+            '# TYPE vision_assist_stage_seconds histogram'
+        ]
+        with self._lock:
+            stats_items = sorted(self.stats.items())
+            tokens = dict(self.tokens)
+            for name, stats in stats_items:
+                for bound, count in zip(BUCKETS, stats.buckets):
+                    lines.append(f'vision_assist_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+                lines.append(f'vision_assist_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {stats.count}')
+                lines.append(f'vision_assist_stage_seconds_sum{{stage="{name}"}} {stats.total:.6f}')
+                lines.append(f'vision_assist_stage_seconds_count{{stage="{name}"}} {stats.count}')
+            lines.append('# HELP vision_assist_payload_bytes_total Bytes produced or sent by each stage.')
+            lines.append('# TYPE vision_assist_payload_bytes_total counter')
+            for name, stats in stats_items:
+                if stats.bytes:
+                    lines.append(f'vision_assist_payload_bytes_total{{stage="{name}"}} {stats.bytes}')
+        lines.append('# HELP vision_assist_tokens_total Tokens reported by the API.')
+        lines.append('# TYPE vision_assist_tokens_total counter')
+        for kind, count in tokens.items():
+            lines.append(f'vision_assist_tokens_total{{kind="{kind}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def serve_metrics(self, port: int, host: str = '127.0.0.1'):
+        # Prometheusから取得できるよう /metrics をテキスト形式で公開する
+        tracer = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = tracer.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError as e:
+            print(f"Error starting metrics endpoint: {e}")
+            return
+        threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True).start()
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._log is not None:
+            with self._lock:
+                self._log.close()
+                self._log = None
+
+def traced(name: str):
+    # サービスのメソッドなどを丸ごと計測するデコレーター（async関数にも対応）
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+tracer = Tracer()
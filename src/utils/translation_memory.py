@@ -0,0 +1,136 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, Iterable, List, Tuple
+
+# 文末で区切る（「。」などの直後、または英文のピリオド等の後の空白）
+SENTENCE_BREAK = re.compile(r'(?<=[。！？])|(?<=[.!?])(?=\s)')
+EDGE_SPACE = re.compile(r'^(\s*)(.*?)(\s*)$', re.DOTALL)
+
+def normalize_segment(segment: str) -> str:
+    # 全角・半角の揺れや空白の違いを吸収する
+    return ' '.join(unicodedata.normalize('NFKC', segment).split())
+
+def segment_hash(segment: str) -> str:
+    return hashlib.sha256(normalize_segment(segment).encode('utf-8')).hexdigest()
+
+def split_segments(text: str) -> List[Tuple[str, bool]]:
+    # テキストを (断片, 翻訳対象か) の列に分割する。翻訳対象でない断片は改行や空白で、そのまま結合すれば元に戻る
+    parts = []
+    for line in text.splitlines(keepends=True):
+        body = line.rstrip('\r\n')
+        for sentence in SENTENCE_BREAK.split(body):
+            leading, core, trailing = EDGE_SPACE.match(sentence).groups()
+            if leading:
+                parts.append((leading, False))
+            if core:
+                # 数字や記号だけの断片は訳す必要がない
+                parts.append((core, any(char.isalpha() for char in core)))
+            if trailing:
+                parts.append((trailing, False))
+        if len(line) > len(body):
+            parts.append((line[len(body):], False))
+    return parts
+
+class TranslationMemory:
+    # 翻訳済みの文・ラベルを正規化したハッシュと言語の組で保存し、次回以降の翻訳で再利用する
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS segments ('
+                ' hash TEXT NOT NULL,'
+                ' source_lang TEXT NOT NULL,'
+                ' target_lang TEXT NOT NULL,'
+                ' model TEXT NOT NULL,'
+                ' source TEXT NOT NULL,'
+                ' translation TEXT NOT NULL,'
+                ' hits INTEGER NOT NULL DEFAULT 0,'
+                ' updated_at REAL NOT NULL)'
+            )
+            self._conn.execute(
+                'CREATE UNIQUE INDEX IF NOT EXISTS segments_key'
+                ' ON segments (hash, source_lang, target_lang, model)'
+            )
+
+    @classmethod
+    def from_config(cls, config) -> 'TranslationMemory':
+        return cls(config.translation_memory_path)
+
+    def lookup(self, segments: Iterable[str], source_lang: str, target_lang: str,
+               model: str) -> Dict[str, str]:
+        # 見つかった断片だけを {元の断片: 訳} で返す
+        by_hash = {}
+        for segment in set(segments):
+            by_hash.setdefault(segment_hash(segment), []).append(segment)
+        if not by_hash:
+            return {}
+
+        found = {}
+        hashes = list(by_hash)
+        with self._lock:
+            # SQLiteのパラメータ数の上限を超えないよう分けて問い合わせる
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                rows = self._conn.execute(
+                    'SELECT hash, translation FROM segments'
+                    ' WHERE source_lang = ? AND target_lang = ? AND model = ?'
+                    f' AND hash IN ({",".join("?" * len(chunk))})',
+                    [source_lang, target_lang, model] + chunk
+                ).fetchall()
+                for key, translation in rows:
+                    for segment in by_hash[key]:
+                        found[segment] = translation
+            if found:
+                with self._conn:
+                    self._conn.executemany(
+                        'UPDATE segments SET hits = hits + 1'
+                        ' WHERE hash = ? AND source_lang = ? AND target_lang = ? AND model = ?',
+                        [(segment_hash(segment), source_lang, target_lang, model) for segment in set(found)]
+                    )
+            self.hits += len(found)
+            self.misses += sum(len(group) for group in by_hash.values()) - len(found)
+        return found
+
+    def store(self, translations: Dict[str, str], source_lang: str, target_lang: str, model: str):
+        now = time.time()
+        rows = [
+            (segment_hash(source), source_lang, target_lang, model, source, translation, now)
+            for source, translation in translations.items()
+            if translation.strip()
+        ]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT INTO segments (hash, source_lang, target_lang, model, source, translation, updated_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)'
+                ' ON CONFLICT (hash, source_lang, target_lang, model)'
+                ' DO UPDATE SET translation = excluded.translation, updated_at = excluded.updated_at',
+                rows
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            count = self._conn.execute('SELECT COUNT(*) FROM segments').fetchone()[0]
+        return {'segments': count, 'hits': self.hits, 'misses': self.misses}
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM segments')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+
+from benchmarks import mock_server
+from benchmarks.mock_server import MockServer, MockSettings
+
+@pytest.fixture
+def mock_api(monkeypatch, tmp_path):
+    # ベンチマーク用のモックサーバーにHTTPで接続してサービスを動かす
+    # 受け取ったリクエストは server.bodies に残り、server.reply を差し替えると応答を変えられる
+    server = MockServer(MockSettings(latency=0.0, jitter=0.0, response_tokens=4))
+    server.bodies = []
+    server.reply = mock_server.mock_content
+
+    def content(body, settings):
+        server.bodies.append(body)
+        return server.reply(body, settings)
+
+    monkeypatch.setattr(mock_server, 'mock_content', content)
+    monkeypatch.setenv('OPENAI_API_KEY', 'x')
+    monkeypatch.setenv('OPENAI_BASE_URL', server.start().base_url)
+    monkeypatch.setenv('SAVE_DIRECTORY', str(tmp_path / 'output'))
+    try:
+        yield server
+    finally:
+        server.stop()
+
+def prompt_of(body) -> str:
+    return mock_server._prompt_text(body['messages'])
+
+def run_async(services, coroutine):
+    # 非同期クライアントの接続は、使ったのと同じイベントループで閉じる
+    async def run():
+        try:
+            return await coroutine
+        finally:
+            await services.aclose()
+    return asyncio.run(run())
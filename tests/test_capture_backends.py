@@ -0,0 +1,13 @@
+import numpy as np
+import pytest
+
+from src.services.capture_backends import CapturedFrame
+
+@pytest.mark.parametrize('mode', ['BGRA', 'RGB'])
+def test_to_image_box_matches_crop_of_full_conversion(mode):
+    channels = 4 if mode == 'BGRA' else 3
+    pixels = np.random.default_rng(0).integers(0, 256, (40, 60, channels), dtype=np.uint8)
+    frame = CapturedFrame(bytearray(pixels.tobytes()), 60, 40, mode)
+    for box in [(0, 0, 60, 40), (5, 3, 60, 40), (59, 39, 60, 40), (10, 20, 30, 21)]:
+        assert frame.to_image(box).tobytes() == frame.to_image().crop(box).tobytes()
+    assert frame.to_image((10, 10, 10, 20)).size == (0, 10)
@@ -0,0 +1,36 @@
+from PyQt6.QtCore import QRect
+
+from src.services.capture_backends import CapturedFrame
+from src.services.capture_service import CaptureService
+
+class FakeScreen:
+    def __init__(self, geometry, ratio):
+        self._geometry = geometry
+        self._ratio = ratio
+
+    def geometry(self):
+        return self._geometry
+
+    def devicePixelRatio(self):
+        return self._ratio
+
+def test_selection_on_hidpi_screen_maps_to_physical_pixels():
+    # 物理ピクセル2880x1800のモニターが、倍率2の論理座標1440x900として見えている
+    monitor = {'left': 1920, 'top': 0, 'width': 2880, 'height': 1800}
+    screens = [FakeScreen(QRect(0, 0, 1920, 1080), 1.0), FakeScreen(QRect(1920, 0, 1440, 900), 2.0)]
+    screen = CaptureService.match_screen(screens, monitor)
+    assert screen is screens[1]
+
+    rect = CaptureService.physical_rect(QRect(100, 50, 200, 100), screen.devicePixelRatio())
+    assert (rect.x(), rect.y(), rect.width(), rect.height()) == (200, 100, 400, 200)
+    assert CaptureService.area_bbox(rect, monitor) == (2120, 100, 2520, 300)
+
+    frame = CapturedFrame(bytearray(2880 * 1800 * 4), 2880, 1800, 'BGRA')
+    assert CaptureService.frame_box(frame, rect) == (200, 100, 600, 300)
+    assert CaptureService.frame_box(frame, QRect(2800, 1700, 400, 400)) == (2800, 1700, 2880, 1800)
+
+def test_match_screen_accepts_logical_origins():
+    # 左上の位置も論理座標で返すプラットフォーム（X11でQT_SCALE_FACTORを使う場合など）
+    monitor = {'left': 3840, 'top': 0, 'width': 3840, 'height': 2160}
+    screens = [FakeScreen(QRect(0, 0, 1920, 1080), 2.0), FakeScreen(QRect(1920, 0, 1920, 1080), 2.0)]
+    assert CaptureService.match_screen(screens, monitor) is screens[1]
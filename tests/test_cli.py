@@ -0,0 +1,58 @@
+import asyncio
+import json
+
+from PIL import Image, ImageDraw
+
+from benchmarks.mock_server import _image_count
+from src import cli
+
+def write_images(directory, count):
+    paths = []
+    for index in range(count):
+        image = Image.new('RGB', (240, 80), 'white')
+        ImageDraw.Draw(image).text((10, 10), f"page {index}", fill='black')
+        path = directory / f"page{index}.png"
+        image.save(path)
+        paths.append(str(path))
+    return paths
+
+def read_records_after(path, skip):
+    lines = path.read_text(encoding='utf-8').splitlines()[skip:]
+    return [json.loads(line) for line in lines]
+
+def run(argv):
+    return asyncio.run(cli.run_batch(cli.parse_args(argv)))
+
+def test_resume_skips_completed_images_and_retries_failed_ones(mock_api, monkeypatch, tmp_path):
+    monkeypatch.setenv('TRACING_ENABLED', 'false')
+    monkeypatch.setenv('OCR_ENGINE', 'remote')
+    images = tmp_path / 'images'
+    images.mkdir()
+    paths = write_images(images, 4)
+    output = tmp_path / 'ocr.jsonl'
+    # 前回の出力：1枚目は成功、2枚目は失敗、3枚目は別の処理で成功、途中で書きかけた行も残っている
+    output.write_text(
+        json.dumps({'path': paths[0], 'task': 'ocr', 'ocr': 'done before'}) + '\n'
+        + json.dumps({'path': paths[1], 'task': 'ocr', 'error': 'timeout'}) + '\n'
+        + json.dumps({'path': paths[2], 'task': 'vision', 'vision': 'other task'}) + '\n'
+        + '{"path": "trunc',
+        encoding='utf-8'
+    )
+
+    assert run([str(images), '--task', 'ocr', '--output', str(output)]) == 0
+    # 成功済みの1枚目以外の3枚だけを送る
+    assert sum(_image_count(body['messages']) for body in mock_api.bodies) == 3
+    added = read_records_after(output, 4)
+    assert sorted(record['path'] for record in added) == paths[1:]
+    assert all('error' not in record and record['ocr'] for record in added)
+
+    # 再度実行しても処理済みの画像は送らない
+    count = len(mock_api.bodies)
+    assert run([str(images), '--task', 'ocr', '--output', str(output)]) == 0
+    assert len(mock_api.bodies) == count
+
+    # --no-resume なら出力にあっても処理し直す（今回処理した3枚はキャッシュから返り、1枚目だけを送る）
+    assert run([str(images), '--task', 'ocr', '--output', str(output), '--no-resume']) == 0
+    assert sum(_image_count(body['messages']) for body in mock_api.bodies[count:]) == 1
+    assert len(output.read_text(encoding='utf-8').splitlines()) == 4 + 3 + 4
+
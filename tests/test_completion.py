@@ -0,0 +1,196 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from src.services import completion
+from src.services.completion import (
+    RequestCancelled, _Flight, bind_context, cancellation, create_completion, raise_if_cancelled
+)
+from src.utils.tracing import tracer
+
+class PublishOnRelease:
+    # subscribeがロックを放した直後に、先行リクエストが次の断片を出した状況を再現する
+    def __init__(self, flight, delta):
+        self.flight = flight
+        self.delta = delta
+        self.inner = threading.Lock()
+        self.armed = False
+
+    def __enter__(self):
+        self.inner.acquire()
+
+    def __exit__(self, *exc):
+        self.inner.release()
+        if self.armed:
+            self.armed = False
+            self.flight.publish(self.delta)
+
+def test_subscribe_replays_buffered_parts_before_live_deltas():
+    flight = _Flight()
+    flight.publish('a')
+    flight.lock = PublishOnRelease(flight, 'b')
+    received = []
+    flight.lock.armed = True
+    flight.subscribe(received.append)
+    assert received == ['a', 'b']
+
+class FakeClient:
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        self.calls += 1
+        self.entered.set()
+        self.release.wait(2)
+        raise self.error
+
+def bad_request():
+    request = httpx.Request('POST', 'http://localhost/v1/chat/completions')
+    response = httpx.Response(400, request=request)
+    return openai.BadRequestError('invalid', response=response, body=None)
+
+def test_followers_get_the_leaders_permanent_error_without_resending():
+    client = FakeClient(bad_request())
+    errors = []
+
+    def call():
+        try:
+            create_completion(client, 'model', [{'role': 'user', 'content': 'same'}])
+        except Exception as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    client.entered.wait(2)
+    follower = threading.Thread(target=call)
+    follower.start()
+    time.sleep(0.05)
+    client.release.set()
+    leader.join()
+    follower.join()
+    assert client.calls == 1
+    assert len(errors) == 2 and all(isinstance(e, openai.BadRequestError) for e in errors)
+
+def test_cancelled_caller_does_not_send_and_worker_threads_inherit_the_check():
+    client = FakeClient(bad_request())
+    cancelled = threading.Event()
+    with cancellation(cancelled.is_set):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            assert executor.submit(bind_context(raise_if_cancelled)).result() is None
+            cancelled.set()
+            with pytest.raises(RequestCancelled):
+                executor.submit(bind_context(raise_if_cancelled)).result()
+        with pytest.raises(RequestCancelled):
+            create_completion(client, 'model', [{'role': 'user', 'content': 'cancelled'}])
+    assert client.calls == 0
+
+def chunk(text):
+    return SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+class StreamingClient:
+    def __init__(self, reject_stream_options=False):
+        self.reject_stream_options = reject_stream_options
+        self.requests = []
+        self.sent = [threading.Event(), threading.Event()]
+        self.release = [threading.Event(), threading.Event()]
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        if self.reject_stream_options and 'stream_options' in kwargs:
+            request = httpx.Request('POST', 'http://localhost/v1/chat/completions')
+            raise openai.BadRequestError('unknown parameter', response=httpx.Response(400, request=request), body=None)
+        return self.stream()
+
+    def stream(self):
+        for index, text in enumerate('ab'):
+            yield chunk(text)
+            self.sent[index].set()
+            self.release[index].wait(2)
+        yield chunk('c')
+
+    def finish(self):
+        for event in self.release:
+            event.set()
+
+def run_follower(client, messages, on_delta=None, check=None):
+    errors = []
+
+    def call():
+        try:
+            with cancellation(check or (lambda: False)):
+                create_completion(client, 'model', messages, on_delta=on_delta)
+        except BaseException as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=call)
+    thread.start()
+    return thread, errors
+
+def start_leader(client, messages):
+    leader = threading.Thread(
+        target=create_completion, args=(client, 'model', messages), kwargs={'on_delta': lambda delta: None}
+    )
+    leader.start()
+    assert client.sent[0].wait(2)
+    return leader
+
+def test_follower_cancelled_by_its_listener_returns_without_waiting_for_the_leader():
+    client = StreamingClient()
+    messages = [{'role': 'user', 'content': 'listener'}]
+    leader = start_leader(client, messages)
+    received = []
+
+    def on_delta(delta):
+        if received:
+            raise RequestCancelled()
+        received.append(delta)
+
+    follower, errors = run_follower(client, messages, on_delta)
+    time.sleep(0.05)
+    client.release[0].set()
+    # 2つ目の断片で取り消され、先行リクエストの最後の断片を待たずに戻る
+    follower.join(1)
+    assert not follower.is_alive()
+    assert received == ['a'] and isinstance(errors[0], RequestCancelled)
+    client.finish()
+    leader.join(2)
+    assert len(client.requests) == 1
+
+def test_follower_cancelled_by_its_caller_returns_without_waiting_for_the_leader():
+    client = StreamingClient()
+    messages = [{'role': 'user', 'content': 'caller'}]
+    leader = start_leader(client, messages)
+    cancelled = threading.Event()
+    follower, errors = run_follower(client, messages, check=cancelled.is_set)
+    time.sleep(0.05)
+    cancelled.set()
+    follower.join(1)
+    assert not follower.is_alive()
+    assert isinstance(errors[0], RequestCancelled)
+    client.finish()
+    leader.join(2)
+    assert len(client.requests) == 1
+
+def test_stream_options_are_dropped_when_the_server_rejects_them(monkeypatch):
+    monkeypatch.setattr(tracer, 'enabled', True)
+    monkeypatch.setattr(completion, '_stream_usage_rejected', False)
+    client = StreamingClient(reject_stream_options=True)
+    client.finish()
+    received = []
+    assert create_completion(client, 'model', [{'role': 'user', 'content': 'usage'}], on_delta=received.append) == 'abc'
+    assert ['stream_options' in request for request in client.requests] == [True, False]
+
+    create_completion(client, 'model', [{'role': 'user', 'content': 'again'}], on_delta=received.append)
+    assert 'stream_options' not in client.requests[-1]
@@ -0,0 +1,124 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt6.QtWidgets import QApplication
+
+from src.gui.daemon import CaptureDaemon, send_command
+from src.services.factory import ServiceContainer
+from src.utils.config import Config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class FakeWindow:
+    def __init__(self, services=None):
+        self._services = services
+        self.services = services
+        self.resident = False
+        self.calls = []
+
+    def capture_full_screen(self):
+        self.calls.append('capture-full')
+
+    def capture_area(self):
+        raise RuntimeError('no screen')
+
+    def show(self):
+        self.calls.append('show')
+
+    def close(self):
+        self.calls.append('close')
+
+def application():
+    app = QApplication.instance() or QApplication([])
+    if not isinstance(app, QApplication):
+        pytest.skip('a non-GUI Qt application already exists in this process')
+    return app
+
+def wait_until(app, condition, timeout=5.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end and not condition():
+        app.processEvents()
+        time.sleep(0.01)
+    app.processEvents()
+    return condition()
+
+def send(app, name, command):
+    # send_commandは応答を待つため、待ち受け側のイベントループを回しながら別スレッドで送る
+    result = []
+    thread = threading.Thread(target=lambda: result.append(send_command(name, command, quiet=True)))
+    thread.start()
+    assert wait_until(app, lambda: not thread.is_alive())
+    return result[0]
+
+def run_process(app, code):
+    # 別プロセスからの接続には、待ち受け側のイベントループを回しながら応答する
+    process = subprocess.Popen(
+        [sys.executable, '-c', code], cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+    assert wait_until(app, lambda: process.poll() is not None, timeout=30)
+    return process.returncode, process.stdout.read()
+
+@pytest.fixture
+def daemon_config(mock_api, monkeypatch):
+    monkeypatch.setenv('DAEMON_SOCKET_NAME', f'vision-assist-test-{uuid.uuid4().hex[:8]}')
+    monkeypatch.setenv('DAEMON_HOTKEYS', '')
+    monkeypatch.setenv('DAEMON_KEEPALIVE_INTERVAL', '0')
+    return Config()
+
+def test_socket_commands_are_acknowledged_and_dispatched(daemon_config):
+    app = application()
+    window = FakeWindow()
+    daemon = CaptureDaemon(daemon_config, window)
+    assert daemon.start()
+    try:
+        assert window.resident
+        name = daemon_config.daemon_socket_name
+        assert send(app, name, 'ping') == 0
+        assert send(app, name, 'capture-full') == 0
+        # 応答を返してからイベントループでキャプチャを始める
+        assert wait_until(app, lambda: 'capture-full' in window.calls)
+        assert send(app, name, 'unknown') == 1
+
+        # キャプチャに失敗しても常駐プロセスは落ちず、ウィンドウを表示する
+        assert send(app, name, 'capture-area') == 0
+        assert wait_until(app, lambda: 'show' in window.calls)
+
+        # --send で別プロセスからコマンドを送れる
+        window.calls.clear()
+        code, output = run_process(app, 'import sys; sys.argv = ["main", "--send", "capture-full"]\n'
+                                        'from src.main import main; main()')
+        assert (code, output.strip()) == (0, 'ok')
+        assert wait_until(app, lambda: 'capture-full' in window.calls)
+
+        # 同じ名前では2つ目のプロセスは常駐しない
+        code, output = run_process(app, 'from PyQt6.QtCore import QCoreApplication\n'
+                                        'from src.gui.daemon import CaptureDaemon\n'
+                                        'from src.utils.config import Config\n'
+                                        'app = QCoreApplication([])\n'
+                                        'print(CaptureDaemon(Config(), None)._listen())')
+        assert output.strip().splitlines()[-1] == 'False'
+        assert 'already running' in output
+    finally:
+        daemon.quit()
+    assert 'close' in window.calls and not window.resident
+    assert send(app, daemon_config.daemon_socket_name, 'ping') == 1
+
+def test_keep_alive_reaches_the_api_without_completions(daemon_config, mock_api):
+    application()
+    services = ServiceContainer(daemon_config)
+    daemon = CaptureDaemon(daemon_config, FakeWindow(services))
+    try:
+        daemon._ping_api()
+        stats = mock_api.state.stats()
+        assert stats['model_requests'] == 1
+        assert stats['requests'] == 0
+    finally:
+        services.close()
@@ -0,0 +1,35 @@
+from PIL import Image, ImageDraw
+
+from src.utils.frame_diff import FrameDeduplicator, frame_signature, changed_fractions
+
+def screen(amount):
+    image = Image.new('RGB', (1600, 1000), 'white')
+    draw = ImageDraw.Draw(image)
+    for y in range(20, 980, 24):
+        draw.text((20, y), "Invoice line item description and quantity", fill='black')
+    draw.text((1400, 500), f"Total: {amount}", fill='black')
+    return image
+
+def test_identical_capture_is_a_duplicate():
+    deduplicator = FrameDeduplicator()
+    deduplicator.observe(screen('12,345'))
+    _, duplicate = deduplicator.observe(screen('12,345'))
+    assert duplicate
+
+def test_one_digit_change_is_not_a_duplicate():
+    # 縮小画像では閾値以下の変化でも、元の解像度で違いがあれば前回の結果を使わない
+    before, after = screen('12,345'), screen('12,346')
+    fraction = changed_fractions(frame_signature(after), frame_signature(before)[None])[0]
+    deduplicator = FrameDeduplicator()
+    assert fraction <= deduplicator.threshold
+    deduplicator.observe(before)
+    _, duplicate = deduplicator.observe(after)
+    assert not duplicate
+
+def test_history_keeps_only_signatures_and_hashes():
+    # 元の解像度の画像は保持しない（4Kのキャプチャでも履歴1件はシグネチャ分の大きさ）
+    deduplicator = FrameDeduplicator()
+    record, _ = deduplicator.observe(screen('12,345'))
+    arrays = [value for value in vars(record).values() if hasattr(value, 'nbytes')]
+    assert sum(array.nbytes for array in arrays) <= 128 * 128 * 2
+    assert isinstance(record.digest, str)
@@ -0,0 +1,92 @@
+import sqlite3
+
+from PIL import Image
+
+from src.utils.history_store import HistoryStore
+
+def make_store(directory, on_change=None):
+    return HistoryStore(str(directory), thumbnail_size=32, on_change=on_change)
+
+def texts(entries):
+    return [entry.texts['ocr'] for entry in entries]
+
+def test_record_update_and_search_terms_of_any_length(tmp_path):
+    store = make_store(tmp_path)
+    try:
+        first = store.record('ocr', ocr='東京都の天気は晴れ')
+        store.record('ocr', ocr='OK ボタンを押す')
+        store.update(first, summary='明日は雨')
+        store.flush()
+
+        assert texts(store.search('天気は晴')) == ['東京都の天気は晴れ']
+        # 3文字未満の語も索引から探す（大文字小文字は区別しない）
+        assert texts(store.search('天気')) == ['東京都の天気は晴れ']
+        assert texts(store.search('ok')) == ['OK ボタンを押す']
+        assert texts(store.search('雨')) == ['東京都の天気は晴れ']
+        assert texts(store.search('れ')) == ['東京都の天気は晴れ']
+        assert texts(store.search('東京 雨')) == ['東京都の天気は晴れ']
+        assert texts(store.search('東京 OK')) == []
+        assert texts(store.search('ボタン', kind='vision')) == []
+        assert texts(store.search('')) == ['OK ボタンを押す', '東京都の天気は晴れ']
+    finally:
+        store.close()
+
+def test_short_term_search_uses_the_bigram_index(tmp_path):
+    store = make_store(tmp_path)
+    try:
+        if not store.trigram:
+            return
+        store.record('ocr', ocr='天気')
+        store.flush()
+        statements = []
+        store._conn.set_trace_callback(statements.append)
+        store.search('天')
+        store._conn.set_trace_callback(None)
+        assert any('captures_bigram' in statement for statement in statements)
+        assert not any('LIKE' in statement for statement in statements)
+    finally:
+        store.close()
+
+def test_existing_history_is_indexed_when_the_bigram_table_is_added(tmp_path):
+    store = make_store(tmp_path)
+    store.record('ocr', ocr='天気')
+    store.close()
+    if not store.trigram:
+        return
+    conn = sqlite3.connect(str(tmp_path / 'history.sqlite3'))
+    with conn:
+        conn.execute('DROP TABLE captures_bigram')
+    conn.close()
+
+    store = make_store(tmp_path)
+    try:
+        assert texts(store.search('天')) == ['天気']
+    finally:
+        store.close()
+
+def test_delete_and_clear_run_on_the_writer_thread(tmp_path):
+    changes = []
+    store = make_store(tmp_path, on_change=lambda: changes.append(1))
+    try:
+        image = Image.new('RGB', (64, 48), 'white')
+        first = store.record('ocr', image=image, ocr='一件目')
+        store.record('ocr', image=image, ocr='二件目')
+        store.flush()
+        thumbnail = store.get(first).thumbnail
+        assert store.count() == 2
+
+        # recordの直後に呼んでも、書き込みと同じ順に処理される
+        store.delete(first)
+        store.flush()
+        assert store.get(first) is None
+        assert not (tmp_path / 'thumbnails' / thumbnail.split('/')[-1]).exists()
+        assert texts(store.search('一件')) == []
+
+        store.clear()
+        store.flush()
+        assert store.count() == 0
+        assert list((tmp_path / 'thumbnails').iterdir()) == []
+        assert store.search('二件') == []
+        assert changes
+    finally:
+        store.close()
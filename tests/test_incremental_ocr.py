@@ -0,0 +1,45 @@
+import pytest
+from PIL import Image, ImageDraw
+
+from src.services.incremental_ocr import IncrementalOCR
+
+class FlakyOCR:
+    def __init__(self):
+        self.fail = False
+        self.calls = 0
+
+    def perform_ocr(self, image, lang):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError('rate limited')
+        return f"band {image.height} #{self.calls}"
+
+def make_page():
+    image = Image.new('RGB', (300, 800), 'white')
+    draw = ImageDraw.Draw(image)
+    for y in range(10, 790, 30):
+        draw.text((10, y), f"row {y}", fill='black')
+    return image
+
+def test_failed_bands_are_retried_on_the_next_update():
+    ocr = FlakyOCR()
+    incremental = IncrementalOCR(ocr, band_height=200)
+    page = make_page()
+    incremental.update(page)
+
+    changed = page.copy()
+    ImageDraw.Draw(changed).text((150, 20), "CHANGED", fill='black')
+    ocr.fail = True
+    with pytest.raises(RuntimeError):
+        incremental.update(changed)
+
+    # 同じフレームでも、失敗した帯だけは再びOCRする
+    ocr.fail = False
+    calls = ocr.calls
+    text = incremental.update(changed)
+    assert ocr.calls == calls + 1
+    assert f"#{ocr.calls}" in text
+
+    calls = ocr.calls
+    incremental.update(changed)
+    assert ocr.calls == calls
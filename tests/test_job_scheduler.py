@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+from PyQt6.QtCore import QCoreApplication
+
+from src.gui.job_scheduler import JobScheduler, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from src.services.completion import raise_if_cancelled
+
+@pytest.fixture
+def scheduler():
+    app = QCoreApplication.instance() or QCoreApplication([])
+    scheduler = JobScheduler(max_workers=1)
+    yield scheduler
+    scheduler.shutdown()
+
+def wait_until(condition, timeout=2.0):
+    # ワーカーからのシグナルはメインスレッドのイベントループで配られる
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        QCoreApplication.processEvents()
+        time.sleep(0.01)
+    QCoreApplication.processEvents()
+    return condition()
+
+def block_worker(scheduler):
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocker():
+        started.set()
+        release.wait(2)
+
+    scheduler.submit(blocker, priority=PRIORITY_INTERACTIVE)
+    assert started.wait(2)
+    return release
+
+def test_higher_priority_jobs_run_first(scheduler):
+    release = block_worker(scheduler)
+    order = []
+    scheduler.submit(order.append, 'background', priority=PRIORITY_BACKGROUND)
+    scheduler.submit(order.append, 'interactive', priority=PRIORITY_INTERACTIVE)
+    release.set()
+    assert wait_until(lambda: len(order) == 2)
+    assert order == ['interactive', 'background']
+
+def test_newer_job_with_same_key_replaces_queued_one(scheduler):
+    release = block_worker(scheduler)
+    ran = []
+    finished = []
+    scheduler.submit(ran.append, 'old', key='capture', on_finished=finished.append)
+    scheduler.submit(lambda value: ran.append(value) or value, 'new', key='capture', on_finished=finished.append)
+    release.set()
+    assert wait_until(lambda: finished == ['new'])
+    assert ran == ['new']
+
+def test_cancelled_non_streaming_job_stops_before_next_stage(scheduler):
+    first_stage = threading.Event()
+    proceed = threading.Event()
+    stages = []
+    failed = []
+
+    def job():
+        stages.append('ocr')
+        first_stage.set()
+        proceed.wait(2)
+        # サービスはAPIを呼ぶ前にこれで取り消しを確かめる
+        raise_if_cancelled()
+        stages.append('summary')
+        return 'done'
+
+    job_id = scheduler.submit(job, on_failed=failed.append)
+    assert first_stage.wait(2)
+    scheduler.cancel(job_id)
+    proceed.set()
+    assert wait_until(lambda: not scheduler.is_started(job_id))
+    assert stages == ['ocr']
+    assert failed == []
+
+def test_superseded_running_job_is_cancelled(scheduler):
+    started = threading.Event()
+    proceed = threading.Event()
+    stages = []
+
+    def job(name):
+        stages.append(name)
+        if name == 'first':
+            started.set()
+            proceed.wait(2)
+            raise_if_cancelled()
+            stages.append('first-late')
+        return name
+
+    finished = []
+    scheduler.submit(job, 'first', key='watch', on_finished=finished.append)
+    assert started.wait(2)
+    scheduler.submit(job, 'second', key='watch', on_finished=finished.append)
+    proceed.set()
+    assert wait_until(lambda: finished == ['second'])
+    assert stages == ['first', 'second']
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import threading
+
+from PIL import Image, ImageDraw
+
+from src.services.ocr_service import OCRService
+from src.utils.config import Config
+from src.utils.result_cache import ResultCache
+from src.utils.tracing import tracer
+
+def text_image(text):
+    image = Image.new('RGB', (200, 60), 'white')
+    ImageDraw.Draw(image).text((5, 5), text, fill='black')
+    return image
+
+def make_service(monkeypatch, requests):
+    monkeypatch.setenv('OPENAI_API_KEY', 'x')
+    monkeypatch.setenv('BATCH_SIZE', '4')
+    monkeypatch.setenv('OCR_ENGINE', 'remote')
+
+    def complete(request):
+        requests.append(request)
+        count = len(request['messages'][0]['content']) - 1
+        return json.dumps({'results': [f'text {index}' for index in range(count)]})
+
+    async def acomplete(request):
+        return complete(request)
+
+    service = OCRService(Config(), cache=ResultCache(), client=object(), async_client=object())
+    monkeypatch.setattr(service, '_complete', complete)
+    monkeypatch.setattr(service, '_acomplete', acomplete)
+    return service
+
+def test_sync_and_async_batches_share_routing_and_span(monkeypatch):
+    monkeypatch.setattr(tracer, 'enabled', True)
+    monkeypatch.setattr(tracer, 'stats', {})
+    requests = []
+    service = make_service(monkeypatch, requests)
+    images = [text_image(f'line {index}') for index in range(3)]
+    cache_key, _ = service._lookup('ocr', images[1], service._prompt('ja'), 'ja')
+    service.cache.set(cache_key, 'cached')
+
+    assert service.perform_ocr_batch(images) == ['text 0', 'cached', 'text 1']
+    assert asyncio.run(service.aperform_ocr_batch(images)) == ['text 0', 'cached', 'text 1']
+    # 1回目の結果がキャッシュに入るため、2回目はリクエストを送らない
+    assert len(requests) == 1
+    assert tracer.stats['service.ocr_batch'].count == 2
+    assert 'service.ocr' not in tracer.stats
+
+def test_cache_is_checked_before_the_local_engine(monkeypatch):
+    requests = []
+    service = make_service(monkeypatch, requests)
+    local_calls = []
+
+    def try_local(image, lang):
+        local_calls.append(image)
+        return None
+
+    monkeypatch.setattr(service, '_try_local', try_local)
+    image = text_image('cached line')
+    cache_key, _ = service._remote_lookup(image, 'ja')
+    service.cache.set(cache_key, 'cached')
+
+    assert service.perform_ocr(image) == 'cached'
+    assert asyncio.run(service.aperform_ocr(image)) == 'cached'
+    assert service.perform_ocr_batch([image]) == ['cached']
+    assert local_calls == []
+    assert requests == []
+
+def test_async_paths_read_and_write_the_cache_off_the_event_loop(monkeypatch):
+    requests = []
+    service = make_service(monkeypatch, requests)
+    threads = []
+    for name in ('_lookup', '_store', '_store_batch'):
+        original = getattr(service, name)
+
+        def recording(*args, original=original):
+            threads.append(threading.get_ident())
+            return original(*args)
+
+        monkeypatch.setattr(service, name, recording)
+
+    async def run():
+        loop_thread = threading.get_ident()
+        await service.aperform_ocr_batch([text_image('a'), text_image('b')])
+        await service._aocr_image(text_image('c'), service._prompt('ja'), 'ja')
+        return loop_thread
+
+    loop_thread = asyncio.run(run())
+    assert threads and loop_thread not in threads
@@ -0,0 +1,61 @@
+
+import pytest
+from PIL import Image, ImageDraw
+
+from benchmarks.mock_server import MockSettings
+from src.services.factory import ServiceContainer
+from src.utils.config import Config
+from tests.conftest import prompt_of, run_async
+
+def text_image():
+    image = Image.new('RGB', (400, 120), 'white')
+    ImageDraw.Draw(image).text((10, 10), "Invoice total 12,345", fill='black')
+    return image
+
+def is_combined(body):
+    return '"ocr"' in prompt_of(body)
+
+def make_services(monkeypatch):
+    # タイル分割やローカルOCRを使わず、1回のリクエストでまとめて取得する経路を通す
+    monkeypatch.setenv('OCR_ENGINE', 'remote')
+    monkeypatch.setenv('OCR_TILING', 'off')
+    return ServiceContainer(Config())
+
+def test_combined_response_is_used_and_cached(mock_api, monkeypatch):
+    services = make_services(monkeypatch)
+    try:
+        results = services.pipeline.analyze_all(text_image())
+        assert results == {'ocr': 'mock mock mock mock', 'summary': 'mock mock mock mock', 'translation': 'mock mock mock mock'}
+        assert len(mock_api.bodies) == 1
+        assert mock_api.bodies[0]['response_format'] == {'type': 'json_object'}
+
+        assert run_async(services, services.pipeline.aanalyze_all(text_image())) == results
+        assert len(mock_api.bodies) == 1
+    finally:
+        services.close()
+
+@pytest.mark.parametrize('content', ['{"ocr": "only ocr"}', 'not json', '{"ocr": 1, "summary": "", "translation": ""}'])
+def test_unusable_combined_response_falls_back_to_separate_requests(mock_api, monkeypatch, content):
+    settings = MockSettings(response_tokens=4)
+    default_reply = mock_api.reply
+    mock_api.reply = lambda body, _: content if is_combined(body) else default_reply(body, settings)
+    services = make_services(monkeypatch)
+    try:
+        expected = {
+            'ocr': 'mock mock mock mock',
+            'summary': 'mock mock mock mock',
+            'translation': 'mock:mock mock mock mock'
+        }
+        assert services.pipeline.analyze_all(text_image()) == expected
+        combined = [body for body in mock_api.bodies if is_combined(body)]
+        separate = [prompt_of(body) for body in mock_api.bodies if not is_combined(body)]
+        assert len(combined) == 1
+        # OCR・要約・翻訳（翻訳メモリ経由の断片翻訳）を個別に呼び出す
+        assert len(separate) == 3
+        assert any('"segments"' in prompt for prompt in separate)
+
+        # 使えなかった応答はキャッシュしないため、次回もまとめたリクエストから試す
+        assert run_async(services, services.pipeline.aanalyze_all(text_image())) == expected
+        assert len([body for body in mock_api.bodies if is_combined(body)]) == 2
+    finally:
+        services.close()
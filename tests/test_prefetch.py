@@ -0,0 +1,85 @@
+from src.gui.prefetch import ResultPrefetcher
+from src.utils.text_chunking import estimate_tokens
+
+class FakeScheduler:
+    def __init__(self):
+        self.jobs = {}
+        self.started = set()
+        self.cancelled = set()
+
+    def submit(self, func, *args, priority, key, stream, on_finished, on_failed):
+        job_id = len(self.jobs) + 1
+        self.jobs[job_id] = (func, args, on_finished, on_failed, stream)
+        return job_id
+
+    def start(self, job_id):
+        self.started.add(job_id)
+
+    def finish(self, job_id, result):
+        self.jobs[job_id][2](result)
+
+    def cancel(self, job_id):
+        self.cancelled.add(job_id)
+
+    def is_started(self, job_id):
+        return job_id in self.started
+
+def make_prefetcher(budget=100000):
+    scheduler = FakeScheduler()
+    prefetcher = ResultPrefetcher(scheduler, ['summary', 'translation'], max_tokens=4000, token_budget=budget)
+    tasks = {'summary': lambda text: 'summary', 'translation': lambda text: 'translation'}
+    return scheduler, prefetcher, tasks
+
+def test_finished_prefetch_is_taken_and_running_one_is_awaited():
+    scheduler, prefetcher, tasks = make_prefetcher()
+    prefetched = []
+    assert prefetcher.start('some text', tasks, lambda *args: prefetched.append(args)) == ['summary', 'translation']
+    # 先読みはキャンセルで実行中のリクエストも打ち切れるようストリーミングで送る
+    assert all(job[4] for job in scheduler.jobs.values())
+    scheduler.start(1)
+    scheduler.finish(1, 'summary result')
+    assert prefetched == [('summary', 'some text', 'summary result')]
+
+    results = []
+    assert prefetcher.take('summary', 'some text', results.append, None, None)
+    scheduler.start(2)
+    assert prefetcher.take('translation', 'some text', results.append, None, None)
+    scheduler.finish(2, 'translation result')
+    assert results == ['summary result', 'translation result']
+    assert not prefetcher.take('summary', 'other text', results.append, None, None)
+
+def test_cancel_resolves_pending_waiters_with_a_miss():
+    scheduler, prefetcher, tasks = make_prefetcher()
+    prefetcher.start('some text', tasks, lambda *args: None)
+    scheduler.start(1)
+    results, misses = [], []
+    assert prefetcher.take('summary', 'some text', results.append, None, lambda: misses.append('summary'))
+
+    # 新しいキャプチャで先読みが取り消されても、待っていた操作は通常のリクエストで続けられる
+    prefetcher.cancel()
+    assert misses == ['summary']
+    assert scheduler.cancelled == {1, 2}
+    assert results == []
+
+def test_budget_counts_only_prefetches_that_started():
+    text = 'word ' * 40
+    tokens = estimate_tokens(text)
+    # 1件分だけ収まる予算
+    scheduler, prefetcher, tasks = make_prefetcher(budget=tokens + 1)
+    assert prefetcher.start(text, tasks, lambda *args: None) == ['summary']
+    assert prefetcher.spent_tokens == tokens
+
+    # 実行前に取り消したものは使用量から戻す
+    prefetcher.cancel()
+    assert prefetcher.spent_tokens == 0
+    assert prefetcher.start(text, tasks, lambda *args: None) == ['summary']
+    scheduler.start(2)
+    prefetcher.cancel()
+    assert prefetcher.spent_tokens == tokens
+    assert prefetcher.start(text, tasks, lambda *args: None) == []
+
+def test_waiting_on_queued_prefetch_falls_back_to_normal_request():
+    scheduler, prefetcher, tasks = make_prefetcher()
+    prefetcher.start('some text', tasks, lambda *args: None)
+    assert not prefetcher.take('summary', 'some text', None, None, None)
+    assert 1 in scheduler.cancelled
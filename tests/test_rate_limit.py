@@ -0,0 +1,156 @@
+import asyncio
+import email.utils
+import threading
+import time
+
+import httpx
+import openai
+import pytest
+
+from src.services import rate_limit
+from src.services.rate_limit import (
+    ModelLimiter, RequestDeadlineExceeded, RequestGovernor, TokenBucket, parse_duration, parse_retry_after
+)
+
+def status_error(status, headers=None):
+    request = httpx.Request('POST', 'http://localhost/v1/chat/completions')
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    error_class = openai.RateLimitError if status == 429 else openai.InternalServerError
+    return error_class('error', response=response, body=None)
+
+def test_retry_after_and_reset_headers_are_parsed():
+    assert parse_retry_after({'retry-after-ms': '1500'}) == 1.5
+    assert parse_retry_after({'retry-after': '2'}) == 2.0
+    date = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 25 < parse_retry_after({'retry-after': date}) <= 30
+    assert parse_retry_after({'retry-after': 'soon'}) is None
+    assert parse_retry_after(None) is None
+
+    assert parse_duration('120ms') == pytest.approx(0.12)
+    assert parse_duration('6m0s') == 360
+    assert parse_duration('1.5') == 1.5
+    assert parse_duration('') is None
+    assert parse_duration('later') is None
+
+def test_token_bucket_refills_and_follows_server_headers():
+    bucket = TokenBucket(60)
+    now = bucket.updated
+    bucket.consume(60)
+    # 毎秒1つずつ補充される
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now + 1) == 0.0
+    bucket.sync(120, 0, now + 1)
+    assert bucket.capacity == 120 and bucket.tokens == 0
+    assert bucket.wait_time(2, now + 1) == pytest.approx(1.0)
+
+def test_limiter_halves_on_rate_limit_and_recovers_on_success(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(rate_limit.time, 'monotonic', lambda: clock[0])
+    limiter = ModelLimiter(initial_concurrency=8, max_concurrency=16)
+
+    limiter.acquire(1, deadline=clock[0] + 10)
+    limiter.release({'retry-after': '2'}, rate_limited=True)
+    assert limiter.limit == 4
+    assert limiter.blocked_until == clock[0] + 2
+    # 同時に返ってきた429では続けて半減しない
+    limiter.active += 1
+    limiter.release({}, rate_limited=True)
+    assert limiter.limit == 4
+
+    clock[0] += 5
+    for _ in range(4):
+        limiter.active += 1
+        limiter.release({})
+    assert limiter.limit == pytest.approx(5, abs=0.1)
+
+def test_exhausted_remaining_blocks_until_reset(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(rate_limit.time, 'monotonic', lambda: clock[0])
+    limiter = ModelLimiter()
+    limiter.active = 1
+    limiter.release({
+        'x-ratelimit-limit-requests': '100',
+        'x-ratelimit-remaining-requests': '0',
+        'x-ratelimit-reset-requests': '1.5s'
+    })
+    assert limiter.requests.capacity == 100
+    assert limiter.blocked_until == 101.5
+    with pytest.raises(RequestDeadlineExceeded):
+        limiter.acquire(1, deadline=clock[0] + 1)
+
+def test_async_waiter_is_woken_by_release():
+    limiter = ModelLimiter(initial_concurrency=1)
+
+    async def run():
+        deadline = time.monotonic() + 5
+        await limiter.aacquire(1, deadline)
+        waiting = asyncio.ensure_future(limiter.aacquire(1, deadline))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        started = time.monotonic()
+        threading.Thread(target=limiter.release, args=({},)).start()
+        await waiting
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) < 0.5
+    assert limiter.active == 1
+    assert limiter._waiters == []
+
+def test_concurrency_wait_gives_up_at_the_deadline():
+    limiter = ModelLimiter(initial_concurrency=1)
+    limiter.acquire(1, time.monotonic() + 5)
+    started = time.monotonic()
+    with pytest.raises(RequestDeadlineExceeded):
+        asyncio.run(limiter.aacquire(1, time.monotonic() + 0.1))
+    with pytest.raises(RequestDeadlineExceeded):
+        limiter.acquire(1, time.monotonic() + 0.1)
+    assert time.monotonic() - started < 1
+
+def test_governor_retries_transient_errors_and_reports_once(capsys):
+    governor = RequestGovernor(max_retries=3, base_delay=0.001, max_delay=0.001)
+    calls = []
+
+    def send(attempt):
+        calls.append(attempt)
+        if len(calls) < 3:
+            raise status_error(503)
+        return 'ok'
+
+    assert governor.run('model', 10, send) == 'ok'
+    assert len(calls) == 3 and governor.retries == 2
+    assert capsys.readouterr().out.count('retried') == 1
+
+    async def asend(attempt):
+        return send(attempt)
+
+    calls.clear()
+    assert asyncio.run(governor.arun('model', 10, asend)) == 'ok'
+    assert len(calls) == 3
+
+def test_governor_does_not_retry_after_streaming_started():
+    governor = RequestGovernor(max_retries=3, base_delay=0.001, max_delay=0.001)
+    calls = []
+
+    def send(attempt):
+        calls.append(attempt)
+        attempt.streamed = True
+        raise status_error(503)
+
+    with pytest.raises(openai.InternalServerError):
+        governor.run('model', 10, send)
+    assert len(calls) == 1
+    assert governor.limiter('model').active == 0
+
+def test_governor_stops_retrying_past_the_deadline():
+    governor = RequestGovernor(max_retries=5, base_delay=0.001, max_delay=0.001, deadline=1.0)
+    calls = []
+
+    def send(attempt):
+        calls.append(attempt)
+        raise status_error(429, {'retry-after': '5'})
+
+    with pytest.raises(openai.RateLimitError):
+        governor.run('model', 10, send)
+    # サーバーが指定した待ち時間が期限を超えるため再試行しない
+    assert len(calls) == 1
+    assert governor.rate_limited == 1
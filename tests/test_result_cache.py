@@ -0,0 +1,37 @@
+import json
+import os
+
+from src.utils import result_cache
+from src.utils.result_cache import ResultCache
+
+def entry_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+
+def test_disk_is_scanned_once_and_evicted_only_over_the_limit(tmp_path, monkeypatch):
+    cache = ResultCache(directory=str(tmp_path), max_entries=1)
+    scans = []
+    original = os.scandir
+    monkeypatch.setattr(result_cache.os, 'scandir', lambda path: scans.append(path) or original(path))
+
+    cache.set('key0', 'x' * 40)
+    # 3件までは収まる上限にする
+    cache.max_disk_bytes = os.path.getsize(tmp_path / 'key0.json') * 3 + 10
+    for index in range(1, 3):
+        cache.set(f'key{index}', 'x' * 40)
+    assert len(scans) == 1
+    assert entry_files(tmp_path) == ['key0.json', 'key1.json', 'key2.json']
+
+    # 参照したものは新しい扱いになり、上限を超えた時に古いものから消える
+    assert cache.get('key0') == 'x' * 40
+    cache.set('key3', 'x' * 40)
+    assert entry_files(tmp_path) == ['key0.json', 'key2.json', 'key3.json']
+    assert len(scans) == 1
+
+def test_entry_without_value_is_removed(tmp_path):
+    cache = ResultCache(directory=str(tmp_path))
+    (tmp_path / 'broken.json').write_text(json.dumps({'created': 0}), encoding='utf-8')
+    (tmp_path / 'garbage.json').write_text('{', encoding='utf-8')
+
+    assert cache.get('broken') is None
+    assert cache.get('garbage') is None
+    assert entry_files(tmp_path) == []
@@ -0,0 +1,49 @@
+import numpy as np
+from PIL import Image, ImageDraw
+
+from src.services.capture_backends import CapturedFrame
+from src.utils.scroll_stitch import ScrollStitcher
+
+WIDTH = 320
+VIEW = 400
+
+def make_document(height=1700):
+    image = Image.new('RGB', (WIDTH, height), 'white')
+    draw = ImageDraw.Draw(image)
+    for line, y in enumerate(range(6, height - 16, 18)):
+        draw.text((8, y), f"line {line}: {line * 7919 % 10007}", fill='black')
+    return np.asarray(image)
+
+def frame_at(document, top):
+    rows = document[top:top + VIEW]
+    bgra = np.concatenate([rows[:, :, ::-1], np.full((VIEW, WIDTH, 1), 255, np.uint8)], axis=2)
+    return CapturedFrame(bgra.tobytes(), WIDTH, VIEW, 'BGRA')
+
+def stitch(document, positions):
+    stitcher = ScrollStitcher()
+    heights = []
+    for top in positions:
+        stitcher.add(frame_at(document, top))
+        heights.append(stitcher.height)
+    return stitcher, heights
+
+def test_stitches_scrolled_frames_without_overlap():
+    document = make_document()
+    stitcher, _ = stitch(document, [0, 150, 300, 520, 760, 1000, 1300])
+    assert stitcher.gaps == 0
+    assert np.array_equal(np.asarray(stitcher.to_image()), document)
+
+def test_scrolling_back_more_than_a_view_does_not_duplicate():
+    # 1画面以上上に戻ってから再び下へ進んだ場合、戻った間のフレームは捨て、最下部より先の分だけをつなげる
+    document = make_document()
+    stitcher, heights = stitch(document, [0, 300, 600, 900, 1200, 0, 300, 1300])
+    assert heights == [400, 700, 1000, 1300, 1600, 1600, 1600, 1700]
+    assert stitcher.gaps == 0
+    assert np.array_equal(np.asarray(stitcher.to_image()), document)
+
+def test_frame_without_any_overlap_is_appended_as_a_gap():
+    # スクロールが速すぎてどこにも重ならないフレームは、本文をそのまま続けて数える
+    document = make_document()
+    stitcher, heights = stitch(document, [0, 300, 1100])
+    assert heights == [400, 700, 1100]
+    assert stitcher.gaps == 1
@@ -0,0 +1,69 @@
+import hashlib
+
+from src.services.factory import ServiceContainer
+from src.utils.config import Config
+from src.utils.text_chunking import chunk_text
+from tests.conftest import prompt_of, run_async
+
+CHUNK_PROMPT = "以下は長いテキストの一部です"
+REDUCE_PROMPT = "以下は長いテキストを分割して順に要約したものです"
+
+def paragraphs(count, start=0):
+    return '\n\n'.join(
+        f"Paragraph {index}: " + ' '.join(f"word{index}x{word}" for word in range(30))
+        for index in range(start, start + count)
+    )
+
+def summary_reply(body, settings):
+    # 要約ごとに異なる応答にする（同じ内容の集約リクエストがまとめられないように）
+    digest = hashlib.sha1(prompt_of(body).encode('utf-8')).hexdigest()[:8]
+    return f"summary-{digest} " + ' '.join(['detail'] * 18)
+
+def test_long_text_is_summarized_per_chunk_then_reduced(mock_api, monkeypatch):
+    monkeypatch.setenv('SUMMARY_CHUNK_TOKENS', '100')
+    monkeypatch.setenv('SUMMARY_CHUNK_SUMMARY_TOKENS', '60')
+    mock_api.reply = summary_reply
+    services = ServiceContainer(Config())
+    try:
+        text = paragraphs(8)
+        chunks = chunk_text(text, 100)
+        assert len(chunks) == 8
+
+        result = services.summary.summarize_text(text)
+        prompts = [prompt_of(body) for body in mock_api.bodies]
+        chunk_prompts = [prompt for prompt in prompts if prompt.startswith(CHUNK_PROMPT)]
+        reduce_bodies = [body for body in mock_api.bodies if prompt_of(body).startswith(REDUCE_PROMPT)]
+        # チャンクごとに1回ずつ要約する
+        assert sorted(prompt.split('\n\n', 1)[1] for prompt in chunk_prompts) == sorted(chunks)
+        # 要約の合計が上限を超えるため、中間の集約を経てから最後に1つにまとめる
+        intermediate = [body for body in reduce_bodies if body['max_tokens'] == 60]
+        final = [body for body in reduce_bodies if body['max_tokens'] == 1000]
+        assert len(intermediate) >= 2 and len(final) == 1
+        # チャンクと中間の要約は、それぞれ後の集約のどれか1つにだけ含まれる
+        summaries = [summary_reply(body, None) for body in mock_api.bodies if body not in final]
+        for summary in summaries:
+            assert sum(summary in prompt_of(body) for body in reduce_bodies) == 1
+        assert all(prompt_of(body).count('\n---\n') >= 1 for body in reduce_bodies)
+        assert result == summary_reply(final[0], None)
+        assert mock_api.bodies[-1] is final[0]
+
+        # 同じテキストはキャッシュから返し、末尾に追加した場合は新しいチャンクだけを要約する
+        count = len(mock_api.bodies)
+        assert run_async(services, services.summary.asummarize_text(text)) == result
+        assert len(mock_api.bodies) == count
+        services.summary.summarize_text(text + '\n\n' + paragraphs(1, start=8))
+        added = [prompt_of(body) for body in mock_api.bodies[count:]]
+        assert [prompt for prompt in added if prompt.startswith(CHUNK_PROMPT)] == [
+            f"{CHUNK_PROMPT}。重要な情報を漏らさないよう要約してください:\n\n{paragraphs(1, start=8)}"
+        ]
+    finally:
+        services.close()
+
+def test_short_text_is_summarized_in_one_request(mock_api):
+    services = ServiceContainer(Config())
+    try:
+        assert services.summary.summarize_text("Short text.") == 'mock mock mock mock'
+        assert len(mock_api.bodies) == 1
+        assert prompt_of(mock_api.bodies[0]).endswith("Short text.")
+    finally:
+        services.close()
@@ -0,0 +1,35 @@
+from src.utils.tiling import merge_tile_texts, plan_tiles
+
+def test_overlap_not_smaller_than_tile_still_advances():
+    tiles = plan_tiles(3000, 500, tile_size=1024, overlap=2048)
+    lefts = [box[0] for _, _, box in tiles]
+    assert lefts[0] == 0 and lefts[-1] == 3000 - 1024
+    assert lefts == sorted(set(lefts))
+
+def test_columns_are_joined_in_reading_order():
+    # 横に並んだタイルは行ごとに左右をつなぎ、重なりに写った文字は1回にする
+    texts = {
+        (0, 0): "The quick brown\nJumps over the",
+        (0, 1): "brown fox\nthe lazy dog",
+    }
+    assert merge_tile_texts(texts) == "The quick brown fox\nJumps over the lazy dog"
+
+def test_overlap_with_left_and_upper_tiles_is_removed():
+    texts = {
+        (0, 0): "first line\nsecond\nshared row",
+        (0, 1): "overlap only",
+        (1, 0): "shared row\nthird line",
+    }
+    merged = merge_tile_texts(texts).splitlines()
+    assert merged.count("shared row") == 1
+    assert merged[:3] == ["first line", "second", "shared row"]
+    assert merged[-1] == "third line"
+
+def test_short_line_contained_in_a_left_line_is_kept():
+    # 行数が異なる場合も、左の行に含まれるだけの短い行は重なりとみなさない
+    texts = {
+        (0, 0): "Press OK to continue\n1 item selected",
+        (0, 1): "OK\n1\n-\n1 item selected",
+    }
+    merged = merge_tile_texts(texts).splitlines()
+    assert merged == ["Press OK to continue", "1 item selected", "OK", "1", "-"]
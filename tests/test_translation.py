@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+from src.services.translation_service import TranslationService
+from src.utils.config import Config
+from src.utils.language import detect_language
+from src.utils.translation_memory import TranslationMemory, split_segments
+
+def make_service(monkeypatch, tmp_path, requests):
+    monkeypatch.setenv('OPENAI_API_KEY', 'x')
+    memory = TranslationMemory(str(tmp_path / 'memory.sqlite3'))
+
+    def complete(request):
+        requests.append(request)
+        if 'response_format' in request:
+            segments = json.loads(request['messages'][0]['content'].split('\n\n', 1)[1])['segments']
+            return json.dumps({'translations': [f'<{segment}>' for segment in segments]})
+        for delta in ('stream', 'ed'):
+            request['on_delta'](delta)
+        return 'streamed'
+
+    async def acomplete(request):
+        return complete(request)
+
+    service = TranslationService(Config(), client=object(), async_client=object(), memory=memory)
+    monkeypatch.setattr(service, '_complete', complete)
+    monkeypatch.setattr(service, '_acomplete', acomplete)
+    return service
+
+def test_segments_round_trip_and_skip_numbers():
+    text = "Hello world. How are you?\n  123  \nSave"
+    parts = split_segments(text)
+    assert ''.join(part for part, _ in parts) == text
+    assert [part for part, translatable in parts if translatable] == ['Hello world.', 'How are you?', 'Save']
+
+def test_memory_matches_normalized_segments_and_counts_hits(tmp_path):
+    memory = TranslationMemory(str(tmp_path / 'memory.sqlite3'))
+    try:
+        memory.store({'Ｓａｖｅ  file': '保存', 'Empty': ' '}, 'en', 'ja', 'model')
+        # 全角・半角や空白の違いは同じ断片とみなし、空の訳は保存しない
+        assert memory.lookup(['Save file', 'Empty'], 'en', 'ja', 'model') == {'Save file': '保存'}
+        assert memory.lookup(['Save file'], 'en', 'ja', 'other') == {}
+        assert memory.stats() == {'segments': 1, 'hits': 1, 'misses': 2}
+        memory.clear()
+        assert memory.stats()['segments'] == 0
+    finally:
+        memory.close()
+
+def test_text_without_memory_hits_is_streamed(monkeypatch, tmp_path):
+    requests = []
+    service = make_service(monkeypatch, tmp_path, requests)
+    deltas = []
+    assert service.translate_text('Hello world. Save', 'ja', on_delta=deltas.append) == 'streamed'
+    assert asyncio.run(service.atranslate_text('Hello world. Save', 'ja', on_delta=deltas.append)) == 'streamed'
+    assert deltas == ['stream', 'ed', 'stream', 'ed']
+    assert all('response_format' not in request for request in requests)
+
+def test_misses_are_translated_as_segments_once_memory_has_hits(monkeypatch, tmp_path):
+    requests = []
+    service = make_service(monkeypatch, tmp_path, requests)
+    # ストリーミングしない呼び出しは断片ごとに翻訳して翻訳メモリに保存する
+    assert service.translate_text('Hello world. Save', 'ja') == '<Hello world.> <Save>'
+
+    deltas = []
+    assert service.translate_text('Hello world. Open', 'ja', on_delta=deltas.append) == '<Hello world.> <Open>'
+    assert deltas == []
+    assert json.loads(requests[-1]['messages'][0]['content'].split('\n\n', 1)[1]) == {'segments': ['Open']}
+    # すべて翻訳メモリにあればリクエストを送らない
+    count = len(requests)
+    assert service.translate_text('Open', 'ja', on_delta=deltas.append) == '<Open>'
+    assert len(requests) == count
+
+def test_detector_recognizes_scripts_and_latin_languages():
+    assert detect_language('設定を保存しました') == 'ja'
+    assert detect_language('保存 Save') == 'ja'
+    assert detect_language('这是我们的设置') == 'zh'
+    assert detect_language('설정을 저장했습니다') == 'ko'
+    assert detect_language('Привет, как дела?') == 'ru'
+    assert detect_language('Le chat est dans la maison') == 'fr'
+    assert detect_language('Der Hund ist nicht hier') == 'de'
+    assert detect_language('El perro está en la casa con los niños') == 'es'
+    assert detect_language('12345') == 'en'
+
+def test_single_letter_words_do_not_switch_english_to_other_languages():
+    # キー名や選択肢の「Y」「E」だけではスペイン語・イタリア語にしない
+    assert detect_language('Press Y to confirm') == 'en'
+    assert detect_language('Option E selected') == 'en'